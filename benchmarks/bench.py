@@ -0,0 +1,517 @@
+#!/usr/bin/env python3
+"""Benchmarks collection, waits, watches, deploy plans, image prefetching and golden bundles against a fake cluster.
+
+    python benchmarks/bench.py                              # compare with benchmarks/baseline.json
+    python benchmarks/bench.py --update-baseline            # store the results as the new baseline
+    python benchmarks/bench.py --scenario log-collection --namespaces 50 --latency 0.01 --failure-rate 0.01
+
+Nothing here needs a cluster. fakecluster.py serves a synthetic cluster of the given shape from
+a separate process, with a delay on every request and optionally failing some of them, and
+fake_kubectl.py is put first on PATH as `kubectl`.
+
+Each scenario reports, as the median of `--repeat` runs,
+
+    wall_s         wall time
+    spawns         processes started by this process, e.g. the shells of `sh`; the scenarios start
+                   the shell workers they need beforehand, so that this does not depend on earlier runs
+    kubectl_calls  kubectl invocations, including the ones from within shells
+    api_calls      requests to the API server
+    peak_mib       peak Python memory allocated by this process (tracemalloc)
+
+and fails (exit status 1) if a scenario did not produce what the fake cluster says it should, e.g.
+collected fewer objects or logs, or if a metric regressed. The counts are the same in every run and
+fail more than `--threshold` above the baseline; wall time and memory vary from run to run and with
+the load of the machine, and only fail more than the much larger `--noise-threshold` above it.
+Record the baseline on the machine you compare on.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import json
+import os
+import pathlib
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import TYPE_CHECKING
+
+BENCHMARKS_DIR = pathlib.Path(__file__).resolve().parent
+# rhoai_in_kind lives in ../src and logs.py in ../components, see components/deploy.py
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "src"))
+sys.path.insert(0, str(BENCHMARKS_DIR.parent / "components"))
+
+import logs
+from fakecluster import ClusterShape, Faults
+from rhoai_in_kind import TestFrame, sh, shell
+from rhoai_in_kind.aio import AsyncTestFrame, async_create_resource
+from rhoai_in_kind.discovery import DiscoveryCache
+from rhoai_in_kind.golden import SKIPPED_RESOURCES, export_bundle
+from rhoai_in_kind.images import FakeLoader, ImagePrefetcher
+from rhoai_in_kind.kube import ApiError, KubeClient, dump_yaml
+from rhoai_in_kind.readiness import ReadinessEngine, deployment_available
+from rhoai_in_kind.steps import Plan
+
+if TYPE_CHECKING:
+    from typing import Callable
+
+DEFAULT_BASELINE = BENCHMARKS_DIR / "baseline.json"
+
+# metric -> slack added to the threshold, so that tiny baselines do not fail on noise
+METRICS = {
+    "wall_s": 0.25,
+    "spawns": 2,
+    "kubectl_calls": 2,
+    "api_calls": 5,
+    "peak_mib": 1.0,
+}
+# compared with --noise-threshold rather than --threshold
+NOISY_METRICS = {"wall_s", "peak_mib"}
+
+
+@dataclasses.dataclass
+class Bench:
+    state_dir: pathlib.Path
+    shape: ClusterShape
+    jobs: int
+    ready_spread: float
+    plan_steps: int
+    plan_width: int
+    # with failures injected, scenarios may collect less than there is
+    failures: bool = False
+    # a fresh directory for each run of a scenario
+    work_dir: pathlib.Path | None = None
+
+    def client(self) -> KubeClient:
+        return KubeClient.from_kubeconfig(max_idle_connections=self.jobs)
+
+    def schedule_ready(self, client: KubeClient, namespace: str):
+        """Makes the namespace's Deployments become Available at random times within `ready_spread`."""
+        client.request("POST", "/_bench/ready", body={"namespace": namespace, "spread": self.ready_spread})
+
+    def stats(self, client: KubeClient) -> dict[str, int]:
+        return client.request("GET", "/_bench/stats", query={"reset": "1"})
+
+    def inventory(self, client: KubeClient) -> list[dict]:
+        """The objects of each type in each namespace, see fakecluster.py."""
+        return client.request("GET", "/_bench/inventory")["items"]
+
+    def expect(self, what: str, actual: int, expected: int):
+        """Fails the run if it produced other than `expected`; with failures injected, less is fine."""
+        if actual > expected or (actual < expected and not self.failures):
+            raise AssertionError(f"{what}: {actual}, expected {expected}")
+
+    def kubectl_log(self) -> list[str]:
+        """The kubectl invocations of this run."""
+        return (self.state_dir / "kubectl.log").read_text().splitlines()
+
+
+SCENARIOS: dict[str, Callable[[Bench], Callable[[], None]]] = {}
+
+
+def scenario(name: str):
+    """Registers a scenario: a function that prepares a run and returns what is measured."""
+    def decorator(fn):
+        SCENARIOS[name] = fn
+        return fn
+
+    return decorator
+
+
+@scenario("resource-collection")
+def resource_collection(bench: Bench) -> Callable[[], None]:
+    inventory = bench.inventory(bench.client())
+    namespaces = sum(row["objects"] for row in inventory if row["resource"] == "namespaces")
+
+    def run():
+        output_dir = bench.work_dir / "resources"
+        snapshot = logs.collect_kubernetes_resources(str(output_dir), client=bench.client(), jobs=bench.jobs,
+                                                     discovery=DiscoveryCache(bench.work_dir / "discovery"))
+        bench.expect("collected objects", sum(map(len, snapshot.types.values())),
+                     sum(row["objects"] for row in inventory))
+        # a list for each type in each namespace, and the definition of each namespace
+        bench.expect("written files", sum(1 for _ in output_dir.rglob("*.yaml")), len(inventory) + namespaces)
+
+    return run
+
+
+@scenario("log-collection")
+def log_collection(bench: Bench) -> Callable[[], None]:
+    pods = sum(row["objects"] for row in bench.inventory(bench.client()) if row["resource"] == "pods")
+
+    def run():
+        logs.collect_kubernetes_logs(str(bench.work_dir / "logs"), client=bench.client(), jobs=bench.jobs)
+        # the first container of each pod restarted once, so it has a previous log too
+        bench.expect("collected logs", sum(1 for _ in (bench.work_dir / "logs").rglob("*.log")),
+                     pods * (bench.shape.containers + 1))
+
+    return run
+
+
+@scenario("deferred-waits")
+def deferred_waits(bench: Bench) -> Callable[[], None]:
+    """One deferred readiness wait for each Deployment in a namespace, like the waits deploy.py defers."""
+    bench.schedule_ready(bench.client(), "bench-0")
+
+    def run():
+        with ReadinessEngine(bench.client()) as readiness:
+            with TestFrame(concurrent=True) as frame:
+                for i in range(bench.shape.objects):
+                    frame.defer(readiness,
+                                lambda r, name=f"deployment-{i}": r.wait(deployment_available("bench-0", name),
+                                                                         timeout=60),
+                                name=f"wait for deployment-{i}")
+
+    return run
+
+
+@scenario("deploy-plan")
+def deploy_plan(bench: Bench) -> Callable[[], None]:
+    """A plan shaped like deploy.py's: chains of steps that each apply manifests and wait for a Deployment."""
+    bench.schedule_ready(bench.client(), "bench-1")
+    # one shell worker for each step that runs at the same time
+    shell.prestart(bench.plan_width)
+    manifest = json.dumps({"apiVersion": "v1", "kind": "ConfigMap", "metadata": {"name": "bench"}})
+
+    def run():
+        with ReadinessEngine(bench.client()) as readiness:
+            plan = Plan()
+            for i in range(bench.plan_steps):
+                needs = [f"step {i - bench.plan_width}"] if i >= bench.plan_width else []
+
+                @plan.step(f"step {i}", needs=needs)
+                def step(name=f"deployment-{i % bench.shape.objects}"):
+                    sh("kubectl apply -f -", input=manifest)
+                    readiness.wait(deployment_available("bench-1", name), timeout=60)
+
+            plan.run(jobs=bench.plan_width)
+        bench.expect("applied manifests", bench.kubectl_log().count("apply -f -"), bench.plan_steps)
+
+    return run
+
+
+@scenario("async-waits")
+def async_waits(bench: Bench) -> Callable[[], None]:
+    """deferred-waits with AsyncTestFrame and ReadinessEngine.async_wait."""
+    bench.schedule_ready(bench.client(), "bench-0")
+
+    async def waits(readiness: ReadinessEngine):
+        async with AsyncTestFrame() as frame:
+            for i in range(bench.shape.objects):
+                frame.defer(readiness,
+                            lambda r, name=f"deployment-{i}": r.async_wait(deployment_available("bench-0", name),
+                                                                           timeout=60),
+                            name=f"wait for deployment-{i}")
+
+    def run():
+        with ReadinessEngine(bench.client()) as readiness:
+            asyncio.run(waits(readiness))
+
+    return run
+
+
+@scenario("async-deploy-plan")
+def async_deploy_plan(bench: Bench) -> Callable[[], None]:
+    """deploy-plan with each chain of steps as a coroutine, using async_create_resource and async_wait."""
+    bench.schedule_ready(bench.client(), "bench-1")
+    shell.prestart(bench.plan_width)
+    manifest = json.dumps({"apiVersion": "v1", "kind": "ConfigMap", "metadata": {"name": "bench"}})
+
+    async def chain(readiness: ReadinessEngine, first: int):
+        for i in range(first, bench.plan_steps, bench.plan_width):
+            await async_create_resource(manifest)
+            await readiness.async_wait(deployment_available("bench-1", f"deployment-{i % bench.shape.objects}"),
+                                       timeout=60)
+
+    async def plan(readiness: ReadinessEngine):
+        await asyncio.gather(*(chain(readiness, first) for first in range(bench.plan_width)))
+
+    def run():
+        with ReadinessEngine(bench.client()) as readiness:
+            asyncio.run(plan(readiness))
+        bench.expect("applied manifests", bench.kubectl_log().count("apply -f -"), bench.plan_steps)
+
+    return run
+
+
+@scenario("golden-bundle")
+def golden_bundle(bench: Bench) -> Callable[[], None]:
+    """Exporting what kubectl applied into a golden bundle and applying that again, phase by phase."""
+    applied = sum(row["applied"] for row in bench.inventory(bench.client())
+                  if (row["group"], row["resource"]) not in SKIPPED_RESOURCES)
+
+    def run():
+        client = bench.client()
+        bundle = export_bundle(client, "bench", jobs=bench.jobs)
+        bench.expect("exported objects", sum(map(len, bundle.phases.values())), applied)
+        with ReadinessEngine(bench.client()) as readiness:
+            bundle.apply(client, readiness, jobs=bench.jobs, timeout=60)
+
+    return run
+
+
+@scenario("image-prefetch")
+def image_prefetch(bench: Bench) -> Callable[[], None]:
+    """Prefetching the images of a manifest for each namespace, sharing most images, with a loader taking 20ms."""
+    manifests = []
+    for n in range(bench.shape.namespaces):
+        deployments = [
+            {"apiVersion": "apps/v1", "kind": "Deployment", "metadata": {"name": f"deployment-{i}"},
+             "spec": {"template": {"spec": {"containers": [
+                 {"name": f"c{c}", "image": f"registry.bench.example/team-{(n + i) % bench.shape.objects}/app-{c}:1"}
+                 for c in range(bench.shape.containers)]}}}}
+            for i in range(bench.shape.objects)]
+        manifests.append(bench.work_dir / f"manifests-{n}.yaml")
+        manifests[-1].write_text("---\n".join(dump_yaml(d) for d in deployments))
+    expected = bench.shape.objects * bench.shape.containers
+
+    def run():
+        loader = FakeLoader(delay=0.02)
+        with ImagePrefetcher(loader, jobs=bench.jobs).start([lambda path=path: path for path in manifests]):
+            pass
+        bench.expect("loaded images", len(loader.loaded), expected)
+
+    return run
+
+
+@scenario("watch-errors")
+def watch_errors(bench: Bench) -> Callable[[], None]:
+    """Watches the API server refuses, of a resource it does not serve and of one that cannot be watched."""
+    refused = {
+        "/apis/bench.example.com/v1/namespaces/bench-0/missings": 404,
+        "/api/v1/namespaces/bench-0/bindings": 405,
+    }
+
+    def run():
+        client = bench.client()
+        for _ in range(bench.shape.objects):
+            for path, status in refused.items():
+                try:
+                    next(client.watch(path, timeout_seconds=5))
+                except ApiError as e:
+                    # failures injected with --failure-rate are 503s
+                    if e.status != status and e.status != 503:
+                        raise AssertionError(f"watch of {path} failed with {e.status}, expected {status}") from e
+                else:
+                    raise AssertionError(f"watch of {path} did not fail")
+
+    return run
+
+
+_spawns = 0
+
+
+def _count_spawns(event: str, args):
+    global _spawns
+    if event == "subprocess.Popen":
+        _spawns += 1
+
+
+@contextlib.contextmanager
+def _quiet(enabled: bool):
+    """Sends this process's and its children's output to /dev/null."""
+    if not enabled:
+        yield
+        return
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), 1)
+        os.dup2(devnull.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            for fd, copy in zip((1, 2), saved):
+                os.dup2(copy, fd)
+                os.close(copy)
+
+
+def measure(bench: Bench, name: str, quiet: bool) -> dict[str, float]:
+    global _spawns
+    bench.work_dir = pathlib.Path(tempfile.mkdtemp(prefix=f"{name}-", dir=bench.state_dir))
+    client = bench.client()
+    # quiet too, so that the shell workers it starts send their output where the run's goes
+    with _quiet(quiet):
+        run = SCENARIOS[name](bench)
+    bench.stats(client)
+    (bench.state_dir / "kubectl.log").write_text("")
+    _spawns = 0
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with _quiet(quiet):
+            run()
+    finally:
+        wall = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        shutil.rmtree(bench.work_dir, ignore_errors=True)
+
+    api = bench.stats(client)
+    return {
+        "wall_s": round(wall, 3),
+        "spawns": _spawns,
+        "kubectl_calls": len(bench.kubectl_log()),
+        "api_calls": api.get("total", 0),
+        "failed_calls": api.get("failed", 0),
+        "peak_mib": round(peak / 2 ** 20, 2),
+    }
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float,
+            noise_threshold: float) -> list[str]:
+    """Returns the regressions, as `<scenario> <metric>: <baseline> -> <result>`."""
+    regressions = []
+    for name, metrics in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for metric, slack in METRICS.items():
+            limit = noise_threshold if metric in NOISY_METRICS else threshold
+            if metric in before and metrics[metric] > before[metric] * (1 + limit) + slack:
+                regressions.append(f"{name} {metric}: {before[metric]} -> {metrics[metric]}")
+    return regressions
+
+
+def print_results(results: dict[str, dict], baseline: dict[str, dict]):
+    print(f"\n{'scenario':22s}" + "".join(f"{m:>22s}" for m in METRICS))
+    for name, metrics in results.items():
+        cells = []
+        for metric in METRICS:
+            value, before = metrics[metric], baseline.get(name, {}).get(metric)
+            if before:
+                cells.append(f"{value:>14g}{(value - before) / before:>+8.0%}")
+            else:
+                cells.append(f"{value:>14g}{'':8s}")
+        print(f"{name:22s}" + "".join(cells))
+    sys.stdout.flush()
+
+
+@contextlib.contextmanager
+def fake_cluster(state_dir: pathlib.Path, shape: ClusterShape, faults: Faults, kubectl_latency: float,
+                 kubectl_failure_rate: float):
+    """Starts fakecluster.py and puts fake_kubectl.py first on PATH, for as long as the context lasts."""
+    command = [sys.executable, str(BENCHMARKS_DIR / "fakecluster.py"), "--state-dir", str(state_dir)]
+    for name, value in {**dataclasses.asdict(shape), **dataclasses.asdict(faults)}.items():
+        command += [f"--{name.replace('_', '-')}", str(value)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    try:
+        if not server.stdout.readline().startswith("serving"):
+            raise RuntimeError("The fake cluster did not start")
+        bin_dir = state_dir / "bin"
+        bin_dir.mkdir()
+        kubectl = bin_dir / "kubectl"
+        kubectl.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{BENCHMARKS_DIR / "fake_kubectl.py"}" "$@"\n')
+        kubectl.chmod(0o755)
+        environ = dict(os.environ)
+        os.environ.update({
+            "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            "BENCH_STATE_DIR": str(state_dir),
+            "BENCH_KUBECTL_LATENCY": str(kubectl_latency),
+            "BENCH_KUBECTL_FAILURE_RATE": str(kubectl_failure_rate),
+        })
+        try:
+            yield
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0],
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run, may be repeated (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each scenario to take the median of")
+    parser.add_argument("--jobs", type=int, default=8, help="Concurrency of the collectors")
+    parser.add_argument("--ready-spread", type=float, default=1.0,
+                        help="Seconds within which the awaited Deployments become Available")
+    parser.add_argument("--plan-steps", type=int, default=24, help="Steps in the deploy plan")
+    parser.add_argument("--plan-width", type=int, default=4, help="Independent chains of steps in the deploy plan")
+    parser.add_argument("--kubectl-latency", type=float, default=0.0, help="Seconds every kubectl invocation takes")
+    parser.add_argument("--kubectl-failure-rate", type=float, default=0.0,
+                        help="Fraction of kubectl invocations that fail")
+    for field in dataclasses.fields(ClusterShape) + dataclasses.fields(Faults):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(field.default), default=field.default)
+    parser.add_argument("--baseline", type=pathlib.Path, default=DEFAULT_BASELINE, help="Baseline to compare with")
+    parser.add_argument("--update-baseline", action="store_true", help="Store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Fraction by which a count may exceed the baseline before it is a regression")
+    parser.add_argument("--noise-threshold", type=float, default=1.0,
+                        help="Fraction by which wall time and memory may exceed the baseline before it is a regression")
+    parser.add_argument("--output", type=pathlib.Path, help="Also write the results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the scenarios")
+    args = parser.parse_args()
+
+    shape = ClusterShape(**{f.name: getattr(args, f.name) for f in dataclasses.fields(ClusterShape)})
+    faults = Faults(**{f.name: getattr(args, f.name) for f in dataclasses.fields(Faults)})
+    if shape.namespaces < 2:
+        parser.error("the deferred waits and the deploy plan need at least 2 namespaces")
+    # what the numbers depend on besides the code; comparing runs of different settings means nothing
+    settings = {"shape": dataclasses.asdict(shape), "faults": dataclasses.asdict(faults), "jobs": args.jobs,
+                "ready_spread": args.ready_spread, "plan_steps": args.plan_steps, "plan_width": args.plan_width,
+                "kubectl_latency": args.kubectl_latency, "kubectl_failure_rate": args.kubectl_failure_rate}
+
+    baseline: dict[str, dict] = {}
+    if args.baseline.exists() and not args.update_baseline:
+        stored = json.loads(args.baseline.read_text())
+        if stored["settings"] != settings:
+            sys.exit(f"{args.baseline} was recorded with other settings; run with the same ones, "
+                     "or with --update-baseline")
+        baseline = stored["scenarios"]
+
+    sys.addaudithook(_count_spawns)
+    results: dict[str, dict] = {}
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="rhoai-in-kind-bench-") as tmp:
+        state_dir = pathlib.Path(tmp)
+        with fake_cluster(state_dir, shape, faults, args.kubectl_latency, args.kubectl_failure_rate):
+            bench = Bench(state_dir, shape, args.jobs, args.ready_spread, args.plan_steps, args.plan_width,
+                          failures=bool(faults.failure_rate or args.kubectl_failure_rate))
+            for name in args.scenario or SCENARIOS:
+                print(f"Running {name}...")
+                sys.stdout.flush()
+                try:
+                    runs = [measure(bench, name, quiet=not args.verbose) for _ in range(args.repeat)]
+                except Exception as e:
+                    print(f"  {name} failed: {e!r}")
+                    failed = True
+                    continue
+                results[name] = {metric: statistics.median(run[metric] for run in runs) for metric in runs[0]}
+
+    print_results(results, baseline)
+    if args.output:
+        args.output.write_text(json.dumps({"settings": settings, "scenarios": results}, indent=2) + "\n")
+    if args.update_baseline:
+        if failed:
+            sys.exit("Not updating the baseline, some scenarios failed")
+        args.baseline.write_text(json.dumps({"settings": settings, "scenarios": results}, indent=2) + "\n")
+        print(f"\nWrote the baseline to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.threshold, args.noise_threshold)
+    if regressions:
+        print(f"\nRegressions of more than {args.threshold:.0%}, or {args.noise_threshold:.0%} for "
+              f"{' and '.join(sorted(NOISY_METRICS))}:")
+        for regression in regressions:
+            print(f"  {regression}")
+    if regressions or failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Stands in for kubectl in the benchmarks; installed as `kubectl` at the front of PATH by bench.py.
+
+Every invocation is appended to `$BENCH_STATE_DIR/kubectl.log`, takes `$BENCH_KUBECTL_LATENCY`
+seconds, and fails like an overloaded API server with probability `$BENCH_KUBECTL_FAILURE_RATE`.
+
+`config view` prints the kubeconfig of the fake API server (fakecluster.py), and `get --raw`
+forwards to it; every other command reads its input and succeeds without doing anything.
+"""
+
+import base64
+import json
+import os
+import pathlib
+import random
+import ssl
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def main():
+    state_dir = pathlib.Path(os.environ["BENCH_STATE_DIR"])
+    with open(state_dir / "kubectl.log", "a") as log:
+        log.write(" ".join(sys.argv[1:]) + "\n")
+    time.sleep(float(os.environ.get("BENCH_KUBECTL_LATENCY") or 0))
+    if random.random() < float(os.environ.get("BENCH_KUBECTL_FAILURE_RATE") or 0):
+        sys.exit("Error from server (ServiceUnavailable): the server is currently unable to handle the request")
+
+    args = sys.argv[1:]
+    kubeconfig = json.loads((state_dir / "kubeconfig.json").read_text())
+    if args[:2] == ["config", "view"]:
+        print(json.dumps(kubeconfig))
+    elif args[:2] == ["get", "--raw"]:
+        cluster = kubeconfig["clusters"][0]["cluster"]
+        context = ssl.create_default_context(cadata=base64.b64decode(cluster["certificate-authority-data"]).decode())
+        try:
+            with urllib.request.urlopen(cluster["server"] + args[2], context=context) as response:
+                for line in response:
+                    sys.stdout.buffer.write(line)
+                    sys.stdout.flush()
+        except urllib.error.HTTPError as e:
+            sys.exit(f"Error from server: {e.read().decode()}")
+    elif args[:1] == ["version"]:
+        print(json.dumps({"clientVersion": {"gitVersion": "v1.33.0-bench"}}))
+    else:
+        if "-" in args:
+            sys.stdin.read()
+        print(f"{' '.join(args[:2])}: ok")
+
+
+if __name__ == "__main__":
+    main()
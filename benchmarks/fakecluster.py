@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""A stand-in API server for the benchmarks, serving a synthetic cluster of a given shape.
+
+    python benchmarks/fakecluster.py --state-dir /tmp/bench --namespaces 10 --latency 0.002
+
+It answers what the collectors and the readiness engine ask for: aggregated discovery (with an
+ETag), paged lists (also metadata-only ones), single objects, container logs and watches. Every
+response is delayed by `--latency`, and `--failure-rate` of them fail with 503 ServiceUnavailable.
+
+The server writes a kubeconfig for itself to `<state-dir>/kubeconfig.json`, which the kubectl
+stand-in (fake_kubectl.py) prints for `kubectl config view`, so `KubeClient.from_kubeconfig`
+connects to it. Two endpoints outside the API are for the benchmark runner,
+
+    GET  /_bench/stats?reset=1    requests served since the last reset, by kind
+    GET  /_bench/inventory        the objects of each type in each namespace, and how many of them kubectl applied,
+                                  for the scenarios to check what they collected
+    POST /_bench/ready            {"namespace": "bench-0", "spread": 2.0}: makes the Deployments in the
+                                  namespace unavailable, and each Available again within `spread` seconds
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import dataclasses
+import hashlib
+import http.server
+import json
+import pathlib
+import random
+import ssl
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+# rhoai_in_kind lives in ../src, see components/deploy.py
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "src"))
+
+from rhoai_in_kind.pki import generate_ca, generate_leaf
+
+PREFIX = "/_bench"
+# how often a watch without events sends a bookmark, so that watchers notice when they are closed
+BOOKMARK_INTERVAL = 1.0
+
+
+@dataclasses.dataclass(frozen=True)
+class ClusterShape:
+    namespaces: int = 10
+    # namespaced types, including pods, events, configmaps and deployments
+    namespaced_types: int = 20
+    # cluster-scoped types, including namespaces and nodes
+    cluster_types: int = 5
+    # objects of each type in each namespace, and of each synthetic cluster-scoped type
+    objects: int = 10
+    object_bytes: int = 512
+    pods: int = 5
+    containers: int = 2
+    log_bytes: int = 20_000
+
+
+@dataclasses.dataclass(frozen=True)
+class Faults:
+    latency: float = 0.002
+    failure_rate: float = 0.0
+    seed: int = 0
+
+
+@dataclasses.dataclass(frozen=True)
+class ResourceType:
+    group: str
+    version: str
+    resource: str
+    kind: str
+    namespaced: bool
+    verbs: tuple[str, ...] = ("get", "list", "watch", "create", "update", "patch", "delete")
+
+    @property
+    def api_version(self) -> str:
+        return f"{self.group}/{self.version}" if self.group else self.version
+
+
+def resource_types(shape: ClusterShape) -> list[ResourceType]:
+    types = [
+        ResourceType("", "v1", "namespaces", "Namespace", False),
+        ResourceType("", "v1", "nodes", "Node", False),
+        ResourceType("", "v1", "pods", "Pod", True),
+        ResourceType("", "v1", "events", "Event", True),
+        ResourceType("", "v1", "configmaps", "ConfigMap", True),
+        # cannot be listed, discovery has to leave it out
+        ResourceType("", "v1", "bindings", "Binding", True, verbs=("create",)),
+        ResourceType("apps", "v1", "deployments", "Deployment", True),
+    ]
+    types += [ResourceType("bench.example.com", "v1", f"widget{i}s", f"Widget{i}", True)
+              for i in range(max(0, shape.namespaced_types - 4))]
+    types += [ResourceType("bench.example.com", "v1", f"gadget{i}s", f"Gadget{i}", False)
+              for i in range(max(0, shape.cluster_types - 2))]
+    return types
+
+
+def _available(available: bool) -> dict:
+    return {"conditions": [{"type": "Available", "status": "True" if available else "False"}]}
+
+
+class FakeCluster:
+    def __init__(self, shape: ClusterShape, faults: Faults):
+        self.shape = shape
+        self.faults = faults
+        self.types = resource_types(shape)
+        self._by_path = {self._type_path(t): t for t in self.types}
+        self._random = random.Random(faults.seed)
+        self._lock = threading.Lock()
+        self._version = 0
+        # (group, resource) -> namespace ("" if cluster-scoped) -> objects, sorted by name
+        self.objects: dict[tuple[str, str], dict[str, list[dict]]] = {}
+        # (resourceVersion, type, object) of every change since the start, for watches
+        self.events: list[tuple[int, ResourceType, dict]] = []
+        self._scheduled: list[tuple[float, ResourceType, dict]] = []
+        self.stats: dict[str, int] = {}
+        self._populate()
+
+    @staticmethod
+    def _type_path(t: ResourceType) -> str:
+        return f"/api/{t.version}" if not t.group else f"/apis/{t.group}/{t.version}"
+
+    def _next_version(self) -> str:
+        self._version += 1
+        return str(self._version)
+
+    def _object(self, t: ResourceType, name: str, namespace: str | None, **fields) -> dict:
+        uid = hashlib.sha1(f"{t.resource}/{namespace}/{name}".encode()).hexdigest()
+        metadata = {
+            "name": name,
+            "uid": uid,
+            "resourceVersion": self._next_version(),
+            "creationTimestamp": "2026-01-01T00:00:00Z",
+            "labels": {"app": name},
+            "annotations": {"bench.example.com/payload": "x" * self.shape.object_bytes},
+            # about half of the objects were applied with kubectl, the others made by a controller
+            "managedFields": [{
+                "manager": "kubectl-client-side-apply" if int(uid, 16) % 2 == 0 else "bench-controller",
+                "operation": "Update", "fieldsType": "FieldsV1",
+                "fieldsV1": {"f:metadata": {"f:labels": {".": {}, "f:app": {}}}},
+            }],
+        }
+        if namespace:
+            metadata["namespace"] = namespace
+        return {"apiVersion": t.api_version, "kind": t.kind, "metadata": metadata, **fields}
+
+    def _populate(self):
+        namespaces = [f"bench-{i}" for i in range(self.shape.namespaces)]
+        for t in self.types:
+            if "list" not in t.verbs:
+                continue
+            by_namespace: dict[str, list[dict]] = {}
+            if t.resource == "namespaces":
+                by_namespace[""] = [self._object(t, ns, None, status={"phase": "Active"}) for ns in namespaces]
+            elif t.resource == "nodes":
+                by_namespace[""] = [self._object(t, "bench-control-plane", None)]
+            elif not t.namespaced:
+                by_namespace[""] = [self._object(t, f"{t.kind.lower()}-{i}", None) for i in range(self.shape.objects)]
+            elif t.resource == "pods":
+                for ns in namespaces:
+                    by_namespace[ns] = [self._pod(t, f"pod-{i}", ns) for i in range(self.shape.pods)]
+            else:
+                for ns in namespaces:
+                    by_namespace[ns] = [
+                        self._object(t, f"{t.kind.lower()}-{i}", ns,
+                                     **({"status": _available(True)} if t.resource == "deployments" else {}))
+                        for i in range(self.shape.objects)]
+            self.objects[(t.group, t.resource)] = by_namespace
+
+    def _pod(self, t: ResourceType, name: str, namespace: str) -> dict:
+        containers = [f"container-{i}" for i in range(self.shape.containers)]
+        return self._object(t, name, namespace, spec={"containers": [{"name": c} for c in containers]}, status={
+            "phase": "Running",
+            # the first container restarted once, so it also has a previous log
+            "containerStatuses": [{"name": c, "state": {"running": {}}, "restartCount": 1 if i == 0 else 0}
+                                  for i, c in enumerate(containers)],
+        })
+
+    def count(self, what: str):
+        with self._lock:
+            self.stats[what] = self.stats.get(what, 0) + 1
+            self.stats["total"] = self.stats.get("total", 0) + 1
+
+    def take_stats(self, reset: bool) -> dict[str, int]:
+        with self._lock:
+            stats = dict(self.stats)
+            if reset:
+                self.stats.clear()
+        return stats
+
+    def inventory(self) -> list[dict]:
+        with self._lock:
+            return [{"group": group, "resource": resource, "namespace": namespace, "objects": len(objects),
+                     "applied": sum(o["metadata"]["managedFields"][0]["manager"].startswith("kubectl")
+                                    for o in objects)}
+                    for (group, resource), by_namespace in self.objects.items()
+                    for namespace, objects in by_namespace.items()]
+
+    def fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.faults.failure_rate
+
+    def schedule_ready(self, namespace: str, spread: float):
+        """Makes the namespace's Deployments unavailable now and Available at random times within `spread`."""
+        t = next(t for t in self.types if t.resource == "deployments")
+        now = time.monotonic()
+        with self._lock:
+            for obj in self.objects[(t.group, t.resource)].get(namespace, []):
+                self._change(t, obj, _available(False))
+                self._scheduled.append((now + self._random.uniform(0, spread), t, obj))
+            self._scheduled.sort(key=lambda s: s[0])
+
+    def _change(self, t: ResourceType, obj: dict, status: dict):
+        """Updates an object's status as a new version; caller holds the lock."""
+        obj["status"] = status
+        obj["metadata"]["resourceVersion"] = self._next_version()
+        self.events.append((self._version, t, json.loads(json.dumps(obj))))
+
+    def apply_due(self):
+        """Makes the scheduled changes whose time has come."""
+        now = time.monotonic()
+        with self._lock:
+            while self._scheduled and self._scheduled[0][0] <= now:
+                _, t, obj = self._scheduled.pop(0)
+                self._change(t, obj, _available(True))
+
+    def route(self, path: str) -> tuple[ResourceType, str | None, str | None, str | None] | None:
+        """Splits an API path into (type, namespace, name, subresource)."""
+        parts = path.strip("/").split("/")
+        if parts[0] == "api":
+            base, rest = f"/api/{parts[1]}", parts[2:]
+        elif parts[0] == "apis" and len(parts) >= 3:
+            base, rest = f"/apis/{parts[1]}/{parts[2]}", parts[3:]
+        else:
+            return None
+        namespace = None
+        if len(rest) >= 3 and rest[0] == "namespaces":
+            namespace, rest = rest[1], rest[2:]
+        elif len(rest) == 2 and rest[0] == "namespaces":
+            # a Namespace object itself
+            rest = ["namespaces", rest[1]]
+        if not rest:
+            return None
+        t = next((t for t in self.types if self._type_path(t) == base and t.resource == rest[0]), None)
+        if t is None:
+            return None
+        return t, namespace, rest[1] if len(rest) > 1 else None, rest[2] if len(rest) > 2 else None
+
+    def select(self, t: ResourceType, namespace: str | None, label_selector: str | None) -> list[dict]:
+        by_namespace = self.objects.get((t.group, t.resource), {})
+        if namespace is not None and t.namespaced:
+            items = by_namespace.get(namespace, [])
+        else:
+            items = [o for ns in sorted(by_namespace) for o in by_namespace[ns]]
+        if label_selector:
+            wanted = dict(term.split("=", 1) for term in label_selector.split(",") if "=" in term)
+            items = [o for o in items if all((o["metadata"].get("labels") or {}).get(k) == v
+                                             for k, v in wanted.items())]
+        return items
+
+    def group_version(self, path: str) -> dict | None:
+        """The legacy discovery document of one group version, e.g. `/apis/apps/v1`."""
+        types = [t for t in self.types if self._type_path(t) == path]
+        if not types:
+            return None
+        return {"kind": "APIResourceList", "groupVersion": types[0].api_version, "resources": [
+            {"name": t.resource, "kind": t.kind, "namespaced": t.namespaced, "verbs": list(t.verbs)} for t in types]}
+
+    def discovery(self, path: str) -> dict:
+        groups: dict[str, list[ResourceType]] = {}
+        for t in self.types:
+            if (path == "/api") == (t.group == ""):
+                groups.setdefault(t.group, []).append(t)
+        return {
+            "apiVersion": "apidiscovery.k8s.io/v2",
+            "kind": "APIGroupDiscoveryList",
+            "items": [{
+                "metadata": {"name": group} if group else {},
+                "versions": [{"version": types[0].version, "freshness": "Current", "resources": [{
+                    "resource": t.resource,
+                    "responseKind": {"group": t.group, "version": t.version, "kind": t.kind},
+                    "scope": "Namespaced" if t.namespaced else "Cluster",
+                    "verbs": list(t.verbs),
+                } for t in types]}],
+            } for group, types in groups.items()],
+        }
+
+    def log(self, size: int, limit: int | None) -> bytes:
+        line = b"2026-01-01T00:00:00.000000000Z benchmark log line with some typical padding text\n"
+        data = (line * (size // len(line) + 1))[:size]
+        return data[:limit] if limit is not None else data
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; like the real API server, don't let Nagle hold back the body
+    disable_nagle_algorithm = True
+    cluster: FakeCluster
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, obj: dict, headers: dict | None = None):
+        self._send(status, json.dumps(obj).encode(), headers=headers)
+
+    def _status(self, code: int, reason: str, message: str):
+        self._json(code, {"kind": "Status", "apiVersion": "v1", "status": "Failure", "code": code,
+                          "reason": reason, "message": message})
+
+    def _begin(self, what: str) -> bool:
+        """Counts and delays the request; returns False if it was failed on purpose."""
+        self.cluster.count(what)
+        time.sleep(self.cluster.faults.latency)
+        self.cluster.apply_due()
+        if self.cluster.fail():
+            self.cluster.count("failed")
+            self._status(503, "ServiceUnavailable", "the server is currently unable to handle the request (injected)")
+            return False
+        return True
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if url.path == f"{PREFIX}/stats":
+            self._json(200, self.cluster.take_stats(reset=query.get("reset") == "1"))
+            return
+        if url.path == f"{PREFIX}/inventory":
+            self._json(200, {"items": self.cluster.inventory()})
+            return
+        if url.path in ("/api", "/apis"):
+            if not self._begin("discovery"):
+                return
+            body = json.dumps(self.cluster.discovery(url.path)).encode()
+            etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self._send(200, body, headers={"ETag": etag})
+            return
+
+        group_version = self.cluster.group_version(url.path)
+        if group_version is not None:
+            if self._begin("discovery"):
+                self._json(200, group_version)
+            return
+        route = self.cluster.route(url.path)
+        if route is None:
+            self._begin("other")
+            self._status(404, "NotFound", f"the server could not find the requested resource {url.path}")
+            return
+        t, namespace, name, subresource = route
+        if query.get("watch") in ("1", "true"):
+            self._watch(t, namespace, query)
+        elif subresource == "log":
+            self._log(t, namespace, name, query)
+        elif name:
+            self._get(t, namespace, name)
+        else:
+            self._list(t, namespace, query)
+
+    def _get(self, t: ResourceType, namespace: str | None, name: str):
+        if not self._begin("get"):
+            return
+        if t.resource == "namespaces":
+            namespace = None
+        obj = next((o for o in self.cluster.select(t, namespace, None) if o["metadata"]["name"] == name), None)
+        if obj is None:
+            self._status(404, "NotFound", f'{t.resource} "{name}" not found')
+            return
+        self._json(200, obj)
+
+    def _list(self, t: ResourceType, namespace: str | None, query: dict[str, str]):
+        if not self._begin("list"):
+            return
+        if "list" not in t.verbs:
+            self._status(405, "MethodNotAllowed", f"{t.resource} cannot be listed")
+            return
+        items = self.cluster.select(t, namespace, query.get("labelSelector"))
+        start = int(query.get("continue") or 0)
+        limit = int(query.get("limit") or 0) or len(items)
+        page = items[start:start + limit]
+        metadata = {"resourceVersion": str(self.cluster._version)}
+        if start + limit < len(items):
+            metadata["continue"] = str(start + limit)
+        if "as=PartialObjectMetadataList" in (self.headers.get("Accept") or ""):
+            body = {"apiVersion": "meta.k8s.io/v1", "kind": "PartialObjectMetadataList", "metadata": metadata,
+                    "items": [{"apiVersion": "meta.k8s.io/v1", "kind": "PartialObjectMetadata",
+                               "metadata": o["metadata"]} for o in page]}
+        else:
+            body = {"apiVersion": t.api_version, "kind": f"{t.kind}List", "metadata": metadata,
+                    "items": [{k: v for k, v in o.items() if k not in ("apiVersion", "kind")} for o in page]}
+        self._json(200, body)
+
+    def _log(self, t: ResourceType, namespace: str, name: str, query: dict[str, str]):
+        if not self._begin("log"):
+            return
+        if not any(o["metadata"]["name"] == name for o in self.cluster.select(t, namespace, None)):
+            self._status(404, "NotFound", f'pods "{name}" not found')
+            return
+        limit = int(query["limitBytes"]) if "limitBytes" in query else None
+        self._send(200, self.cluster.log(self.cluster.shape.log_bytes, limit), content_type="text/plain")
+
+    def _watch(self, t: ResourceType, namespace: str | None, query: dict[str, str]):
+        if not self._begin("watch"):
+            return
+        if "watch" not in t.verbs:
+            self._status(405, "MethodNotAllowed", f"{t.resource} cannot be watched")
+            return
+        since = int(query.get("resourceVersion") or 0)
+        deadline = time.monotonic() + float(query.get("timeoutSeconds") or 300)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        last_sent = time.monotonic()
+        try:
+            while time.monotonic() < deadline:
+                self.cluster.apply_due()
+                lines = []
+                for version, event_type, obj in list(self.cluster.events):
+                    if version <= since or event_type != t:
+                        continue
+                    since = version
+                    if namespace is None or obj["metadata"].get("namespace") == namespace:
+                        lines.append(json.dumps({"type": "MODIFIED", "object": obj}))
+                if not lines and time.monotonic() - last_sent >= BOOKMARK_INTERVAL:
+                    lines.append(json.dumps({"type": "BOOKMARK", "object": {
+                        "apiVersion": t.api_version, "kind": t.kind,
+                        "metadata": {"resourceVersion": str(max(since, 1))}}}))
+                if lines:
+                    self.wfile.write(("\n".join(lines) + "\n").encode())
+                    self.wfile.flush()
+                    last_sent = time.monotonic()
+                time.sleep(0.02)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if url.path == f"{PREFIX}/ready":
+            request = json.loads(body)
+            self.cluster.schedule_ready(request["namespace"], request["spread"])
+            self._json(200, {})
+            return
+        self._write(body)
+
+    def do_PATCH(self):
+        self._write(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+
+    def do_PUT(self):
+        self.do_PATCH()
+
+    def do_DELETE(self):
+        if self._begin("write"):
+            self._json(200, {"kind": "Status", "status": "Success"})
+
+    def _write(self, body: bytes):
+        """Accepts any write and answers with what was sent, like an apply that changed nothing."""
+        if self._begin("write"):
+            self._send(200, body or b"{}")
+
+
+def serve(shape: ClusterShape, faults: Faults, state_dir: pathlib.Path) -> http.server.ThreadingHTTPServer:
+    """Starts the server on a free port and writes `kubeconfig.json` for it into `state_dir`."""
+    ca = generate_ca("rhoai-in-kind benchmark CA")
+    leaf = generate_leaf(ca, ["localhost"])
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = pathlib.Path(tmp, "tls.crt"), pathlib.Path(tmp, "tls.key")
+        cert.write_text(leaf.cert_pem)
+        key.write_text(leaf.key_pem)
+        context.load_cert_chain(cert, key)
+
+    handler = type("BoundHandler", (Handler,), {"cluster": FakeCluster(shape, faults)})
+    server = http.server.ThreadingHTTPServer(("localhost", 0), handler)
+    server.daemon_threads = True
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+
+    state_dir.mkdir(parents=True, exist_ok=True)
+    kubeconfig = {
+        "clusters": [{"name": "bench", "cluster": {
+            "server": f"https://localhost:{server.server_port}",
+            "certificate-authority-data": base64.b64encode(ca.cert_pem.encode()).decode(),
+        }}],
+        "users": [{"name": "bench", "user": {"token": "bench"}}],
+        "contexts": [{"name": "bench", "context": {"cluster": "bench", "user": "bench", "namespace": "default"}}],
+        "current-context": "bench",
+    }
+    (state_dir / "kubeconfig.json").write_text(json.dumps(kubeconfig))
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--state-dir", type=pathlib.Path, required=True)
+    for field in dataclasses.fields(ClusterShape) + dataclasses.fields(Faults):
+        parser.add_argument(f"--{field.name.replace('_', '-')}", type=type(field.default), default=field.default)
+    args = vars(parser.parse_args())
+    shape = ClusterShape(**{f.name: args[f.name] for f in dataclasses.fields(ClusterShape)})
+    faults = Faults(**{f.name: args[f.name] for f in dataclasses.fields(Faults)})
+    server = serve(shape, faults, args["state_dir"])
+    print(f"serving on port {server.server_port}")
+    sys.stdout.flush()
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,103 +1,80 @@
 #!/usr/bin/env python3
+from __future__ import annotations
+
 import pathlib
-import textwrap
 import os
 import platform
 import subprocess
 import sys
+from typing import TYPE_CHECKING
 
+# rhoai_in_kind lives in ../src, see deploy.py
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "src"))
 
-def self_signed_issuer():
-    # This would create a new CA for each certificate, I don't want that
-    # language=YAML
-    request = textwrap.dedent(
-        '''
-        apiVersion: cert-manager.io/v1
-        kind: Issuer
-        metadata:
-          name: self-signed-issuer
-          namespace: cert-manager
-        spec:
-          selfSigned: { }
-        '''
-    )
-    pathlib.Path("self-signed-issuer.yaml").write_text(request)
-    sh("kubectl apply -f self-signed-issuer.yaml")
+from rhoai_in_kind import shell
+from rhoai_in_kind.batch import ApplyBatch, config_map, secret
+from rhoai_in_kind.pki import CertificateCache
+from rhoai_in_kind.retry import retry
+
+if TYPE_CHECKING:
+    from rhoai_in_kind.kube import KubeClient
 
-def ca_issuer():
+SSLIP_WILDCARD = "*.apps.127.0.0.1.sslip.io"
+
+
+def ca_issuer(client: KubeClient | None = None):
     """
+    Puts the cluster CA, the sslip.io certificate signed by it and the trust bundle into the cert-manager namespace.
+
+    The CA and the certificate are generated once and then reused from the cache (see rhoai_in_kind.pki),
+    so the secrets only change when the material does; applying them updates them in place.
+
     Verify:
     ❯ openssl s_client -showcerts -connect minio-console.apps.127.0.0.1.sslip.io:443 </dev/null | sed -n '/-----BEGIN/,/-----END/p' > server.crt
-    ❯ openssl verify -CAfile /Users/jdanek/IdeaProjects/rhoai-in-kind/ca.crt server.crt
+    ❯ openssl verify -CAfile ~/.cache/rhoai-in-kind/pki/ca.crt server.crt
     """
-    sh("kubectl delete configmap odh-trusted-ca-bundle --namespace=cert-manager --ignore-not-found")
-    sh("kubectl delete secret my-cluster-ca-secret --namespace=cert-manager --ignore-not-found")
-    sh("kubectl delete issuer my-cluster-ca-issuer --namespace=cert-manager --ignore-not-found")
-    sh("kubectl delete certificate sslip-io-certificate --namespace=cert-manager --ignore-not-found")
-    sh("kubectl delete secret sslip-tls-secret --namespace=cert-manager --ignore-not-found")
-
-    # language=YAML
-    request = textwrap.dedent(
-        '''
-        apiVersion: cert-manager.io/v1
-        kind: Issuer
-        metadata:
-          name: my-cluster-ca-issuer
-          namespace: cert-manager
-        spec:
-          ca:
-            secretName: my-cluster-ca-secret
-        '''
-    )
-    pathlib.Path("my-cluster-ca-issuer.yaml").write_text(request)
+    pki = CertificateCache()
+    # todo: remove dns name from cacert?
+    ca = pki.ca("My Cluster CA", dns_names=[SSLIP_WILDCARD])
+    leaf = pki.leaf(ca, [SSLIP_WILDCARD])
+
+    # sslip-tls-secret used to be issued by cert-manager, which would overwrite ours while its Certificate exists;
+    # it was deleted when the material the cluster has was generated, so there is nothing to delete after reusing it
+    if pki.generated:
+        if client is not None:
+            client.delete("/apis/cert-manager.io/v1/namespaces/cert-manager/certificates/sslip-io-certificate",
+                          ignore_not_found=True)
+        else:
+            sh("kubectl delete certificate sslip-io-certificate --namespace=cert-manager --ignore-not-found")
+
+    objects = [
+        secret("cert-manager", "my-cluster-ca-secret", {"tls.crt": ca.cert_pem, "tls.key": ca.key_pem},
+               secret_type="kubernetes.io/tls"),
+        secret("cert-manager", "sslip-tls-secret",
+               {"tls.crt": leaf.cert_pem, "tls.key": leaf.key_pem, "ca.crt": ca.cert_pem},
+               secret_type="kubernetes.io/tls"),
+        config_map("cert-manager", "odh-trusted-ca-bundle", {
+            "odh-ca-bundle.crt": ca.cert_pem,
+            "ca-bundle.crt": pathlib.Path(find_ca_bundle_path()).read_text(),
+        }),
+        # for certificates that anything else wants issued by the cluster CA
+        {
+            "apiVersion": "cert-manager.io/v1", "kind": "Issuer",
+            "metadata": {"name": "my-cluster-ca-issuer", "namespace": "cert-manager"},
+            "spec": {"ca": {"secretName": "my-cluster-ca-secret"}},
+        },
+    ]
     # Error from server (InternalError): error when creating "my-cluster-ca-issuer.yaml": Internal error occurred: failed calling webhook "webhook.cert-manager.io": failed to call webhook: Post "https://cert-manager-webhook.cert-manager.svc:443/validate?timeout=30s": dial tcp 10.96.78.75:443: connect: connection refused
-    sh("timeout 30s bash -c 'while ! kubectl apply -f my-cluster-ca-issuer.yaml; do sleep 1; done'")
+    retry(lambda _: ApplyBatch(client).add(*objects).apply(), "apply the cluster CA and certificates", timeout=30)
 
-    # todo: remove dns name from cacert?
-    sh("openssl req -x509 -new -nodes -keyout ca.key -sha256 -days 3650 -out ca.crt -subj '/CN=My Cluster CA' -addext 'subjectAltName = DNS:*.apps.127.0.0.1.sslip.io'")
-    sh("kubectl create secret tls my-cluster-ca-secret --cert=ca.crt --key=ca.key --namespace=cert-manager --dry-run=client -o yaml | kubectl apply -f -")
-
-    sh(f"kubectl create configmap odh-trusted-ca-bundle --namespace=cert-manager --from-file=odh-ca-bundle.crt=ca.crt --from-file=ca-bundle.crt={find_ca_bundle_path()} --dry-run=client -o yaml | kubectl apply -f -")
-
-    ## Option 2: Use trust-manager (The Recommended Method) 🚀
-
-    # language=YAML
-    request = textwrap.dedent(
-        '''
-        apiVersion: cert-manager.io/v1
-        kind: Certificate
-        metadata:
-          name: sslip-io-certificate
-          namespace: cert-manager
-        spec:
-          privateKey:
-            # message: 'Existing private key is not up to date for spec: [spec.privateKey.algorithm]'
-            #algorithm: ECDSA
-            #size: 256
-            #encoding: PKCS8
-            rotationPolicy: Never
-          secretName: sslip-tls-secret # The secret where the cert/key will be stored
-          commonName: "*.apps.127.0.0.1.sslip.io"
-          dnsNames:
-            - "*.apps.127.0.0.1.sslip.io"
-          issuerRef:
-            name: my-cluster-ca-issuer
-            kind: Issuer
-        '''
-    )
-    pathlib.Path("sslip-certificate.yaml").write_text(request)
-    sh("kubectl apply -f sslip-certificate.yaml")
-    sh("kubectl wait --for=condition=Ready certificate/sslip-io-certificate -n cert-manager --timeout=20s")
 
 def main():
     ca_issuer()
 
 def sh(cmd: str, check=True, stdout: bool = False, stderr: bool = False) -> str | None:
     print(f"$ {cmd}")
-    p = subprocess.run(
+    p = shell.run(
         f"set -Eeuo pipefail; {cmd}",
-        shell=True,
-        executable="/bin/bash",
         stdout=subprocess.PIPE if stdout else None,
         stderr=subprocess.PIPE if stderr else None
     )
@@ -105,7 +82,7 @@ def sh(cmd: str, check=True, stdout: bool = False, stderr: bool = False) -> str
     if check:
         p.check_returncode()
     if stdout:
-        return p.stdout.decode('utf-8')
+        return p.stdout
     return None
 
 
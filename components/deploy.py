@@ -3,10 +3,11 @@
 from __future__ import annotations
 
 import argparse
+import contextlib
 import os
 import pathlib
+import shutil
 import sys
-import textwrap
 
 import certs
 
@@ -15,270 +16,414 @@ import certs
 # editable install (local uv venv).
 sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "src"))
 
+from rhoai_in_kind.argo import sync_application
+from rhoai_in_kind.artifacts import (
+    CERT_MANAGER_VERSION,
+    GATEWAY_API_VERSION,
+    ISTIO_VERSION,
+    LOCAL_PATH_PROVISIONER_VERSION,
+    ArtifactCache,
+    catalogue,
+)
 from rhoai_in_kind import (
     TestFrame,
-    create_resource,
     gha_log_group,
     sh,
+    shell,
     wait_for_webhook_service_endpoint,
 )
+from rhoai_in_kind.batch import (
+    ApplyBatch,
+    cluster_role,
+    cluster_role_binding,
+    namespace,
+    secret,
+    service_account,
+)
+from rhoai_in_kind.checkpoint import Checkpoints, cluster_uid
+from rhoai_in_kind.golden import BundleStore, export_bundle
+from rhoai_in_kind.images import LOADERS, ImagePrefetcher
+from rhoai_in_kind.kube import KubeClient
+from rhoai_in_kind.render import RenderCache
+from rhoai_in_kind.retry import retries, retry_sh
+from rhoai_in_kind.readiness import (
+    ReadinessEngine,
+    Waiter,
+    clusterpolicy_ready,
+    crd_established,
+    deployment_available,
+    imagestream_resolved,
+)
+from rhoai_in_kind.steps import Plan
+from rhoai_in_kind.tracing import tracer
 
 REDHAT_ODS_APPLICATIONS = "redhat-ods-applications"
 RHODS_NOTEBOOKS = "rhods-notebooks"
 
-# Ceiling for the ArgoCD retry loops (`timeout <N> bash -c 'while ! argocd ...'`).
-# It is a retry budget, not a fixed wait: the loop exits as soon as the command succeeds.
-ARGOCD_TIMEOUT = "60s"
+# we don't have permissions to pull from quay.io/rhoai
+# WORKBENCH_REPO = "https://github.com/red-hat-data-services/notebooks"
+WORKBENCH_REPO = "https://github.com/opendatahub-io/notebooks"
+
+# With --from-bundle only these steps run; everything the others set up is Kubernetes objects, which are in the bundle
+BUNDLE_STEPS = ("Install OC client", "Wait for Gateway", "Create Minio buckets")
+
+# Deadline in seconds for syncing an ArgoCD application, failed syncs are started again until then.
+# It is a budget, not a fixed wait: it ends as soon as a sync succeeds.
+ARGOCD_SYNC_TIMEOUT = 300
+
+COMPONENTS = pathlib.Path("components")
 
 
 def main():
-    tf = TestFrame()
+    plan = Plan()
 
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--workbench-branch",
         default=os.environ.get("WORKBENCH_BRANCH"),
         help="The workbench branch to use. Defaults to the WORKBENCH_BRANCH environment variable.",
-        required=not os.environ.get("WORKBENCH_BRANCH"),
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=int(os.environ.get("DEPLOY_JOBS", "4")),
+        help="How many independent install steps may run at the same time; 1 runs them one by one. "
+             "Defaults to the DEPLOY_JOBS environment variable, or 4.",
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        default=None,
+        help="Use only downloads that are already in the artifact cache and fail on anything missing. "
+             "Defaults to the RHOAI_IN_KIND_OFFLINE environment variable.",
+    )
+    parser.add_argument(
+        "--trace",
+        default=os.environ.get("DEPLOY_TRACE", "deploy-trace.json"),
+        help="Where to write the timing spans of all steps and shell commands, in the Chrome trace event format. "
+             "Defaults to the DEPLOY_TRACE environment variable, or deploy-trace.json.",
+    )
+    parser.add_argument(
+        "--state",
+        default=os.environ.get("DEPLOY_STATE", "deploy-state.json"),
+        help="Where to record the steps that completed, for --resume. "
+             "Defaults to the DEPLOY_STATE environment variable, or deploy-state.json.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip the steps that completed on this cluster before with the same inputs, "
+             "as long as what they set up is still ready.",
+    )
+    parser.add_argument(
+        "--shell",
+        choices=shell.MODES,
+        default=shell.mode(),
+        help="Run shell commands on long-lived bash workers, or start a new bash for each one (spawn). "
+             "Defaults to the RHOAI_IN_KIND_SHELL environment variable, or worker.",
+    )
+    parser.add_argument(
+        "--prefetch-images",
+        choices=["off", *LOADERS],
+        default=os.environ.get("DEPLOY_PREFETCH_IMAGES", "node"),
+        help="Pull the images of all manifests into the kind node in the background while deploying: "
+             "with crictl in the node, with kind load from the host, or from image tarballs in the artifact cache "
+             "(fake only lists them). Defaults to the DEPLOY_PREFETCH_IMAGES environment variable, or node.",
+    )
+    parser.add_argument(
+        "--export-bundle",
+        action="store_true",
+        help="Once the deploy passed, export the objects it set up into a golden bundle in the artifact cache, "
+             "for --from-bundle.",
+    )
+    parser.add_argument(
+        "--from-bundle",
+        action="store_true",
+        help="Apply the golden bundle exported by a deploy with the same inputs, instead of running the install "
+             "steps; without one, deploy step by step and export it.",
+    )
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="Download all release artifacts the deploy needs into the artifact cache, then exit.",
     )
     args = parser.parse_args()
     workbench_branch = args.workbench_branch
+    shell.set_mode(args.shell)
+
+    cache = ArtifactCache(offline=args.offline)
+    artifacts = catalogue()
+    renders = RenderCache(offline=args.offline)
+    if args.prefetch:
+        cache.prefetch(artifacts.values(), jobs=max(args.jobs, len(artifacts)))
+        return
+    if not workbench_branch:
+        parser.error("the following arguments are required: --workbench-branch")
+
+    # the deferred functions are independent readiness waits, run them side by side unless asked not to
+    tf = TestFrame(concurrent=args.jobs > 1)
+    # in-process API access for the small objects and for watching
+    client = KubeClient.from_kubeconfig()
+    # one watch per resource kind, shared by all the waits below
+    readiness = ReadinessEngine(source=client)
+    # the cluster is only asked who it is once a step is resumed or has finished
+    checkpoints = Checkpoints(args.state, cluster=lambda: cluster_uid(client))
+
+    def render_workbenches() -> pathlib.Path:
+        # rendered once per commit of the branch, git cloning it is the slow part
+        return renders.remote(WORKBENCH_REPO, "manifests/base/", workbench_branch, env={"GIT_LFS_SKIP_SMUDGE": "1"})
+
+    def still(*waiters: Waiter):
+        """A step check for resuming: what the step waited for is ready right now."""
+        return lambda: readiness.is_ready(*waiters)
 
     # slow to deploy so do it first
-    with gha_log_group("Install Kyverno"):
+    @plan.step("Install Kyverno", inputs=[COMPONENTS / "02-kyverno"], check=still(deployment_available("kyverno")))
+    def install_kyverno():
         # https://kubernetes.io/blog/2022/10/20/advanced-server-side-apply/
-        sh("timeout 30s bash -c 'while ! kubectl apply --server-side -k components/02-kyverno; do sleep 1; done'")
-        tf.defer(None, lambda _: sh(
-            "kubectl wait --for=condition=Ready pod -l app.kubernetes.io/part-of=kyverno -n kyverno --timeout=120s"))
-
-    with gha_log_group("Install cert-manager"):
-        version = "v1.18.2"
-        cert_manager_yaml = f"https://github.com/jetstack/cert-manager/releases/download/{version}/cert-manager.yaml"
-        sh(f"kubectl apply -f {cert_manager_yaml}")
-        sh("kubectl wait deployment.apps --for condition=Available --selector app.kubernetes.io/instance=cert-manager --all-namespaces --timeout 5m")
-
-    with gha_log_group("Generate certs"):
-        certs.ca_issuer()
-
-    if "CI" in os.environ:
-        with gha_log_group("Install ArgoCD CLI"):
-            ARGOCD_VERSION = "v3.0.6"
-            sh(f"curl -sSL -o /tmp/argocd-{ARGOCD_VERSION} https://github.com/argoproj/argo-cd/releases/download/{ARGOCD_VERSION}/argocd-$(go env GOOS)-$(go env GOARCH)")
-            sh(f"chmod +x /tmp/argocd-{ARGOCD_VERSION}")
-            sh(f"sudo mv /tmp/argocd-{ARGOCD_VERSION} /usr/local/bin/argocd")
-            sh("argocd version --client")
-
-        with gha_log_group("Install OC client"):
-            sh("curl -L https://mirror.openshift.com/pub/openshift-v4/$(uname -m)/clients/ocp/stable/openshift-client-linux.tar.gz \
-                                                                   -o /tmp/openshift-client-linux.tar.gz")
-            sh("tar -xzvf /tmp/openshift-client-linux.tar.gz oc")
-            sh("sudo mv ./oc /usr/local/bin/oc")
-            sh("rm -f /tmp/openshift-client-linux.tar.gz")
-
-            sh("oc version")
+        retry_sh(f"kubectl apply --server-side -f {renders.local('components/02-kyverno')}", timeout=30)
 
-    # https://istio.io/latest/docs/setup/platform-setup/kind/
-    # https://istio.io/latest/docs/tasks/traffic-management/ingress/gateway-api/#setup
-    # https://ryandeangraham.medium.com/istio-gateway-api-nodeport-c598a21c4c95
-    with gha_log_group("Install Istio"):
-        ISTIO_VERSION = "1.26.2"
-        TARGET_ARCH = sh("arch", capture_output=True).stdout.strip()
+    @plan.step("Wait for Kyverno", needs=["Install Kyverno"], check=still(deployment_available("kyverno")))
+    def wait_for_kyverno():
+        sh("kubectl wait --for=condition=Ready pod -l app.kubernetes.io/part-of=kyverno -n kyverno --timeout=120s")
 
+    @plan.step("Install cert-manager", inputs=[CERT_MANAGER_VERSION],
+               check=still(deployment_available(None, labels={"app.kubernetes.io/instance": "cert-manager"})))
+    def install_cert_manager():
+        sh(f"kubectl apply -f {cache.fetch(artifacts['cert-manager'])}")
+        readiness.wait(deployment_available(None, labels={"app.kubernetes.io/instance": "cert-manager"}), timeout=300)
+
+    @plan.step("Generate certs", needs=["Install cert-manager"], inputs=[COMPONENTS / "certs.py"])
+    def generate_certs():
+        certs.ca_issuer(client)
+
+    @plan.step("Install OC client", enabled="CI" in os.environ, check=lambda: shutil.which("oc") is not None)
+    def install_oc_client():
+        # extract into a scratch dir, ./oc in the working directory would race other steps
+        sh(f"tar -xzvf {cache.fetch(artifacts['oc'])} -C /tmp oc")
+        sh("sudo mv /tmp/oc /usr/local/bin/oc")
+
+        sh("oc version")
+
+    @plan.step("Install Gateway API CRDs", inputs=[GATEWAY_API_VERSION],
+               check=still(crd_established("gateways.gateway.networking.k8s.io")))
+    def install_gateway_api_crds():
         # TLSRoute is considered "experimental"
         # https://github.com/kubernetes-sigs/gateway-api/issues/2643
-        sh('kubectl get crd gateways.gateway.networking.k8s.io &> /dev/null || \
-          { kubectl kustomize "github.com/kubernetes-sigs/gateway-api/config/crd/experimental?ref=v1.3.0&depth=1" | kubectl apply -f -; }')
+        sh(f"kubectl get crd gateways.gateway.networking.k8s.io &> /dev/null || \
+          kubectl apply -f {cache.fetch(artifacts['gateway-api-crds'])}")
 
+    # https://istio.io/latest/docs/setup/platform-setup/kind/
+    # https://istio.io/latest/docs/tasks/traffic-management/ingress/gateway-api/#setup
+    # https://ryandeangraham.medium.com/istio-gateway-api-nodeport-c598a21c4c95
+    @plan.step("Install Istio", needs=["Install Gateway API CRDs"], inputs=[ISTIO_VERSION],
+               check=still(deployment_available("istio-system", name="istiod")))
+    def install_istio():
         if not pathlib.Path(f"istio-{ISTIO_VERSION}/bin/istioctl").exists():
-            sh("curl -L https://istio.io/downloadIstio | sh -", env={
-                "ISTIO_VERSION": ISTIO_VERSION,
-                "TARGET_ARCH": TARGET_ARCH,
-            })
+            # unpacks into istio-<version>/, like https://istio.io/downloadIstio does
+            sh(f"tar -xzf {cache.fetch(artifacts['istio'])}")
         sh(f"istio-{ISTIO_VERSION}/bin/istioctl install --set values.pilot.env.PILOT_ENABLE_ALPHA_GATEWAY_API=true --set profile=minimal -y")
 
+    # the gateway terminates TLS with the sslip.io certificate from cert-manager
+    @plan.step("Setup Gateway", needs=["Install Istio", "Generate certs"], inputs=[COMPONENTS / "06-gateway.yaml"])
+    def setup_gateway():
         sh("kubectl apply -f components/06-gateway.yaml")
 
-        tf.defer(None, lambda _: sh(
-            "kubectl wait -n istio-system --for=condition=programmed gateways.gateway.networking.k8s.io gateway"))
+    @plan.step("Wait for Gateway", needs=["Setup Gateway"])
+    def wait_for_gateway():
+        sh("kubectl wait -n istio-system --for=condition=programmed gateways.gateway.networking.k8s.io gateway")
         # export INGRESS_HOST=$(kubectl get gateways.gateway.networking.k8s.io gateway -n istio-system -ojsonpath='{.status.addresses[0].value}')
 
-    with gha_log_group("Setup Gateway"):
-        sh("kubectl apply -f components/06-gateway.yaml")
-
-    with gha_log_group("Configure DNS"):
+    @plan.step("Configure DNS", inputs=[COMPONENTS / "11-coredns.yaml"])
+    def configure_dns():
         sh("kubectl apply -f components/11-coredns.yaml")
 
-    with gha_log_group("Install ArgoCD"):
-        sh("kubectl apply -k components/01-argocd")
-        tf.defer(None, lambda _: sh(
-            "kubectl wait --for=condition=Ready pod -l app.kubernetes.io/name=argocd-server -n argocd --timeout=120s"))
+    # components/01-argocd/httproute.yaml is a Gateway API resource
+    @plan.step("Install ArgoCD", needs=["Install Gateway API CRDs"], inputs=[COMPONENTS / "01-argocd"])
+    def install_argocd():
+        sh(f"kubectl apply -f {renders.local('components/01-argocd')}")
+
+    @plan.step("Wait for ArgoCD", needs=["Install ArgoCD"], check=still(deployment_available("argocd")))
+    def wait_for_argocd():
+        sh("kubectl wait --for=condition=Ready pod -l app.kubernetes.io/name=argocd-server -n argocd --timeout=120s")
+        # syncs also need argocd-repo-server, whose pod may still be pulling its image
+        readiness.wait(deployment_available("argocd"), timeout=180)
+
+    @plan.step("Deploy fake CRDs", inputs=[COMPONENTS / "crds"])
+    def deploy_fake_crds():
+        sh(f"kubectl apply -f {renders.local('components/crds')}")
 
-    with gha_log_group("Deploy fake CRDs"):
-        sh("kubectl apply -k components/crds")
+    @plan.step("Deploy api-extension", inputs=[COMPONENTS / "api-extension"],
+               check=still(deployment_available("api-extension", name="apiserver")))
+    def deploy_api_extension():
+        sh(f"kubectl apply -f {renders.local('components/api-extension')}")
 
-    with gha_log_group("Deploy api-extension"):
-        sh("kubectl apply -k components/api-extension")
-        tf.defer(None, lambda _: sh(
-            "kubectl wait -n api-extension deployment/apiserver --for=condition=Available --timeout=100s"))
+        def wait_for_api_extension(_):
+            readiness.wait(deployment_available("api-extension", name="apiserver"), timeout=100)
+            sh("kubectl logs --tail 10 -n api-extension deployment/apiserver")
 
-        tf.defer(None, lambda _: sh("kubectl logs --tail 10 -n api-extension deployment/apiserver"))
+        tf.defer(None, wait_for_api_extension)
 
     # with gha_log_group("Check that API extension server works"):
     #     tf.defer(None, lambda _: sh("timeout 30s bash -c 'while ! oc new-project dsp-wb-test; do sleep 1; done'"))
 
-    with gha_log_group(f"Run kubectl create namespaces {REDHAT_ODS_APPLICATIONS}"):
-        sh(f"kubectl get namespace {REDHAT_ODS_APPLICATIONS} || kubectl create namespace {REDHAT_ODS_APPLICATIONS}")
+    @plan.step(f"Run kubectl create namespaces {REDHAT_ODS_APPLICATIONS}")
+    def create_redhat_ods_applications_namespace():
+        ApplyBatch(client).add(namespace(REDHAT_ODS_APPLICATIONS)).apply()
 
-    with gha_log_group(f"Setup {RHODS_NOTEBOOKS} namespace"):
+    @plan.step(f"Setup {RHODS_NOTEBOOKS} namespace", needs=[f"Run kubectl create namespaces {REDHAT_ODS_APPLICATIONS}"])
+    def setup_rhods_notebooks_namespace():
         # c.f. dashboard's validateNotebookNamespaceRoleBinding
         # it will create rolebinding ${notebookNamespace}-image-pullers in dashboardNamespace
         # and it needs a clusterrole system:image-puller to exist, which does not exsist on kind by default
-        sh(f"kubectl get namespace {RHODS_NOTEBOOKS} || kubectl create namespace {RHODS_NOTEBOOKS}")
+        batch = ApplyBatch(client)
+        batch.add(namespace(RHODS_NOTEBOOKS))
         # dummy verb and resource, just to have something there
-        sh("kubectl create clusterrole system:image-puller --verb=list --resource=imagestreams.image.openshift.io --dry-run=client -o yaml | kubectl apply -f -")
+        batch.add(cluster_role("system:image-puller", verbs=["list"], resources=["imagestreams.image.openshift.io"]))
         # I have no idea why the next line was needed; it is not mentioned in dashboard sources except in manifests
         # that should've created this already!?!
-        sh("kubectl create clusterrole cluster-monitoring-view --verb=list --resource=imagestreams.image.openshift.io --dry-run=client -o yaml | kubectl apply -f -")
+        batch.add(cluster_role("cluster-monitoring-view", verbs=["list"], resources=["imagestreams.image.openshift.io"]))
         # this is to mitigate fallout from https://github.com/opendatahub-io/odh-dashboard/pull/4049
         # not sure if this is permanent or just a temporary workaround, NOTE: rhods-notebooks serviceaccount!
-        # language=Yaml
-        dashboardPullerRole = textwrap.dedent(f"""
-        apiVersion: rbac.authorization.k8s.io/v1
-        kind: RoleBinding
-        metadata:
-            name: {RHODS_NOTEBOOKS}-image-pullers
-            namespace: {REDHAT_ODS_APPLICATIONS}
-        roleRef:
-            apiGroup: rbac.authorization.k8s.io
-            kind: ClusterRole
-            name: system:image-puller
-        subjects:
-            - apiGroup: rbac.authorization.k8s.io
-              kind: Group
-              name: system:serviceaccounts:{RHODS_NOTEBOOKS}
-        """)
-        create_resource(dashboardPullerRole)
-
-    with gha_log_group("Configure Argo applications"):
+        batch.add({
+            "apiVersion": "rbac.authorization.k8s.io/v1",
+            "kind": "RoleBinding",
+            "metadata": {"name": f"{RHODS_NOTEBOOKS}-image-pullers", "namespace": REDHAT_ODS_APPLICATIONS},
+            "roleRef": {"apiGroup": "rbac.authorization.k8s.io", "kind": "ClusterRole", "name": "system:image-puller"},
+            "subjects": [
+                {"apiGroup": "rbac.authorization.k8s.io", "kind": "Group", "name": f"system:serviceaccounts:{RHODS_NOTEBOOKS}"},
+            ],
+        })
+        batch.apply()
+
+    # AppProject and Application CRDs come with ArgoCD, wait for it so that they are established
+    @plan.step("Configure Argo applications", needs=["Wait for ArgoCD"],
+               inputs=[COMPONENTS / "03-kf-pipelines.yaml", COMPONENTS / "04-odh-dashboard.yaml"])
+    def configure_argo_applications():
         sh("kubectl apply -f components/03-kf-pipelines.yaml")
         sh("kubectl apply -f components/04-odh-dashboard.yaml")
 
-    with gha_log_group("Run deferred functions"):
-        with tf:
-            pass
-
-    with gha_log_group("Install Kyverno policies"):
-        sh("timeout 30s bash -c 'while ! kubectl apply -f components/02-kyverno/policy.yaml; do sleep 1; done'")
-        sh("timeout 30s bash -c 'while ! kubectl apply -f components/02-kyverno/notebook-routes-policy.yaml; do sleep 1; done'")
-        sh("timeout 30s bash -c 'while ! kubectl apply -f components/02-kyverno/pipelines-routes-policy.yaml; do sleep 1; done'")
-        sh("timeout 30s bash -c 'while ! kubectl apply -f components/02-kyverno/imagestream-status-policy.yaml; do sleep 1; done'")
-        tf.defer(None, lambda _: sh("oc wait --for=condition=Ready clusterpolicy --all"))
-
-    with gha_log_group("Run deferred functions"):
-        with tf:
-            pass
-
-    with gha_log_group("Install Minio"):
-        sh("kubectl get namespace minio || kubectl create namespace minio")
-        secret = textwrap.dedent("""
-        apiVersion: v1
-        kind: Secret
-        metadata:
-            name: minio-root-user
-        type: Opaque
-        stringData:
-            MINIO_ROOT_USER: AWS_ACCESS_KEY_ID
-            MINIO_ROOT_PASSWORD: AWS_SECRET_ACCESS_KEY
-        """)
-        sh("kubectl apply --namespace=minio -f -", input=secret)
+    # The policies clone the CA bundle from cert-manager, generate Gateway API routes and Istio
+    # DestinationRules for OpenShift Routes, and sync configmaps into the existing namespaces.
+    @plan.step("Install Kyverno policies", needs=[
+        "Wait for Kyverno",
+        "Generate certs",
+        "Install Istio",
+        "Deploy fake CRDs",
+        f"Setup {RHODS_NOTEBOOKS} namespace",
+    ], inputs=[COMPONENTS / "02-kyverno"])
+    def install_kyverno_policies():
+        retry_sh("kubectl apply -f components/02-kyverno/policy.yaml", timeout=30)
+        retry_sh("kubectl apply -f components/02-kyverno/notebook-routes-policy.yaml", timeout=30)
+        retry_sh("kubectl apply -f components/02-kyverno/pipelines-routes-policy.yaml", timeout=30)
+        retry_sh("kubectl apply -f components/02-kyverno/imagestream-status-policy.yaml", timeout=30)
+
+    # Everything that creates pods, routes or imagestreams waits for the policies, so that their
+    # mutations and generate rules see those resources being created.
+    @plan.step("Wait for Kyverno policies", needs=["Install Kyverno policies"], check=still(clusterpolicy_ready()))
+    def wait_for_kyverno_policies():
+        readiness.wait(clusterpolicy_ready(), timeout=30)
+
+    @plan.step("Install Minio", needs=["Wait for Kyverno policies"], inputs=[COMPONENTS / "10-minio"],
+               check=still(deployment_available("minio", labels={"app": "minio"})))
+    def install_minio():
+        ApplyBatch(client).add(
+            namespace("minio"),
+            secret("minio", "minio-root-user", {
+                "MINIO_ROOT_USER": "AWS_ACCESS_KEY_ID",
+                "MINIO_ROOT_PASSWORD": "AWS_SECRET_ACCESS_KEY",
+            }),
+        ).apply()
         sh("kubectl apply --namespace=minio -f components/10-minio/deploy.yaml")
 
-        tf.defer(None, lambda _: sh("kubectl wait --for=condition=Available deployment -l app=minio -n minio --timeout=120s"))
         # tf.defer(None, lambda _: sh(
         #     "timeout 120s bash -c 'while ! kubectl get --namespace=minio secret/aws-connection-my-storage; do sleep 1; done'"))
         # tf.defer(None, lambda _: sh(
         #     "timeout 120s bash -c 'while ! kubectl get --namespace=minio secret/aws-connection-pipeline-artifacts; do sleep 1; done'"))
-        def create_buckets(_):
-            try:
-                import boto3
-            except ImportError:
-                python = sys.executable
-                # python = "/opt/homebrew/bin/python3"
-                sh(f"{python} -m pip install boto3")
-                import boto3
-
-            # MINIO_ROOT_USER=sh("oc get -n minio secret minio-root-user -o template --template '{{.data.MINIO_ROOT_USER}}'", stdout=subprocess.PIPE).stdout.strip()
-            MINIO_ROOT_USER = "AWS_ACCESS_KEY_ID"
-            # MINIO_ROOT_PASSWORD=sh("oc get -n minio secret minio-root-user -o template --template '{{.data.MINIO_ROOT_PASSWORD}}'", stdout=subprocess.PIPE).stdout.strip()
-            MINIO_ROOT_PASSWORD = "AWS_SECRET_ACCESS_KEY"
-            # MINIO_HOST="https://" + sh("oc get -n minio route minio-s3 -o template --template '{{.spec.host}}'", stdout=subprocess.PIPE).stdout.strip()
-            MINIO_HOST = "https://minio.apps.127.0.0.1.sslip.io"
-
-            s3 = boto3.client("s3",
-                              endpoint_url=MINIO_HOST,
-                              aws_access_key_id=MINIO_ROOT_USER,
-                              aws_secret_access_key=MINIO_ROOT_PASSWORD,
-                              verify=False)
-            bucket = 'ods-ci-ds-pipelines'
-            print('creating ods-ci-ds-pipelines bucket')
-            if bucket not in [bu["Name"] for bu in s3.list_buckets()["Buckets"]]:
-                s3.create_bucket(Bucket=bucket)
-            bucket = 'ods-ci-s3'
-            print('creating ods-ci-s3 bucket')
-            if bucket not in [bu["Name"] for bu in s3.list_buckets()["Buckets"]]:
-                s3.create_bucket(Bucket=bucket)
-
-        tf.defer(None, create_buckets)
-
-    with gha_log_group("Login to ArgoCD"):
-        sh("kubectl config set-context --current --namespace=argocd")
-        # ArgoCD pods may still be starting (slow image pulls); wait until they are Available so
-        # login / cluster-add do not race a not-yet-ready server.
-        sh("kubectl wait --for=condition=Available deployment --all -n argocd --timeout=180s")
-        # Log in to argocd-server through the Istio gateway (components/01-argocd/httproute.yaml)
-        # rather than core mode: core mode's ephemeral repo-server port-forward is fragile under
-        # load (mux: server closed). https://github.com/jiridanek/rhoai-in-kind/issues/40
-        # `set +x` in the inner shell keeps the admin password out of the `set -x` trace.
-        sh(
-            f"""timeout {ARGOCD_TIMEOUT} bash -c '
-                set +x
-                pw=$(kubectl -n argocd get secret argocd-initial-admin-secret -o jsonpath="{{.data.password}}" | base64 --decode)
-                while ! argocd login argocd.apps.127.0.0.1.sslip.io --username admin --password "$pw" --grpc-web --insecure; do sleep 2; done
-            '"""
-        )
-        # No `argocd cluster add` needed: every Application targets the in-cluster endpoint
-        # (https://kubernetes.default.svc). Registering the external kind-kind context would also
-        # fail in server mode, because argocd-server (in-pod) cannot reach its host-only
-        # 127.0.0.1:6443 to validate the cluster.
+
+    # the buckets are created through the gateway route
+    @plan.step("Create Minio buckets", needs=["Install Minio", "Wait for Gateway"])
+    def create_buckets():
+        readiness.wait(deployment_available("minio", labels={"app": "minio"}), timeout=120)
+        try:
+            import boto3
+        except ImportError:
+            python = sys.executable
+            # python = "/opt/homebrew/bin/python3"
+            sh(f"{python} -m pip install boto3")
+            import boto3
+
+        # MINIO_ROOT_USER=sh("oc get -n minio secret minio-root-user -o template --template '{{.data.MINIO_ROOT_USER}}'", stdout=subprocess.PIPE).stdout.strip()
+        MINIO_ROOT_USER = "AWS_ACCESS_KEY_ID"
+        # MINIO_ROOT_PASSWORD=sh("oc get -n minio secret minio-root-user -o template --template '{{.data.MINIO_ROOT_PASSWORD}}'", stdout=subprocess.PIPE).stdout.strip()
+        MINIO_ROOT_PASSWORD = "AWS_SECRET_ACCESS_KEY"
+        # MINIO_HOST="https://" + sh("oc get -n minio route minio-s3 -o template --template '{{.spec.host}}'", stdout=subprocess.PIPE).stdout.strip()
+        MINIO_HOST = "https://minio.apps.127.0.0.1.sslip.io"
+
+        s3 = boto3.client("s3",
+                          endpoint_url=MINIO_HOST,
+                          aws_access_key_id=MINIO_ROOT_USER,
+                          aws_secret_access_key=MINIO_ROOT_PASSWORD,
+                          verify=False)
+        bucket = 'ods-ci-ds-pipelines'
+        print('creating ods-ci-ds-pipelines bucket')
+        if bucket not in [bu["Name"] for bu in s3.list_buckets()["Buckets"]]:
+            s3.create_bucket(Bucket=bucket)
+        bucket = 'ods-ci-s3'
+        print('creating ods-ci-s3 bucket')
+        if bucket not in [bu["Name"] for bu in s3.list_buckets()["Buckets"]]:
+            s3.create_bucket(Bucket=bucket)
 
     # actually needed, did something that DSP Workbenches dashboard tab won't load without
-    with gha_log_group("Install KF Pipelines"):
+    @plan.step("Install KF Pipelines", needs=[
+        "Configure Argo applications",
+        "Wait for Kyverno policies",
+    ], inputs=[
+        COMPONENTS / "03-kf-pipelines.yaml",
+        COMPONENTS / "02-kyverno" / "dspa-pipelinestore-policy.yaml",
+    ], check=still(
+        deployment_available(REDHAT_ODS_APPLICATIONS, labels={"app.kubernetes.io/name": "data-science-pipelines-operator"}),
+        clusterpolicy_ready("force-dspa-pipelinestore-database"),
+    ))
+    def install_kf_pipelines():
         # dspa is looking up configmaps in this namespace
         # sh("kubectl create namespace openshift-config-managed --dry-run=client -o yaml | kubectl apply -f -")
 
-        sh(f"timeout {ARGOCD_TIMEOUT} bash -c 'while ! argocd app sync kf-pipelines; do sleep 1; done'")
+        sync_application(client, readiness, "kf-pipelines", timeout=ARGOCD_SYNC_TIMEOUT)
 
-        # wait for argocd to sync the application
-        # wait for deployment as it is more robust
-        tf.defer(None, lambda _: sh(
-            f"oc wait --for=condition=Available deployment -l app.kubernetes.io/name=data-science-pipelines-operator -n {REDHAT_ODS_APPLICATIONS} --timeout=120s"))
+        # the sync is done once argocd applied the manifests, the operator then still has to start
+        tf.defer(None, lambda _: readiness.wait(
+            deployment_available(REDHAT_ODS_APPLICATIONS, labels={"app.kubernetes.io/name": "data-science-pipelines-operator"}),
+            timeout=120), name="wait for data-science-pipelines-operator")
 
         # Only reachable once the sync above has installed DSPO's CRDs. Applying this any
         # earlier (e.g. alongside "Install Kyverno policies") races Kyverno's GVK/GVR
         # resolution for the DataSciencePipelinesApplication kind and was observed to block
         # the readiness wait for every ClusterPolicy, not just this one (PR #70).
-        sh("timeout 30s bash -c 'while ! kubectl apply -f components/02-kyverno/dspa-pipelinestore-policy.yaml; do sleep 1; done'")
-        tf.defer(None, lambda _: sh("oc wait --for=condition=Ready clusterpolicy/force-dspa-pipelinestore-database"))
-
-    with gha_log_group("Install KF Notebooks"):
-        sh("kubectl apply -k components/09-kf-notebooks")
-        tf.defer(None, lambda _: sh(
-            f"oc wait --for=condition=Available deployment -l app=notebook-controller -n {REDHAT_ODS_APPLICATIONS} --timeout=120s"))
-        tf.defer(None, lambda _: sh(
-            f"oc wait --for=condition=Available deployment -l app=odh-notebook-controller -n {REDHAT_ODS_APPLICATIONS} --timeout=120s"))
-        tf.defer(None, lambda _: wait_for_webhook_service_endpoint(namespace=REDHAT_ODS_APPLICATIONS))
-
-    with gha_log_group("Install Workbenches"):
+        retry_sh("kubectl apply -f components/02-kyverno/dspa-pipelinestore-policy.yaml", timeout=30)
+        tf.defer(None, lambda _: readiness.wait(clusterpolicy_ready("force-dspa-pipelinestore-database"), timeout=30),
+                 name="wait for force-dspa-pipelinestore-database policy")
+
+    @plan.step("Install KF Notebooks", needs=["Wait for Kyverno policies"], inputs=[COMPONENTS / "09-kf-notebooks"],
+               check=still(
+                   deployment_available(REDHAT_ODS_APPLICATIONS, labels={"app": "notebook-controller"}),
+                   deployment_available(REDHAT_ODS_APPLICATIONS, labels={"app": "odh-notebook-controller"}),
+               ))
+    def install_kf_notebooks():
+        sh(f"kubectl apply -f {renders.local('components/09-kf-notebooks')}")
+        tf.defer(None, lambda _: readiness.wait(
+            deployment_available(REDHAT_ODS_APPLICATIONS, labels={"app": "notebook-controller"}),
+            timeout=120), name="wait for notebook-controller")
+        tf.defer(None, lambda _: readiness.wait(
+            deployment_available(REDHAT_ODS_APPLICATIONS, labels={"app": "odh-notebook-controller"}),
+            timeout=120), name="wait for odh-notebook-controller")
+        tf.defer(None, lambda _: wait_for_webhook_service_endpoint(namespace=REDHAT_ODS_APPLICATIONS, readiness=readiness),
+                 name="wait for odh-notebook-controller webhook endpoint")
+
+    # Kyverno's imagestream-status policy fills in the status of the imagestreams
+    @plan.step("Install Workbenches", needs=["Wait for Kyverno policies"], inputs=[workbench_branch],
+               check=still(imagestream_resolved(REDHAT_ODS_APPLICATIONS, "jupyter-minimal-notebook")))
+    def install_workbenches():
         # error unmarshaling JSON: while decoding JSON: json: unknown field "apiGroup"
         # kustomize_version="5.0.3"
         # with tempfile.TemporaryDirectory() as tmp_dir:
@@ -294,13 +439,11 @@ def main():
         #     sh(f'"{kustomize_bin}" version')
         #     sh(f"{kustomize_bin} build components/08-workbenches | kubectl apply -f -")
 
-        # we don't have permissions to pull from quay.io/rhoai
-        # workbench_repo = "https://github.com/red-hat-data-services/notebooks"
-        workbench_repo = "https://github.com/opendatahub-io/notebooks"
-        sh(f"kubectl apply -k '{workbench_repo}//manifests/base/?timeout=90s&ref={workbench_branch}&depth=1&submodules=false' --namespace {REDHAT_ODS_APPLICATIONS}",
-           env={"GIT_LFS_SKIP_SMUDGE": "1"})
+        sh(f"kubectl apply -f {render_workbenches()} --namespace {REDHAT_ODS_APPLICATIONS}")
 
-    with gha_log_group("Alias minimal workbench imagestream to the downstream name"):
+    @plan.step("Alias minimal workbench imagestream to the downstream name", needs=["Install Workbenches"],
+               check=still(imagestream_resolved(REDHAT_ODS_APPLICATIONS, "s2i-minimal-notebook")))
+    def alias_minimal_workbench_imagestream():
         # opendatahub-tests' workbench tests request the downstream image name
         # `s2i-minimal-notebook` (opendatahub-tests tests/workbenches/conftest.py:44; the
         # distribution is derived from our DSC release.name "OpenShift AI Self-Managed" =>
@@ -309,18 +452,14 @@ def main():
         # (SetContainerImageFromRegistry) resolves the workbench image from this imagestream's
         # status.tags[].dockerImageReference. This is the only imagestream the tests reference.
         # https://github.com/jiridanek/rhoai-in-kind/issues/48
-        import json
 
         # status.tags[].items[].dockerImageReference is filled in by the best-effort
         # mutate-imagestream-add-simplified-status Kyverno policy, so don't assume it is present
         # the instant the workbench manifests apply — wait until the source has a resolved
         # reference, otherwise the alias could be created without a resolvable workbench image.
-        sh(
-            f"""timeout 120s bash -c 'while [ -z "$(kubectl -n {REDHAT_ODS_APPLICATIONS} get imagestream jupyter-minimal-notebook -o jsonpath="{{.status.tags[*].items[*].dockerImageReference}}" 2>/dev/null)" ]; do sleep 2; done'"""
-        )
-        src = json.loads(sh(
-            f"kubectl -n {REDHAT_ODS_APPLICATIONS} get imagestream jupyter-minimal-notebook -o json",
-            capture_output=True).stdout)
+        readiness.wait(imagestream_resolved(REDHAT_ODS_APPLICATIONS, "jupyter-minimal-notebook"), timeout=120)
+        src = client.get(client.resource_path("image.openshift.io/v1", "ImageStream", REDHAT_ODS_APPLICATIONS,
+                                              "jupyter-minimal-notebook"))
         labels = {
             k: v for k, v in (src["metadata"].get("labels") or {}).items()
             # don't advertise the alias as a dashboard workbench image, or it shows up as a
@@ -336,16 +475,20 @@ def main():
         }
         # carry over the (now-resolved) status.tags so the alias resolves regardless of whether
         # the Kyverno mutation fires again on this create.
-        sh("kubectl apply -f -", input=json.dumps(src))
+        ApplyBatch(client).add(src).apply()
 
-    with gha_log_group("Install Service CA Operator"):
+    @plan.step("Install Service CA Operator", needs=["Wait for Kyverno policies"], inputs=[COMPONENTS / "05-ca-operator"])
+    def install_service_ca_operator():
         sh("kubectl label node --all node-role.kubernetes.io/master=")
-        sh("timeout 30s bash -c 'while ! kubectl apply -k components/05-ca-operator; do sleep 1; done'")
+        retry_sh(f"kubectl apply -f {renders.local('components/05-ca-operator')}", timeout=30)
 
-    with gha_log_group("Install fake oauth-server"):
-        sh("kubectl apply -k components/oauth-server")
+    @plan.step("Install fake oauth-server", needs=["Wait for Kyverno policies"], inputs=[COMPONENTS / "oauth-server"])
+    def install_fake_oauth_server():
+        sh(f"kubectl apply -f {renders.local('components/oauth-server')}")
 
-    with gha_log_group("Create users"):
+    @plan.step("Create users", needs=["Install fake oauth-server"])
+    def create_users():
+        batch = ApplyBatch(client)
         for username in [
             # ods-ci users
             "htpasswd-cluster-admin-user", "admin-user", "ldap-admin1", "ldap-user1", "ldap-user2", "ldap-admin2", "ldap-user9",
@@ -353,27 +496,46 @@ def main():
             # foo-user,
             "contributor-username", "adminuser",
         ]:
-            sh(f"kubectl create serviceaccount -n oauth-server {username} --dry-run=client -o yaml | kubectl apply -f -")
+            batch.add(service_account("oauth-server", username))
             # the full SA name is something like `system:serviceaccount:oauth-server:ldap-user2`
-            sh(f"kubectl create clusterrolebinding -n oauth-server {username} --clusterrole cluster-admin --user={username} --serviceaccount=oauth-server:{username} --dry-run=client -o yaml | kubectl apply -f -")
-
-    with gha_log_group("Install ODH Dashboard"):
+            batch.add(cluster_role_binding(username, "cluster-admin", users=[username],
+                                           service_accounts=[f"oauth-server:{username}"]))
+        batch.apply()
+
+    @plan.step("Install ODH Dashboard", needs=[
+        "Configure Argo applications",
+        "Wait for Kyverno policies",
+    ], inputs=[COMPONENTS / "04-odh-dashboard.yaml"], check=still(
+        deployment_available(REDHAT_ODS_APPLICATIONS, labels={"app": "rhods-dashboard"}),
+    ))
+    def install_odh_dashboard():
         # was getting a CRD missing error, somehow argo was not waiting to establish OdhDocument?
-        sh(f"timeout {ARGOCD_TIMEOUT} bash -c 'while ! argocd app sync odh-dashboard; do sleep 1; done'")
-        tf.defer(None, lambda _: sh(
-            f"kubectl wait --for=condition=Available deployment -l app=rhods-dashboard -n {REDHAT_ODS_APPLICATIONS} --timeout=120s"))
-        # wait for webpage availability
-        tf.defer(None, lambda _: sh('''timeout 60s bash -c 'while ! curl -k "https://rhods-dashboard.127.0.0.1.sslip.io/"; do sleep 2; done' '''))
+        sync_application(client, readiness, "odh-dashboard", timeout=ARGOCD_SYNC_TIMEOUT)
 
-    with gha_log_group("Set fake DSC and DSCI"):
-        sh("kubectl apply -f components/07-dsc-dsci.yaml --server-side")
-        # need status for dashboard resource otherwise notebook controller will not fill dashboard link for dspa secret
-        sh("kubectl apply -f components/07-dsc-dsci.yaml --server-side --subresource=status || true")
+        def wait_for_dashboard(_):
+            readiness.wait(deployment_available(REDHAT_ODS_APPLICATIONS, labels={"app": "rhods-dashboard"}), timeout=120)
+            # wait for webpage availability
+            retry_sh('curl -k "https://rhods-dashboard.127.0.0.1.sslip.io/"', timeout=60)
 
-    with gha_log_group("Install local-path provisioner"):
-        sh("kubectl apply -f https://raw.githubusercontent.com/rancher/local-path-provisioner/v0.0.33/deploy/local-path-storage.yaml")
-        tf.defer(None, lambda _: sh(
-            "kubectl wait deployments --all --namespace=local-path-storage --for=condition=Available --timeout=100s"))
+        tf.defer(None, wait_for_dashboard)
+
+    # after the Dashboard, as in the sequential deploy: the operator-side components read these objects
+    @plan.step("Set fake DSC and DSCI", needs=[
+        "Deploy fake CRDs", f"Run kubectl create namespaces {REDHAT_ODS_APPLICATIONS}", "Install ODH Dashboard",
+    ], inputs=[COMPONENTS / "07-dsc-dsci.yaml"])
+    def set_fake_dsc_and_dsci():
+        sh("kubectl apply -f components/07-dsc-dsci.yaml --server-side")
+        # need status for dashboard resource otherwise notebook controller will not fill dashboard link for dspa secret;
+        # the Dashboard is the only one of these kinds with a status subresource, the others took their status above
+        sh("kubectl apply -f components/07-dsc-dsci.yaml --server-side --subresource=status"
+           " --selector platform.opendatahub.io/part-of=datasciencecluster")
+
+    @plan.step("Install local-path provisioner", needs=["Wait for Kyverno policies"],
+               inputs=[LOCAL_PATH_PROVISIONER_VERSION], check=still(deployment_available("local-path-storage")))
+    def install_local_path_provisioner():
+        sh(f"kubectl apply -f {cache.fetch(artifacts['local-path-provisioner'])}")
+        tf.defer(None, lambda _: readiness.wait(deployment_available("local-path-storage"), timeout=100),
+                 name="wait for local-path provisioner")
         # https://kubernetes.io/docs/tasks/administer-cluster/change-default-storage-class/
         sh("kubectl get storageclass")
         # kubectl patch storageclass local-path -p '{"metadata": {"annotations":{"storageclass.kubernetes.io/is-default-class":"true"}}}'
@@ -382,9 +544,64 @@ def main():
         # and the above delivers, so nothing more to do here
         # most importantly, don't create another `storageclass.kubernetes.io/is-default-class: "true"` thing or the above command returns both, space separated
 
-    with gha_log_group("Run deferred functions"):
-        with tf:
-            pass
+    bundles = BundleStore()
+    bundle = None
+    export = args.export_bundle
+    if args.from_bundle or export:
+        # what the steps set up is fixed by their code and inputs, so is a bundle exported after them
+        plan_fingerprint = plan.fingerprint()
+    if args.from_bundle:
+        bundle = bundles.lookup(plan_fingerprint)
+        if bundle is None:
+            print(f"No golden bundle for these inputs in {bundles.root}, deploying step by step and exporting one")
+            export = True
+        else:
+            for step in plan.steps.values():
+                step.enabled = step.enabled and step.name in BUNDLE_STEPS
+
+    # loads the images the steps are going to run, roughly in the order the steps need them
+    prefetcher = contextlib.nullcontext()
+    if args.prefetch_images != "off" and bundle is not None:
+        prefetcher = ImagePrefetcher(LOADERS[args.prefetch_images](), jobs=args.jobs)
+        for image in bundle.images():
+            prefetcher.submit(image)
+    elif args.prefetch_images != "off":
+        prefetcher = ImagePrefetcher(LOADERS[args.prefetch_images](), jobs=args.jobs).start([
+            lambda: renders.local("components/01-argocd"),
+            lambda: renders.local("components/02-kyverno"),
+            lambda: cache.fetch(artifacts["cert-manager"]),
+            lambda: renders.local("components/api-extension"),
+            lambda: renders.local("components/05-ca-operator"),
+            lambda: renders.local("components/oauth-server"),
+            lambda: cache.fetch(artifacts["local-path-provisioner"]),
+            lambda: renders.local("components/09-kf-notebooks"),
+            lambda: COMPONENTS / "10-minio" / "deploy.yaml",
+            # Argo CD Applications, rendered after everything else
+            lambda: COMPONENTS / "03-kf-pipelines.yaml",
+            lambda: COMPONENTS / "04-odh-dashboard.yaml",
+            # workbench images are the largest and only needed once tests start a workbench
+            render_workbenches,
+        ], renders=renders)
+
+    try:
+        with readiness, prefetcher:
+            if bundle is not None:
+                bundle.apply(client, readiness, jobs=args.jobs)
+            plan.run(jobs=args.jobs, checkpoints=checkpoints, resume=args.resume)
+
+            # readiness checks that no other step depends on are only waited for at the very end
+            with gha_log_group("Run deferred functions"):
+                with tf:
+                    pass
+
+        if export:
+            with gha_log_group("Export golden bundle"):
+                bundles.store(export_bundle(client, plan_fingerprint, jobs=max(args.jobs, 8)))
+    finally:
+        # a trace of a failed deploy is the most useful one
+        tracer.print_summary()
+        retries.print_summary()
+        tracer.write_chrome_trace(args.trace)
 
 
 if __name__ == "__main__":
@@ -1,81 +1,33 @@
 #!/usr/bin/env python3
 import argparse
+import codecs
+import concurrent.futures
 import contextlib
 import dataclasses
+import functools
 import logging
 import os
+import pathlib
+import re
 import shutil
-import subprocess
 import sys
 import time
-from typing import Callable, Dict, Any, List
+from typing import Callable, Iterable, Iterator, TextIO
+
+# rhoai_in_kind lives in ../src, see deploy.py
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "src"))
+
+from rhoai_in_kind.bundle import Bundle, DirectoryBundle, TarBundle
+from rhoai_in_kind.discovery import DiscoveryCache, discover
+from rhoai_in_kind.kube import METADATA_ONLY, ApiError, KubeClient, dump_yaml
+from rhoai_in_kind.snapshot import Snapshot, SnapshotRecorder
 
 """
 TODO:
 * kubectl describe
-* kubectl logs --previous
 * must-gather
 """
 
-def run_command[**P](
-        command: str, command_args: list[str],
-        runner: Callable[P, subprocess.CompletedProcess[str]] = subprocess.run,
-        check: bool = False,
-        **kwargs: P.kwargs
-) -> str:
-    """
-    Runs a command using subprocess.run, forwarding keyword arguments.
-
-    Args:
-        command: The base command (e.g., "kubectl").
-        command_args: A list of arguments for the command.
-        runner: The function to use for running the command (defaults to subprocess.run).
-        **kwargs: Keyword arguments to pass directly to the runner function.
-                  These should match the valid keyword arguments for the runner (e.g., subprocess.run).
-
-    Returns:
-        The standard output of the command as a string, stripped of leading/trailing whitespace.
-
-    Exits:
-        If the command fails (non-zero exit code) or the command is not found.
-    """
-    full_command = [command] + command_args
-    try:
-        # Pass kwargs directly to the runner
-        # Ensure text=True and stdout=subprocess.PIPE are defaults unless overridden
-        merged_kwargs = {'text': True, 'stdout': subprocess.PIPE, **kwargs}
-
-        result = runner(args=full_command, **merged_kwargs)
-        result.check_returncode()  # Explicitly check return code
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print(f"Error executing command: {' '.join(full_command)}")
-        print(f"Return code: {e.returncode}")
-        # It's useful to see stdout/stderr on error
-        if e.stdout:
-            print(f"Stdout:\n{e.stdout.strip()}")
-        if e.stderr:
-            print(f"Stderr:\n{e.stderr.strip()}")
-        if check:
-            sys.exit(e.returncode)  # Exit with the command's return code
-        return e.stdout.strip()
-    except FileNotFoundError:
-        print(f"Error: '{command}' command not found. Please ensure {command} is installed and in your PATH.")
-        sys.exit(1)
-    except Exception as e:
-        print(f"An unexpected error occurred while running command {' '.join(full_command)}: {e}")
-        sys.exit(1)
-
-
-def run_kubectl_command(command_args: list[str], **kwargs: Dict[str, Any]) -> str:
-    """
-    Runs a kubectl command and returns its stdout.
-    Exits if the command fails.
-    Forwards kwargs to run_command (and thus subprocess.run).
-    """
-    return run_command("kubectl", command_args, **kwargs)
-
-
 def sanitize_filename(name: str):
     """Sanitizes a string to be a valid filename."""
     return ''.join(c if c.isalnum() or c in ['-', '_', '.'] else '_' for c in name)
@@ -97,274 +49,605 @@ class Resource:
     api_version: str
     kind: str
 
-def discover_api_resources() -> tuple[list[Resource], list[Resource]]:
+def discover_api_resources(client: KubeClient, cache: DiscoveryCache | None = None
+                           ) -> tuple[list[Resource], list[Resource]]:
     """
-    Discovers available API resources using 'kubectl api-resources'.
+    Discovers the resource types that can be listed, from the (cached) aggregated discovery documents.
 
     Returns:
         A tuple containing two lists: (cluster_scoped_types, namespaced_types).
     """
     print("Discovering API resources...")
-    output = run_kubectl_command(["api-resources", "--no-headers=true", "-o", "wide"])
-
     cluster_scoped_types = []
     namespaced_types = []
-
-    # Parse the output (assuming standard wide format: NAME SHORTNAMES APIVERSIONS NAMESPACED KIND)
-    # We need the first column (NAME) and the fourth column (NAMESPACED)
-    for line in output.splitlines():
-        if not line.strip():
-            continue
-        # Split by whitespace, handle potential multiple spaces
-        parts = line.split()
-        if len(parts) < 5:  # Expect at least 5 columns in wide output
-            print(f"Skipping unexpected line format from api-resources: {line}", file=sys.stderr)
-            continue
-
-        resource_name = parts[0]
-        api_version = parts[2]
-        is_namespaced_str = parts[3].lower()  # 'true' or 'false'
-
-        # Skip known problematic or overly verbose types if necessary
-        # Example: "events.events.k8s.io" might be redundant if "events" is collected
-        # Or skip specific CRDs you don't need
-        # if resource_name in ["events.events.k8s.io"]:
-        #     continue
-
-        resource = Resource(api_version=api_version, kind=resource_name)
-        if is_namespaced_str == 'true':
+    for api_resource in discover(client, cache, verb="list"):
+        resource = Resource(api_version=api_resource.api_version, kind=api_resource.resource)
+        if api_resource.namespaced:
             namespaced_types.append(resource)
-        elif is_namespaced_str == 'false':
+        else:
             cluster_scoped_types.append(resource)
-        # else: unexpected value in NAMESPACED column
 
     print(
         f"Discovered {len(cluster_scoped_types)} cluster-scoped and {len(namespaced_types)} namespaced resource types.")
     return cluster_scoped_types, namespaced_types
 
 
-def collect_kubernetes_resources(output_dir="ci-debug-bundle"):
+def resource_path(resource: Resource, namespace: str | None = None) -> str:
+    """Returns the API path that lists the given resource type, within a namespace if given."""
+    path = "/api/v1" if resource.api_version == "v1" else f"/apis/{resource.api_version}"
+    if namespace:
+        path += f"/namespaces/{namespace}"
+    return f"{path}/{resource.kind}"
+
+
+@dataclasses.dataclass(frozen=True)
+class Paging:
+    """How resource lists are fetched: `page_size` objects per request, and never more than
+    `max_page_bytes` of response in memory at once (pages that are larger are fetched again, smaller)."""
+    page_size: int = 500
+    max_page_bytes: int | None = 32 * 1024 * 1024
+
+
+def list_resource_items(client: KubeClient, resource: Resource, paging: Paging,
+                        namespace: str | None = None, accept: str = "application/json") -> Iterator[dict]:
     """
-    Collects Kubernetes resource definitions (YAML) from the cluster.
+    Yields the objects of a resource type page by page, the way `kubectl get --ignore-not-found` lists them.
 
-    Args:
-        output_dir (str): Base directory to save resources.
+    Yields nothing if the type does not exist (any more) or cannot be listed.
     """
-    print(f"Starting resource collection into '{output_dir}'...")
+    pages = client.list_pages(resource_path(resource, namespace), limit=paging.page_size,
+                              max_page_bytes=paging.max_page_bytes, accept=accept)
+    try:
+        for page in pages:
+            yield from page.get("items") or []
+    except ApiError as e:
+        if e.status in (404, 405):  # the type went away, or it cannot be listed
+            return
+        raise
 
-    cluster_scoped_dir = os.path.join(output_dir, "cluster-scoped-resources")
-    namespaces_dir = os.path.join(output_dir, "namespaces")
 
-    os.makedirs(cluster_scoped_dir, exist_ok=True)
-    os.makedirs(namespaces_dir, exist_ok=True)
+# when more than this many objects of a type changed, and more than this share of them, listing the type
+# again takes fewer requests than getting every changed object on its own
+REFETCH_MIN_CHANGED = 16
+REFETCH_RATIO = 0.25
 
-    # --- Discover Resource Types Dynamically ---
-    cluster_scoped_types, namespaced_types = discover_api_resources()
 
-    # --- Collect Cluster-Scoped Resources ---
-    print("\nCollecting cluster-scoped resources...")
-    for resource_type in cluster_scoped_types:
-        print(f"  Collecting {resource_type.kind}...")
-        try:
-            # Use --ignore-not-found to skip types that don't exist in the cluster
-            # Use --chunk-size=0 to attempt to get all items in one go for large clusters
-            output = run_kubectl_command(
-                ["get", resource_type.kind, "-o", "yaml", "--ignore-not-found=true", "--chunk-size=0"])
-            if not output.strip():
-                # print(f"    No {resource_type} found or type does not exist.") # Can be noisy
-                continue
+def list_changed_items(client: KubeClient, resource: Resource, paging: Paging, snapshot: SnapshotRecorder,
+                       namespace: str | None = None) -> Iterator[dict]:
+    """
+    Yields the objects of a resource type that changed since the previous snapshot, and records all of them.
 
-            api_version = resource_type.api_version
-            kind = resource_type.kind
-            api_group = get_api_group_from_apiversion(api_version)
+    Without a previous snapshot every object counts as changed. With one, only the metadata is
+    listed; the objects whose resourceVersion differs are then fetched one by one, or listed again
+    in full if there are many of them.
+    """
+    resource_type = f"{resource.kind} {resource.api_version}"
+    refetch = True
+    if snapshot.incremental:
+        metadata = [item["metadata"] for item in
+                    list_resource_items(client, resource, paging, namespace, accept=METADATA_ONLY)]
+        changed, unchanged = [], []
+        for m in metadata:
+            (changed if snapshot.changed(resource_type, m) else unchanged).append(m)
+        refetch = len(changed) > REFETCH_MIN_CHANGED and len(changed) > REFETCH_RATIO * len(metadata)
+
+    if refetch:
+        for obj in list_resource_items(client, resource, paging, namespace):
+            written = snapshot.changed(resource_type, obj["metadata"])
+            snapshot.record(resource_type, obj["metadata"], written)
+            if written:
+                yield obj
+    else:
+        for m in unchanged:
+            snapshot.record(resource_type, m, written=False)
+        for m in changed:
+            try:
+                obj = client.get(f"{resource_path(resource, m.get('namespace'))}/{m['name']}")
+            except ApiError as e:
+                if e.status == 404:  # deleted since it was listed
+                    continue
+                raise
+            snapshot.record(resource_type, obj["metadata"], written=True)
+            yield obj
+    snapshot.listed(resource_type, namespace)
 
-            # Create directory structure: cluster-scoped-resources/<api_group>/<kind>.yaml
-            resource_type_dir = os.path.join(cluster_scoped_dir, sanitize_filename(api_group))
-            os.makedirs(resource_type_dir, exist_ok=True)
 
-            file_path = os.path.join(resource_type_dir, f"{sanitize_filename(kind.lower())}.yaml")
-            with open(file_path, "w") as f:
-                f.write(output)
-            # print(f"    Saved {kind} '{name}'") # Optional: print each saved resource
-        except SyntaxError | TypeError | ValueError:
-            raise
-        except Exception as e:
-            print(f"    An unexpected error occurred collecting {resource_type}: {e}", file=sys.stderr)
+def _saved(count: int, snapshot: SnapshotRecorder, where: str) -> str:
+    if not count:
+        return "none changed" if snapshot.incremental else "none found"
+    return f"saved {count} objects {where}"
 
-    # --- Collect Namespaced Resources ---
-    print("\nCollecting namespaced resources...")
-    namespaces_output = run_kubectl_command([
-        "get", "namespaces",
-        "-o", "jsonpath={.items[*].metadata.name}"
-    ])
-    all_namespaces = namespaces_output.split() if namespaces_output else []
 
-    if not all_namespaces:
-        print("No namespaces found in the cluster. Skipping namespaced resource collection.")
-        return
+def kubectl_view(obj: dict) -> dict:
+    """The object as `kubectl get -o yaml` shows it, without `metadata.managedFields`."""
+    metadata = obj.get("metadata") or {}
+    if "managedFields" not in metadata:
+        return obj
+    return {**obj, "metadata": {k: v for k, v in metadata.items() if k != "managedFields"}}
 
-    for namespace in all_namespaces:
-        print(f"  Collecting resources for namespace: {namespace}")
-        namespace_output_dir = os.path.join(namespaces_dir, sanitize_filename(namespace))
-        os.makedirs(namespace_output_dir, exist_ok=True)
 
-        # Save the namespace definition itself
-        try:
-            # NOTE: this may fail if namespace was terminating
-            ns_yaml = run_kubectl_command(["get", "namespace", namespace, "-o", "yaml"])
-            with open(os.path.join(namespace_output_dir, f"{sanitize_filename(namespace)}.yaml"), "w") as f:
-                f.write(ns_yaml)
-        except Exception as e:
-            print(f"    Error collecting namespace definition for {namespace}: {e}", file=sys.stderr)
+class ListYamlWriter:
+    """
+    Writes objects to a file in the bundle one at a time as a YAML List, byte for byte the way
+    `kubectl get -o yaml` formats them, without the trailing newline, as these files always were.
 
-        for resource_type in namespaced_types:
-            print(f"    Collecting {resource_type.kind} in {namespace}...")  # Can be noisy
-            try:
-                # Use --ignore-not-found to skip types that don't exist in the namespace or cluster
-                # Use --chunk-size=0 for large namespaces
-                output = run_kubectl_command(
-                    ["get", resource_type.kind, "-n", namespace, "-o", "yaml", "--ignore-not-found=true", "--chunk-size=0"])
+    The file is only created once the first object is written, so listing a type without
+    objects leaves nothing behind.
+    """
 
-                if not output.strip():
-                    print(f"      No {resource_type.kind} found in {namespace}.")  # Can be noisy
-                    continue
+    HEADER = "apiVersion: v1\nitems:\n"
+    FOOTER = 'kind: List\nmetadata:\n  resourceVersion: ""'
+
+    def __init__(self, bundle: Bundle, file_path: str):
+        self.bundle = bundle
+        self.file_path = file_path
+        self.count = 0
+        self._file: TextIO | None = None
+
+    def write(self, obj: dict):
+        if self._file is None:
+            self._file = self.bundle.open(self.file_path)
+            self._file.write(self.HEADER)
+        self._file.write(dump_yaml([kubectl_view(obj)]))
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.write(self.FOOTER)
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def collect_cluster_scoped_type(client: KubeClient, bundle: Bundle, cluster_scoped_dir: str, resource_type: Resource,
+                                paging: Paging, snapshot: SnapshotRecorder) -> str:
+    """Saves all objects of a cluster-scoped type; returns a short status for the progress log."""
+    api_group = get_api_group_from_apiversion(resource_type.api_version)
+
+    # Create directory structure: cluster-scoped-resources/<api_group>/<kind>.yaml
+    resource_type_dir = os.path.join(cluster_scoped_dir, sanitize_filename(api_group))
+    file_path = os.path.join(resource_type_dir, f"{sanitize_filename(resource_type.kind.lower())}.yaml")
+
+    with ListYamlWriter(bundle, file_path) as writer:
+        for obj in list_changed_items(client, resource_type, paging, snapshot):
+            writer.write(obj)
+    return _saved(writer.count, snapshot, f"to {file_path}")
+
+
+def collect_namespace_definition(client: KubeClient, bundle: Bundle, namespace_output_dir: str, namespace: str) -> str:
+    """Saves the Namespace object itself; returns a short status for the progress log."""
+    # NOTE: this may fail if namespace was terminating
+    ns_yaml = dump_yaml(kubectl_view(client.get(f"/api/v1/namespaces/{namespace}"))).rstrip()
+    file_path = os.path.join(namespace_output_dir, f"{sanitize_filename(namespace)}.yaml")
+    with bundle.open(file_path) as f:
+        f.write(ns_yaml)
+    return f"saved {file_path}"
+
+
+def collect_namespaced_type(client: KubeClient, bundle: Bundle, namespace_output_dir: str, resource_type: Resource,
+                            namespace: str, paging: Paging, snapshot: SnapshotRecorder) -> str:
+    """Saves all objects of a namespaced type in one namespace; returns a short status for the progress log."""
+    file_path = namespaced_yaml_path(namespace_output_dir, resource_type)
+    with ListYamlWriter(bundle, file_path) as writer:
+        for obj in list_changed_items(client, resource_type, paging, snapshot, namespace):
+            writer.write(obj)
+    return _saved(writer.count, snapshot, f"to {file_path}")
+
+
+def collect_namespaced_type_in_all_namespaces(client: KubeClient, bundle: Bundle, namespaces_dir: str,
+                                              resource_type: Resource, paging: Paging,
+                                              snapshot: SnapshotRecorder) -> str:
+    """
+    Lists a namespaced type once across all namespaces and splits the objects into the same
+    per-namespace files that `collect_namespaced_type` writes; returns a short status for the progress log.
+    """
+    writers: dict[str, ListYamlWriter] = {}
+    with contextlib.ExitStack() as stack:
+        for obj in list_changed_items(client, resource_type, paging, snapshot):
+            namespace = obj["metadata"]["namespace"]
+            if namespace not in writers:
+                namespace_output_dir = os.path.join(namespaces_dir, sanitize_filename(namespace))
+                writers[namespace] = stack.enter_context(
+                    ListYamlWriter(bundle, namespaced_yaml_path(namespace_output_dir, resource_type)))
+            writers[namespace].write(obj)
+
+    return _saved(sum(w.count for w in writers.values()), snapshot, f"in {len(writers)} namespaces")
+
+
+def namespaced_yaml_path(namespace_output_dir: str, resource_type: Resource) -> str:
+    """Returns where in the namespace directory a namespaced type's YAML goes."""
+    api_group = get_api_group_from_apiversion(resource_type.api_version)
+
+    # Handle core resources specifically
+    if api_group == "core":
+        resource_type_dir = os.path.join(namespace_output_dir, "core")
+    else:
+        # Structure: namespaces/<namespace>/<api_group>/<kind>s.yaml
+        resource_type_dir = os.path.join(namespace_output_dir, sanitize_filename(api_group))
+
+    return os.path.join(resource_type_dir, f"{sanitize_filename(resource_type.kind.lower())}s.yaml")
 
-                api_version = resource_type.api_version
-                kind = resource_type.kind
-                api_group = get_api_group_from_apiversion(api_version)
 
-                # Handle core resources specifically
-                if api_group == "core":
-                    resource_type_dir = os.path.join(namespace_output_dir, "core")
-                else:
-                    # Structure: namespaces/<namespace>/<api_group>/<kind>s.yaml
-                    resource_type_dir = os.path.join(namespace_output_dir, sanitize_filename(api_group))
+# The priority model: what tells the most about a failed test is collected first, and bulk types
+# that rarely do only with the time budget that is left.
+PRIORITY_KEY = 0  # key types in key namespaces, and the logs of key namespaces
+PRIORITY_HIGH = 1  # key types elsewhere, and everything else in key namespaces
+PRIORITY_NORMAL = 2
+PRIORITY_BULK = 3
 
-                os.makedirs(resource_type_dir, exist_ok=True)
+KEY_TYPES = {"pods", "events", "deployments", "notebooks", "datasciencepipelinesapplications", "imagestreams"}
+BULK_TYPES = {
+    "customresourcedefinitions", "apiservices", "endpoints", "endpointslices", "controllerrevisions", "leases",
+    "csinodes", "csistoragecapacities", "flowschemas", "prioritylevelconfigurations", "componentstatuses",
+    "runtimeclasses", "priorityclasses", "validatingadmissionpolicies", "validatingadmissionpolicybindings",
+}
+KEY_NAMESPACES = ("redhat-ods-applications",)
+# the share of a time budget resources may use; logs get the rest
+RESOURCE_BUDGET_SHARE = 0.6
+# the label of data science projects, which is where the tests create their workbenches and pipelines
+DATA_SCIENCE_PROJECT_LABEL = ("opendatahub.io/dashboard", "true")
+
+
+@dataclasses.dataclass
+class CollectionTask:
+    """
+    One unit of collection work, e.g. a resource type in one namespace.
+    """
+    description: str
+    # tasks are timed per resource type, across all namespaces
+    resource_type: str
+    fn: Callable[[], str]
+    # tasks with a lower priority run first, see `collection_priority`
+    priority: int = PRIORITY_NORMAL
+
+
+def collection_priority(resource: str | None, namespace: str | None, key_namespaces: set[str]) -> int:
+    """
+    Returns the priority of collecting a resource type, or the logs if `resource` is None, in a
+    namespace; `namespace` is None for cluster-scoped types and types listed across all namespaces.
+    """
+    in_key_namespace = namespace in key_namespaces
+    if resource is None:
+        return PRIORITY_KEY if in_key_namespace else PRIORITY_NORMAL
+    if resource in KEY_TYPES:
+        return PRIORITY_KEY if namespace is None or in_key_namespace else PRIORITY_HIGH
+    if in_key_namespace:
+        return PRIORITY_HIGH
+    return PRIORITY_BULK if resource in BULK_TYPES else PRIORITY_NORMAL
+
+
+def find_key_namespaces(namespaces: Iterable[dict], names: Iterable[str] = KEY_NAMESPACES) -> set[str]:
+    """Returns which of the Namespace objects are key namespaces: the ones in `names`, and data science projects."""
+    label, value = DATA_SCIENCE_PROJECT_LABEL
+    return {ns["metadata"]["name"] for ns in namespaces
+            if ns["metadata"]["name"] in names or (ns["metadata"].get("labels") or {}).get(label) == value}
+
+
+def _timed(fn: Callable[[], str], deadline: float | None) -> tuple[str | None, float]:
+    start = time.monotonic()
+    if deadline is not None and start >= deadline:
+        return None, 0.0
+    status = fn()
+    return status, time.monotonic() - start
+
+
+def run_collection_tasks(tasks: list[CollectionTask], jobs: int,
+                         deadline: float | None = None) -> tuple[dict[str, float], list[CollectionTask]]:
+    """
+    Runs collection tasks on a pool of `jobs` threads, by priority, printing progress as they complete.
 
-                file_path = os.path.join(resource_type_dir, f"{sanitize_filename(kind.lower())}s.yaml")
-                with open(file_path, "w") as f:
-                    f.write(output)
-                # print(f"      Saved {kind} '{name}' in {namespace}") # Optional: print each saved resource
-            except SyntaxError | TypeError | ValueError:
+    A failing task is reported and the rest carry on, except for programming errors
+    (SyntaxError, TypeError, ValueError), which are re-raised. Tasks that have not started by the
+    `deadline` (a `time.monotonic()` value) are skipped; the ones running by then finish.
+
+    Returns:
+        Seconds spent collecting each resource type, summed over all its tasks, and the skipped tasks.
+    """
+    timings: dict[str, float] = {}
+    skipped: list[CollectionTask] = []
+    tasks = sorted(tasks, key=lambda task: task.priority)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="collect") as pool:
+        futures = {pool.submit(_timed, task.fn, deadline): task for task in tasks}
+        for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            task = futures[future]
+            try:
+                status, duration = future.result()
+            except (SyntaxError, TypeError, ValueError):
+                pool.shutdown(cancel_futures=True)
                 raise
             except Exception as e:
-                print(f"    An unexpected error occurred collecting {resource_type} in {namespace}: {e}",
+                print(f"  [{done}/{len(tasks)}] An unexpected error occurred collecting {task.description}: {e}",
                       file=sys.stderr)
+                continue
+            if status is None:
+                skipped.append(task)
+                continue
+            timings[task.resource_type] = timings.get(task.resource_type, 0.0) + duration
+            print(f"  [{done}/{len(tasks)}] {task.description}: {status} ({duration:.2f}s)")
+    if skipped:
+        print(f"  Skipped {len(skipped)} of {len(tasks)} tasks, the time budget ran out")
+    return timings, skipped
+
+
+def write_skipped(bundle: Bundle, file_path: str, skipped: list[CollectionTask]):
+    """Records in the bundle what was not collected because the time budget ran out."""
+    if not skipped:
+        return
+    with bundle.open(file_path) as f:
+        f.write(dump_yaml({
+            "reason": "time budget exhausted",
+            "skipped": [{"task": task.description, "priority": task.priority}
+                        for task in sorted(skipped, key=lambda task: (task.priority, task.description))],
+        }))
 
-    print("\nResource collection complete.")
 
+def print_slowest(timings: dict[str, float], count: int = 15):
+    """Prints the resource types that took the longest to collect."""
+    print(f"\nSlowest resource types (of {len(timings)}):")
+    for resource_type, seconds in sorted(timings.items(), key=lambda kv: kv[1], reverse=True)[:count]:
+        print(f"  {seconds:8.2f}s  {resource_type}")
 
-def collect_kubernetes_logs_with_kubectl_subprocess(logs_dir="ci-debug-bundle/logs", log_since="10m",
-                                                    namespace_label="collect_logs=true"):
+
+def collect_kubernetes_resources(output_dir="ci-debug-bundle", client: KubeClient | None = None, jobs: int = 8,
+                                 per_namespace: bool = False, paging: Paging = Paging(), bundle: Bundle | None = None,
+                                 previous: Snapshot | None = None, discovery: DiscoveryCache | None = None,
+                                 deadline: float | None = None, key_namespaces: set[str] | None = None) -> Snapshot:
     """
-    Collects Kubernetes pod logs into structured directories using kubectl via subprocess.
+    Collects Kubernetes resource definitions (YAML) from the cluster.
+
+    With a `previous` snapshot, only the objects that were added or modified since are fetched and
+    written, and `changes.yaml` lists them together with the deleted ones.
 
     Args:
-        logs_dir (str): Base directory to save logs.
-        log_since (str): Duration for logs to collect (e.g., "10m", "1h").
-        namespace_label (str): Label selector for namespaces (e.g., "collect_logs=true").
+        output_dir (str): Base directory to save resources; within `bundle`, if one is given.
+        client (KubeClient): API client to collect with; defaults to one for the current kubeconfig context.
+        jobs (int): How many resource types to collect concurrently.
+        per_namespace (bool): List every namespaced type in every namespace separately, instead of
+            once across all namespaces. Both write the same files; this makes types × namespaces API calls.
+        paging (Paging): Page size and memory ceiling for listing; each of the `jobs` holds at most one page.
+        bundle (Bundle): Where to write the files; defaults to the directory `output_dir`.
+        previous (Snapshot): The snapshot of an earlier collection to collect the changes since.
+        discovery (DiscoveryCache): Where API discovery is cached; defaults to the artifact cache directory.
+        deadline (float): `time.monotonic()` after which no more types are started; `skipped.yaml` lists them.
+        key_namespaces (set): Namespaces collected first; defaults to `find_key_namespaces`.
+
+    Returns:
+        The snapshot of this collection, to collect the next one against.
     """
-    os.makedirs(logs_dir, exist_ok=True)
-    print(f"Starting log collection into '{logs_dir}'...")
+    if bundle is None:
+        bundle, output_dir = DirectoryBundle(output_dir), ""
+    since = f", changes since {previous.name}" if previous else ""
+    print(f"Starting resource collection into {bundle}{since}...")
+    snapshot = SnapshotRecorder(str(bundle), previous)
+    start = time.monotonic()
+    client = client or KubeClient.from_kubeconfig(max_idle_connections=jobs)
 
-    # Get namespaces with the specified label using kubectl
-    # Use --ignore-not-found=true in case the label doesn't match any namespaces
-    namespaces_output = run_kubectl_command([
-        "get", "namespaces",
-        "-l", namespace_label,
-        "-o", "jsonpath={.items[*].metadata.name}",
-        "--ignore-not-found=true"
-    ]).split()
+    cluster_scoped_dir = os.path.join(output_dir, "cluster-scoped-resources")
+    namespaces_dir = os.path.join(output_dir, "namespaces")
 
-    target_namespaces = namespaces_output.split() if namespaces_output else []
+    # --- Discover Resource Types Dynamically ---
+    cluster_scoped_types, namespaced_types = discover_api_resources(client, discovery)
+
+    # --- Cluster-Scoped Resources ---
+    tasks = [
+        CollectionTask(
+            description=resource_type.kind,
+            resource_type=f"{resource_type.kind} {resource_type.api_version}",
+            fn=functools.partial(collect_cluster_scoped_type, client, bundle, cluster_scoped_dir, resource_type,
+                                 paging, snapshot),
+            priority=collection_priority(resource_type.kind, None, set()),
+        )
+        for resource_type in cluster_scoped_types
+    ]
 
-    if not target_namespaces:
-        print(f"No namespaces found with label '{namespace_label}'. Collecting all namespaces.")
-        target_namespaces = run_kubectl_command([
-            "get", "namespaces",
-            "-o", "jsonpath={.items[*].metadata.name}\n"
-        ]).split()
-
-    stern_processes: list[subprocess.Popen] = []  # To keep track of background stern processes
-
-    for namespace in target_namespaces:  # Iterate directly over the list
-        print(f"\nCollecting logs for namespace: {namespace}")
-        namespace_dir = os.path.join(logs_dir, sanitize_filename(namespace))
-        os.makedirs(namespace_dir, exist_ok=True)
-
-        # Get pod names in the current namespace using kubectl
-        # Use --ignore-not-found=true in case there are no pods in the namespace
-        pods_output = run_kubectl_command([
-            "get", "pods",
-            "-n", namespace,
-            "-o", "jsonpath={.items[*].metadata.name}",
-            "--ignore-not-found=true"
-        ])
-
-        target_pods = pods_output.split() if pods_output else []
-
-        if not target_pods:
-            print(f"  No pods found in namespace {namespace}. Skipping log collection for this namespace.")
-            continue
-
-        for pod_name in target_pods:
-            # print(f"    - Collecting logs for pod: {pod_name}") # Can be noisy
-            sanitized_pod_name = sanitize_filename(pod_name)
-            log_file_path = os.path.join(namespace_dir, f"{sanitized_pod_name}.log")
-
-            # Construct the stern command
-            stern_command = [
-                "stern",
-                pod_name,
-                "-n", namespace,
-                "--since", log_since,
-                "--timestamps",
-                "--output", "raw",
-                "--no-follow",
-            ]
+    # --- Namespaced Resources ---
+    namespaces, _ = client.list("/api/v1/namespaces")
+    all_namespaces = [ns["metadata"]["name"] for ns in namespaces]
+    if key_namespaces is None:
+        key_namespaces = find_key_namespaces(namespaces)
+    changed_namespaces = {ns["metadata"]["name"] for ns in namespaces
+                          if snapshot.changed("namespaces v1", ns["metadata"])}
 
-            try:
-                # Start stern as a background process and redirect output
-                # Use a context manager for the file to ensure it's closed
-                with open(log_file_path, "w") as outfile:
-                    # Use subprocess.Popen for background process
-                    process = subprocess.Popen(stern_command, stdout=outfile, stderr=subprocess.STDOUT)
-                    stern_processes.append(process)
-            except FileNotFoundError:
-                print("    Error: 'stern' command not found. Stern must be installed and in your PATH.",
-                      file=sys.stderr)
-                # Exiting immediately is safer if stern is a hard requirement
-                sys.exit(1)
-            except Exception as e:
-                print(f"    Error starting stern for {pod_name} in namespace {namespace}: {e}", file=sys.stderr)
+    if not all_namespaces:
+        print("No namespaces found in the cluster. Skipping namespaced resource collection.")
 
-    if stern_processes:
-        print("\nWaiting for all stern processes to complete...")
-        # Use wait() in a loop to catch potential issues, though wait() on Popen is blocking
-        # A more advanced approach might use select or asyncio, but wait() is simpler here.
-        for i, proc in enumerate(stern_processes):
-            try:
-                proc.wait()
-                # print(f"Stern process {i+1}/{len(stern_processes)} finished.") # Optional progress
-            except Exception as e:
-                print(f"Error waiting for stern process {i + 1}: {e}", file=sys.stderr)
+    for namespace in all_namespaces:
+        namespace_output_dir = os.path.join(namespaces_dir, sanitize_filename(namespace))
 
-    else:
-        print("\nNo stern processes were started for log collection.")
+        # Save the namespace definition itself
+        if namespace in changed_namespaces:
+            tasks.append(CollectionTask(
+                description=f"namespace definition for {namespace}",
+                resource_type="namespaces v1",
+                fn=functools.partial(collect_namespace_definition, client, bundle, namespace_output_dir, namespace),
+                priority=collection_priority("namespaces", namespace, key_namespaces),
+            ))
+        if per_namespace:
+            for resource_type in namespaced_types:
+                tasks.append(CollectionTask(
+                    description=f"{resource_type.kind} in {namespace}",
+                    resource_type=f"{resource_type.kind} {resource_type.api_version}",
+                    fn=functools.partial(collect_namespaced_type, client, bundle, namespace_output_dir,
+                                         resource_type, namespace, paging, snapshot),
+                    priority=collection_priority(resource_type.kind, namespace, key_namespaces),
+                ))
+
+    if all_namespaces and not per_namespace:
+        for resource_type in namespaced_types:
+            tasks.append(CollectionTask(
+                description=f"{resource_type.kind} in all namespaces",
+                resource_type=f"{resource_type.kind} {resource_type.api_version}",
+                fn=functools.partial(collect_namespaced_type_in_all_namespaces, client, bundle, namespaces_dir,
+                                     resource_type, paging, snapshot),
+                priority=collection_priority(resource_type.kind, None, key_namespaces),
+            ))
+
+    print(f"\nCollecting {len(tasks)} resource lists, {jobs} at a time...")
+    timings, skipped = run_collection_tasks(tasks, jobs, deadline)
+    print_slowest(timings)
+    write_skipped(bundle, os.path.join(output_dir, "skipped.yaml"), skipped)
+
+    result, changes = snapshot.finish(all_namespaces)
+    if changes is not None:
+        changes.print_summary()
+        with bundle.open(os.path.join(output_dir, "changes.yaml")) as f:
+            f.write(dump_yaml(changes.summary()))
+
+    print(f"\nResource collection complete in {time.monotonic() - start:.1f}s.")
+    return result
+
+
+def parse_duration(duration: str) -> int:
+    """Converts a duration the way kubectl --since takes it, e.g. "10m" or "1h30m", to seconds."""
+    if not re.fullmatch(r"(\d+[hms])+", duration):
+        raise ValueError(f"Invalid duration {duration!r}, expected e.g. 30s, 10m or 1h30m")
+    units = {"h": 3600, "m": 60, "s": 1}
+    return sum(int(count) * units[unit] for count, unit in re.findall(r"(\d+)([hms])", duration))
+
+
+@dataclasses.dataclass(frozen=True)
+class LogLimits:
+    """How much of a container's log is collected: what was logged in the last `since_seconds` (all of it
+    for the previous container), at most `max_bytes` of it, giving up when a read waits longer than `timeout`."""
+    since_seconds: int | None = 600
+    max_bytes: int = 16 * 1024 * 1024
+    timeout: float = 60.0
+
+
+@dataclasses.dataclass(frozen=True)
+class ContainerLog:
+    """The log of one container, or of its previous instance if it restarted."""
+    namespace: str
+    pod: str
+    container: str
+    previous: bool = False
+
+    @property
+    def api_path(self) -> str:
+        return f"/api/v1/namespaces/{self.namespace}/pods/{self.pod}/log"
+
+    def file_path(self, logs_dir: str) -> str:
+        name = sanitize_filename(self.container) + (".previous" if self.previous else "")
+        return os.path.join(logs_dir, sanitize_filename(self.namespace), sanitize_filename(self.pod), f"{name}.log")
+
+
+def container_logs(pod: dict) -> list[ContainerLog]:
+    """The logs a pod has: each container that is not waiting to start, and the previous instance of
+    each container that restarted."""
+    metadata = pod["metadata"]
+    status = pod.get("status") or {}
+    logs = []
+    for kind in ("initContainerStatuses", "containerStatuses", "ephemeralContainerStatuses"):
+        for container in status.get(kind) or []:
+            if "waiting" not in (container.get("state") or {}):
+                logs.append(ContainerLog(metadata["namespace"], metadata["name"], container["name"]))
+            if container.get("restartCount") or "terminated" in (container.get("lastState") or {}):
+                logs.append(ContainerLog(metadata["namespace"], metadata["name"], container["name"], previous=True))
+    return logs
+
+
+def collect_container_log(client: KubeClient, bundle: Bundle, logs_dir: str, log: ContainerLog,
+                          limits: LogLimits) -> str:
+    """Saves one container log, up to `limits.max_bytes` of it; returns a short status for the progress log."""
+    query = {
+        "container": log.container,
+        "timestamps": "true",
+        "limitBytes": limits.max_bytes,
+        # the previous container may have ended long before, and how it ended is what matters
+        "sinceSeconds": None if log.previous else limits.since_seconds,
+        "previous": "true" if log.previous else None,
+    }
+    file_path = log.file_path(logs_dir)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    size = 0
+    with contextlib.ExitStack() as stack:
+        f = None
+        try:
+            for chunk in client.stream(log.api_path, timeout=limits.timeout, **query):
+                chunk = chunk[:limits.max_bytes - size]
+                if f is None:
+                    f = stack.enter_context(bundle.open(file_path))
+                f.write(decoder.decode(chunk))
+                size += len(chunk)
+                if size >= limits.max_bytes:
+                    f.write(f"\n[log truncated at {limits.max_bytes} bytes]\n")
+                    break
+        except ApiError as e:
+            if e.status in (400, 404):  # not started yet, no previous instance, or the pod is gone
+                return f"not available: {e.body.get('message') or e}"
+            raise
+        except TimeoutError:
+            if f is not None:
+                f.write(f"\n[log incomplete, no data for {limits.timeout}s]\n")
+            return f"timed out after {size} bytes"
+        if f is not None:
+            f.write(decoder.decode(b"", final=True))
+    if not size:
+        return "empty"
+    return f"saved {size} bytes to {file_path}"
+
+
+def collect_kubernetes_logs(logs_dir="ci-debug-bundle/logs", namespace_label="collect_logs=true",
+                            bundle: Bundle | None = None, client: KubeClient | None = None, jobs: int = 8,
+                            limits: LogLimits = LogLimits(), deadline: float | None = None,
+                            key_namespaces: set[str] | None = None):
+    """
+    Collects the log of every container into `<namespace>/<pod>/<container>.log`, and the log of the
+    previous instance of restarted containers into `<container>.previous.log`.
 
-    returncodes = [proc.returncode for proc in stern_processes]
-    if any(rc != 0 for rc in returncodes):
-        cnt = sum(rc != 0 for rc in returncodes)
-        total = len(returncodes)
-        print(f"\nWarning: {cnt}/{total} stern processes finished with non-zero exit codes.", file=sys.stderr)
+    Args:
+        logs_dir (str): Base directory to save logs; within `bundle`, if one is given.
+        namespace_label (str): Label selector for namespaces (e.g., "collect_logs=true"); all namespaces
+            if none match.
+        bundle (Bundle): Where to write the logs; defaults to the directory `logs_dir`.
+        client (KubeClient): API client to collect with; defaults to one for the current kubeconfig context.
+        jobs (int): How many logs to fetch concurrently.
+        limits (LogLimits): Time window, size limit and read timeout for each log.
+        deadline (float): `time.monotonic()` after which no more logs are started; `skipped.yaml` lists them.
+        key_namespaces (set): Namespaces whose logs are collected first; defaults to `find_key_namespaces`.
+    """
+    output = bundle or DirectoryBundle(logs_dir)
+    logs_prefix = logs_dir if bundle else ""
+    print(f"Starting log collection into {output}...")
+    start = time.monotonic()
+    client = client or KubeClient.from_kubeconfig(max_idle_connections=jobs)
+
+    namespaces, _ = client.list("/api/v1/namespaces", labelSelector=namespace_label)
+    target_namespaces = {ns["metadata"]["name"] for ns in namespaces}
+    if not target_namespaces:
+        print(f"No namespaces found with label '{namespace_label}'. Collecting all namespaces.")
+    if key_namespaces is None:
+        key_namespaces = find_key_namespaces(client.list("/api/v1/namespaces")[0])
+
+    pods, _ = client.list("/api/v1/pods")
+    tasks = [
+        CollectionTask(
+            description=f"{log.namespace}/{log.pod} {log.container}" + (" (previous)" if log.previous else ""),
+            resource_type=f"logs in {log.namespace}",
+            fn=functools.partial(collect_container_log, client, output, logs_prefix, log, limits),
+            priority=collection_priority(None, log.namespace, key_namespaces),
+        )
+        for pod in pods
+        if not target_namespaces or pod["metadata"]["namespace"] in target_namespaces
+        for log in container_logs(pod)
+    ]
 
-    print(f"Log collection complete. Logs are available in the '{logs_dir}' directory.")
+    print(f"\nCollecting {len(tasks)} container logs, {jobs} at a time...")
+    _, skipped = run_collection_tasks(tasks, jobs, deadline)
+    write_skipped(output, os.path.join(logs_prefix, "skipped.yaml"), skipped)
 
-    # GITHUB_OUTPUT logic remains the same
+    print(f"Log collection complete in {time.monotonic() - start:.1f}s. Logs are available in {output}.")
+
+    # GITHUB_OUTPUT logic remains the same; logs in a bundle are reported together with the bundle
     if "GITHUB_ACTIONS" in os.environ:
-        with open(os.environ["GITHUB_OUTPUT"], "at") as f:
-            print(f'logs_dir={logs_dir}', file=f)
+        if bundle is None:
+            with open(os.environ["GITHUB_OUTPUT"], "at") as f:
+                print(f'logs_dir={logs_dir}', file=f)
     else:
         logging.info("Not running on Github Actions, won't produce GITHUB_OUTPUT for logs")
 
@@ -374,74 +657,6 @@ def check_command_exists(command: str) -> bool:
     return shutil.which(command) is not None
 
 
-def install_stern(version="1.32.0", arch="linux_amd64", path="/usr/local/bin", retries=3, delay=5):
-    """Downloads (curl with retries), extracts (tar), and installs stern."""
-    archive = f"stern_{version}_{arch}.tar.gz"
-    url = f"https://github.com/stern/stern/releases/download/v{version}/{archive}"
-
-    # Download with retries
-    for attempt in range(retries):
-        try:
-            if os.path.exists(archive):
-                os.remove(archive)  # Clean up partial download
-            print(f"Attempt {attempt + 1}/{retries}: Downloading {archive} from {url}...")
-            subprocess.run([
-                "curl",
-                "--location",
-                "--remote-name",
-                # curl: You must select either --fail or --fail-with-body, not both.
-                "--fail-with-body",
-                "--retry", str(retries),
-                "--retry-delay", str(delay),
-                url
-            ], check=True, capture_output=True)
-            print("Download successful.")
-            break  # Exit retry loop on success
-        except subprocess.CalledProcessError as e:
-            print(f"Download failed (Attempt {attempt + 1}/{retries}): {e.stderr.decode().strip()}", file=sys.stderr)
-            if attempt == retries - 1:
-                sys.exit(f"Exhausted retries. Failed to download {archive}.")
-            time.sleep(delay)
-        except FileNotFoundError:
-            sys.exit("Error: 'curl' not found. Please install it.")
-        except Exception as e:
-            print(f"Unexpected download error: {e}", file=sys.stderr)
-            sys.exit(1)
-    else:
-        # This else block is reached if the loop finishes *without* a break
-        # The sys.exit inside the loop handles the exhausted retries case,
-        # so this might be redundant but harmless.
-        sys.exit("Failed to download after all attempts (loop finished without break).")
-
-    # Extract and Install
-    try:
-        print(f"Extracting {archive}...")
-        subprocess.run(["tar", "--extract", "--gzip", "--file", archive], check=True, capture_output=True)
-        print("Extraction successful.")
-
-        print(f"Installing stern to {path}...")
-        # Ensure target directory exists before moving
-        os.makedirs(path, exist_ok=True)
-        # Corrected chmod to not be recursive
-        subprocess.run(["sudo", "mv", "--target-directory", path, "stern"], check=True, capture_output=True)
-        subprocess.run(["sudo", "chmod", "+x", os.path.join(path, "stern")], check=True, capture_output=True)
-        print(f"Stern v{version} installed successfully to {os.path.join(path, 'stern')}!")
-    except FileNotFoundError as e:
-        sys.exit(f"Error: Command not found during installation ({e}). Ensure tar, sudo, mv, chmod are installed.")
-    except subprocess.CalledProcessError as e:
-        print(f"Install failed: {e.stderr.decode().strip()}", file=sys.stderr)
-        sys.exit(1)
-    except Exception as e:
-        print(f"Unexpected error during installation: {e}", file=sys.stderr)
-        sys.exit(1)
-    finally:
-        # Clean up downloaded archive and extracted binary from current dir
-        if os.path.exists(archive):
-            os.remove(archive)
-        if os.path.exists("stern"):
-            os.remove("stern")
-
-
 @contextlib.contextmanager
 def gha_log_group(title: str) -> None:
     """Prints the starting and ending magic strings for GitHub Actions line group in log."""
@@ -454,16 +669,23 @@ def gha_log_group(title: str) -> None:
         sys.stdout.flush()
 
 
-def print_notebook_logs():
+def print_notebook_logs(client: KubeClient | None = None):
     """
-    Collects logs from specific notebook-related pods and prints them to stdout.
+    Collects logs from specific notebook-related pods and prints them to stdout, interleaved by timestamp.
     This is likely for interactive debugging rather than file collection.
     """
     print("\nCollecting logs from notebook controllers (printing to stdout):")
-    subprocess.run(
-        '''stern --selector "app in (notebook-controller, odh-notebook-controller)" -n redhat-ods-applications --no-follow --tail -1 --timestamps --color always | sort -k3''',
-        shell=True, check=True,
-    )
+    client = client or KubeClient.from_kubeconfig()
+    pods, _ = client.list("/api/v1/namespaces/redhat-ods-applications/pods",
+                          labelSelector="app in (notebook-controller, odh-notebook-controller)")
+    lines = []
+    for log in (log for pod in pods for log in container_logs(pod) if not log.previous):
+        text = b"".join(client.stream(log.api_path, container=log.container, timestamps="true"))
+        for line in text.decode(errors="replace").splitlines():
+            # each line starts with its RFC 3339 timestamp
+            lines.append((line.split(" ", 1)[0], f"{log.pod} {log.container} {line}"))
+    for _, line in sorted(lines):
+        print(line)
 
 
 # Define a dataclass to hold the parsed arguments
@@ -484,6 +706,62 @@ class ScriptArgs:
         default="collect_logs=true",
         metadata={"help": "Label selector for namespaces to collect logs from (e.g., 'env=prod')."}
     )
+    log_max_bytes: int = dataclasses.field(
+        default=16 * 1024 * 1024,
+        metadata={"help": "Largest log to save per container; longer ones are truncated."}
+    )
+    log_timeout: float = dataclasses.field(
+        default=60.0,
+        metadata={"help": "Seconds to wait for more of a container log before saving what arrived so far."}
+    )
+    time_budget: float = dataclasses.field(
+        default=0.0,
+        metadata={"help": "Seconds that collection may take, 0 for no limit. Key namespaces and types go first; what "
+                          "has not started when the budget is spent is skipped and listed in skipped.yaml."}
+    )
+    priority_namespaces: str = dataclasses.field(
+        default=",".join(KEY_NAMESPACES),
+        metadata={"help": "Comma-separated namespaces to collect first, besides data science projects."}
+    )
+    jobs: int = dataclasses.field(
+        default=8,
+        metadata={"help": "How many resource types, or container logs, to collect concurrently."}
+    )
+    collection_mode: str = dataclasses.field(
+        default="all-namespaces",
+        metadata={
+            "help": "How to list namespaced resources: once across all namespaces, or separately in each namespace. "
+                    "Both produce the same files.",
+            "choices": ["all-namespaces", "per-namespace"],
+        }
+    )
+    page_size: int = dataclasses.field(
+        default=500,
+        metadata={"help": "How many objects to request per page when listing resources."}
+    )
+    max_page_bytes: int = dataclasses.field(
+        default=32 * 1024 * 1024,
+        metadata={"help": "Largest list response to hold in memory; larger pages are requested again with fewer "
+                          "objects. Memory use is bounded by roughly jobs times this."}
+    )
+    discovery_ttl: float = dataclasses.field(
+        default=0.0,
+        metadata={"help": "Seconds to use cached API discovery without checking that it is current; after that, "
+                          "checking costs a request whose response is empty unless discovery changed."}
+    )
+    previous_snapshot: str = dataclasses.field(
+        default="",
+        metadata={"help": "The snapshot.json of an earlier collection; only resources that changed since are "
+                          "collected, and changes.yaml lists what was added, modified and deleted."}
+    )
+    output_format: str = dataclasses.field(
+        default="directory",
+        metadata={
+            "help": "Write the bundle as a directory tree, or stream it into OUTPUT_DIR/bundle.tar.gz with an index "
+                    "of its members in OUTPUT_DIR/bundle.index.json.",
+            "choices": ["directory", "tar"],
+        }
+    )
 
 
 def main():
@@ -498,6 +776,7 @@ def main():
             f"--{arg_name}",
             type=field_obj.type,
             default=field_obj.default,
+            choices=field_obj.metadata.get("choices"),
             help=field_obj.metadata.get("help", "") + f" (default: {field_obj.default})"
         )
 
@@ -508,35 +787,56 @@ def main():
     if not check_command_exists("kubectl"):
         sys.exit("Error: 'kubectl' command not found. Please ensure kubectl is installed and in your PATH.")
 
-    # Resource collection doesn't strictly need stern, but log collection does.
-    # Install stern if not present before attempting log collection.
-    stern_exists = check_command_exists("stern")
-    if not stern_exists:
-        print("Stern command not found. Attempting to install stern for log collection.")
-        install_stern()  # This function exits on failure
+    # one client, with a connection for each job, for resources and logs alike
+    client = KubeClient.from_kubeconfig(max_idle_connections=args.jobs)
+    start = time.monotonic()
+    key_namespaces = find_key_namespaces(client.list("/api/v1/namespaces")[0],
+                                         [ns for ns in args.priority_namespaces.split(",") if ns])
+    print(f"Collecting {', '.join(sorted(key_namespaces))} first")
+    # resources may use their share of the budget, and logs whatever is left after them
+    resource_deadline = start + args.time_budget * RESOURCE_BUDGET_SHARE if args.time_budget else None
+    deadline = start + args.time_budget if args.time_budget else None
 
     # Use the output_dir argument for both resources and logs, creating subdirectories within it.
-    resource_output_dir = args.output_dir  # Resources go directly into the base output dir
-    log_output_dir = os.path.join(args.output_dir, "logs")  # Logs go into a 'logs' subdirectory
-
-    # Collect resources first
-    with gha_log_group("collecting kubernetes resources"):
-        collect_kubernetes_resources(output_dir=resource_output_dir)
-
-    # Then collect logs (only if stern was found or successfully installed)
-    if check_command_exists("stern"):  # Re-check in case installation failed but didn't exit
+    if args.output_format == "tar":
+        # paths are relative to the archive, which goes into the output dir
+        bundle = TarBundle(os.path.join(args.output_dir, "bundle.tar.gz"))
+        resource_output_dir = ""
+        log_output_dir = "logs"
+    else:
+        bundle = None
+        resource_output_dir = args.output_dir  # Resources go directly into the base output dir
+        log_output_dir = os.path.join(args.output_dir, "logs")  # Logs go into a 'logs' subdirectory
+
+    with bundle or contextlib.nullcontext():
+        # Collect resources first
+        with gha_log_group("collecting kubernetes resources"):
+            previous = Snapshot.load(args.previous_snapshot) if args.previous_snapshot else None
+            snapshot = collect_kubernetes_resources(output_dir=resource_output_dir, client=client, jobs=args.jobs,
+                                                    per_namespace=args.collection_mode == "per-namespace",
+                                                    paging=Paging(args.page_size, args.max_page_bytes), bundle=bundle,
+                                                    previous=previous, discovery=DiscoveryCache(ttl=args.discovery_ttl),
+                                                    deadline=resource_deadline, key_namespaces=key_namespaces)
+            # next to the bundle rather than in it, so that the next collection can read it
+            snapshot.save(os.path.join(args.output_dir, "snapshot.json"))
+
+        # Then collect logs
         with gha_log_group("collecting pod logs to files"):
-            collect_kubernetes_logs_with_kubectl_subprocess(
+            collect_kubernetes_logs(
                 logs_dir=log_output_dir,  # Use the logs subdirectory
-                log_since=args.log_since,
-                namespace_label=args.log_namespace_label
+                namespace_label=args.log_namespace_label,
+                bundle=bundle,
+                client=client,
+                jobs=args.jobs,
+                limits=LogLimits(since_seconds=parse_duration(args.log_since), max_bytes=args.log_max_bytes,
+                                 timeout=args.log_timeout),
+                deadline=deadline,
+                key_namespaces=key_namespaces,
             )
-    else:
-        print("\nSkipping log collection as stern is not available.", file=sys.stderr)
 
     # Print notebook logs (still prints to stdout)
     with gha_log_group("nbc controller logs (stdout)"):
-        print_notebook_logs()  # This function prints directly to stdout
+        print_notebook_logs(client)  # This function prints directly to stdout
 
     print(f"\nDebug bundle collection complete. Output is available in the '{args.output_dir}' directory.")
 
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
+import concurrent.futures
 import contextlib
-import json
-import os
+import contextvars
 import subprocess
 import sys
 import time
 from typing import TYPE_CHECKING, Generator
 
+from rhoai_in_kind import shell
+from rhoai_in_kind.readiness import ReadinessEngine, service_endpoints_ready
+from rhoai_in_kind.tracing import span
+
 if TYPE_CHECKING:
     from typing import Any, Callable
 
@@ -17,20 +21,11 @@ def sh(
     input: str | None = None,
     **kwargs
 ) -> subprocess.CompletedProcess[str]:
-    """Runs a shell command."""
-    env = env or {}
+    """Runs a shell command, on a shell worker unless `shell.set_mode("spawn")`."""
     print(f"$ {cmd}", file=sys.stdout)
     sys.stdout.flush()
-    completed_process = subprocess.run(
-        f"set -Eeuxo pipefail; {cmd}",
-        shell=True,
-        executable="/bin/bash",
-        env={**os.environ, **env},
-        input=input,
-        check=True,
-        text=True,
-        **kwargs,
-    )
+    with span(cmd, "sh"):
+        completed_process = shell.run(f"set -Eeuxo pipefail; {cmd}", env=env, input=input, check=True, **kwargs)
     sys.stdout.flush()
     return completed_process
 
@@ -39,75 +34,99 @@ def create_resource(resource: str):
     sh("kubectl apply -f -", input=resource)
 
 
-def wait_for_webhook_service_endpoint(namespace: str):
+def wait_for_webhook_service_endpoint(namespace: str, readiness: ReadinessEngine | None = None):
+    """Waits until the notebook controller webhook Service has a ready endpoint.
+
+    Uses `readiness` to watch EndpointSlices if given, otherwise a short-lived engine of its own.
+    """
     service_name = "odh-notebook-controller-webhook-service"
     timeout_seconds = 60
-    poll_interval_seconds = 1
-    start_time = time.time()
 
     print(f"Waiting for endpoints of service '{service_name}' in namespace '{namespace}' to be ready...")
 
-    while time.time() - start_time < timeout_seconds:
+    with contextlib.ExitStack() as stack:
+        if readiness is None:
+            readiness = stack.enter_context(ReadinessEngine())
         try:
-            # Use oc get endpoints -o json to check for ready addresses
-            command = [
-                "kubectl", "get", "endpoints", service_name,
-                "-n", namespace,
-                "-o", "json"
-            ]
-            result = sh(" ".join(command), capture_output=True, timeout=5)
-            endpoints_data = json.loads(result.stdout)
-
-            # Check if 'subsets' exist and contain addresses
-            if "subsets" in endpoints_data:
-                for subset in endpoints_data["subsets"]:
-                    # Check for ready addresses ('addresses') vs not ready ('notReadyAddresses')
-                    if "addresses" in subset and subset["addresses"]:
-                        print(f"Endpoints for service '{service_name}' are ready.")
-                        return
-
-            print(f"Endpoints for '{service_name}' not ready yet, checking again in {poll_interval_seconds}s...")
-
-        except subprocess.CalledProcessError as e:
-            # Handle case where endpoints object might not exist yet or other oc errors
-            print(f"Error checking endpoints (will retry): {e.stderr}")
-        except subprocess.TimeoutExpired:
-            print("Timeout during 'oc get endpoints' command (will retry).")
-        except json.JSONDecodeError as e:
-            print(f"Error decoding JSON output from oc get endpoints (will retry): {e}")
-        except Exception as e:
-            print(f"An unexpected error occurred (will retry): {e}")
-
-        time.sleep(poll_interval_seconds)
-
-    raise TimeoutError(
-        f"Timeout waiting for endpoints of service '{service_name}' in namespace '{namespace}' after {timeout_seconds} seconds.")
+            readiness.wait(service_endpoints_ready(namespace, service_name), timeout=timeout_seconds)
+        except TimeoutError:
+            raise TimeoutError(
+                f"Timeout waiting for endpoints of service '{service_name}' in namespace '{namespace}' after {timeout_seconds} seconds.")
+    print(f"Endpoints for service '{service_name}' are ready.")
 
 
 # https://docs.github.com/en/actions/writing-workflows/choosing-what-your-workflow-does/workflow-commands-for-github-actions#grouping-log-lines
 @contextlib.contextmanager
-def gha_log_group(title: str) -> Generator[None, Any, None]:
-    """Prints the starting and ending magic strings for GitHub Actions line group in log."""
+def gha_log_group(title: str, trace: bool = True) -> Generator[None, Any, None]:
+    """Prints the starting and ending magic strings for GitHub Actions line group in log.
+
+    With `trace`, the group is also recorded as a span; callers that record it themselves pass `trace=False`.
+    """
     print(f"::group::{title}", file=sys.stdout)
     sys.stdout.flush()
     try:
-        yield
+        with span(title, "group") if trace else contextlib.nullcontext():
+            yield
     finally:
         print("::endgroup::", file=sys.stdout)
         sys.stdout.flush()
 
 
 class TestFrame:
-    def __init__(self):
+    """Collects callables with `defer` and runs them all on `__exit__`.
+
+    By default the deferred callables run one after another in the order they were deferred,
+    and the first failure propagates. With `concurrent=True` they run on a thread pool of
+    `max_workers` threads, which suits independent readiness waits: the frame then exits in
+    the time of the slowest callable, and every failure is reported together in one
+    `ExceptionGroup` once all callables have finished.
+
+    Either way, `timings` records how long each callable took.
+    """
+
+    def __init__(self, concurrent: bool = False, max_workers: int | None = None):
         self.stack = []
+        self.concurrent = concurrent
+        self.max_workers = max_workers
+        self.timings: list[tuple[str, float]] = []
 
-    def defer[T](self, obj: T, fn: Callable[[T], Any]):
-        self.stack.append((obj, fn))
+    def defer[T](self, obj: T, fn: Callable[[T], Any], name: str | None = None):
+        self.stack.append((obj, fn, name or fn.__qualname__))
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        while self.stack:
-            obj, fn = self.stack.pop(0)
-            fn(obj)
+        if not self.concurrent:
+            while self.stack:
+                obj, fn, name = self.stack.pop(0)
+                self._run(obj, fn, name)
+            return
+
+        deferred, self.stack = self.stack, []
+        errors: list[BaseException] = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="defer") as pool:
+            # copy_context keeps the enclosing span as the parent of the deferred functions' spans
+            futures = [pool.submit(contextvars.copy_context().run, self._run, obj, fn, name)
+                       for obj, fn, name in deferred]
+            for future, (_, _, name) in zip(futures, deferred):
+                try:
+                    future.result()
+                except BaseException as e:
+                    e.add_note(f"in deferred function {name}")
+                    errors.append(e)
+        if errors:
+            raise BaseExceptionGroup(f"{len(errors)} of {len(deferred)} deferred functions failed", errors)
+
+    def _run[T](self, obj: T, fn: Callable[[T], Any], name: str):
+        start = time.monotonic()
+        outcome = "failed"
+        try:
+            with span(name, "deferred"):
+                fn(obj)
+            outcome = "finished"
+        finally:
+            duration = time.monotonic() - start
+            self.timings.append((name, duration))
+            print(f"Deferred function {name} {outcome} in {duration:.1f}s")
+            sys.stdout.flush()
@@ -0,0 +1,132 @@
+"""Counterparts of `sh`, `create_resource`, the readiness waits and `TestFrame` for asyncio.
+
+They let one thread keep many shell commands and waits in flight at the same time,
+
+    async def install_minio(readiness: ReadinessEngine):
+        async with AsyncTestFrame() as tf:
+            await async_create_resource(manifest, timeout=30)
+            tf.defer(readiness, lambda r: r.async_wait(deployment_available("minio"), timeout=120))
+
+    asyncio.run(install_minio(ReadinessEngine()))
+
+Cancelling a call (with `asyncio.timeout`, or because a sibling task in a `TaskGroup` failed)
+kills the command it runs, as does its own `timeout`. Commands go through a limiter: at most
+`set_concurrency` (default 8) of them run at the same time in an event loop, the others wait
+for their turn. Readiness waits are not limited, they only hold a future each.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import time
+import weakref
+from typing import TYPE_CHECKING
+
+from rhoai_in_kind import shell
+from rhoai_in_kind.readiness import service_endpoints_ready
+from rhoai_in_kind.tracing import span
+
+if TYPE_CHECKING:
+    import subprocess
+    from typing import Any, Awaitable, Callable
+
+    from rhoai_in_kind.readiness import ReadinessEngine
+
+_concurrency = 8
+# asyncio primitives belong to one event loop, so there is a limiter for each
+_limiters: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
+
+
+def set_concurrency(limit: int):
+    """How many commands may run at the same time in an event loop, from the next command on."""
+    global _concurrency
+    if limit < 1:
+        raise ValueError(f"concurrency must be at least 1, got {limit}")
+    _concurrency = limit
+    _limiters.clear()
+
+
+def _limiter() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        limiter = _limiters[loop] = asyncio.Semaphore(_concurrency)
+    return limiter
+
+
+async def async_sh(cmd: str, env: dict[str, str] | None = None, input: str | None = None,
+                   capture_output: bool = False, timeout: float | None = None) -> subprocess.CompletedProcess[str]:
+    """Runs a shell command like `sh`, once the limiter lets it; `timeout` counts from when it starts."""
+    async with _limiter():
+        print(f"$ {cmd}", file=sys.stdout)
+        sys.stdout.flush()
+        with span(cmd, "sh"):
+            completed_process = await shell.run_async(f"set -Eeuxo pipefail; {cmd}", env=env, input=input,
+                                                      check=True, capture_output=capture_output, timeout=timeout)
+        sys.stdout.flush()
+    return completed_process
+
+
+async def async_create_resource(resource: str, timeout: float | None = None):
+    await async_sh("kubectl apply -f -", input=resource, timeout=timeout)
+
+
+async def async_wait_for_webhook_service_endpoint(namespace: str, readiness: ReadinessEngine):
+    """`wait_for_webhook_service_endpoint` for asyncio."""
+    service_name = "odh-notebook-controller-webhook-service"
+    timeout_seconds = 60
+
+    print(f"Waiting for endpoints of service '{service_name}' in namespace '{namespace}' to be ready...")
+    try:
+        await readiness.async_wait(service_endpoints_ready(namespace, service_name), timeout=timeout_seconds)
+    except TimeoutError:
+        raise TimeoutError(
+            f"Timeout waiting for endpoints of service '{service_name}' in namespace '{namespace}' "
+            f"after {timeout_seconds} seconds.")
+    print(f"Endpoints for service '{service_name}' are ready.")
+
+
+class AsyncTestFrame:
+    """Collects coroutine functions with `defer` and awaits them all together on `__aexit__`.
+
+    Like `TestFrame(concurrent=True)`, the frame exits in the time of the slowest of them, every
+    failure is reported together in one `ExceptionGroup` once all have finished, and `timings`
+    records how long each took. Cancelling the frame while it awaits them cancels them all.
+    """
+
+    def __init__(self):
+        self.stack = []
+        self.timings: list[tuple[str, float]] = []
+
+    def defer[T](self, obj: T, fn: Callable[[T], Awaitable[Any]], name: str | None = None):
+        self.stack.append((obj, fn, name or fn.__qualname__))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        deferred, self.stack = self.stack, []
+        # gather runs each in a task with a copy of the context, so the enclosing span stays their parent
+        results = await asyncio.gather(*(self._run(obj, fn, name) for obj, fn, name in deferred),
+                                       return_exceptions=True)
+        errors: list[BaseException] = []
+        for result, (_, _, name) in zip(results, deferred):
+            if isinstance(result, BaseException):
+                result.add_note(f"in deferred function {name}")
+                errors.append(result)
+        if errors:
+            raise BaseExceptionGroup(f"{len(errors)} of {len(deferred)} deferred functions failed", errors)
+
+    async def _run[T](self, obj: T, fn: Callable[[T], Awaitable[Any]], name: str):
+        start = time.monotonic()
+        outcome = "failed"
+        try:
+            with span(name, "deferred"):
+                await fn(obj)
+            outcome = "finished"
+        finally:
+            duration = time.monotonic() - start
+            self.timings.append((name, duration))
+            print(f"Deferred function {name} {outcome} in {duration:.1f}s")
+            sys.stdout.flush()
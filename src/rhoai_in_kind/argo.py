@@ -0,0 +1,156 @@
+"""Syncs Argo CD Applications through the Kubernetes API, without the argocd CLI.
+
+`argocd app sync` asks argocd-server to sync, which needs the CLI, a login and a route to the
+server. All argocd-server does with the request is set the Application's `operation` field; the
+application controller then runs the sync and reports it in `status.operationState`, and the
+result in `status.sync` and `status.health`. This sets the field directly and follows the status
+with a watch,
+
+    with ReadinessEngine() as readiness:
+        sync_application(client, readiness, "kf-pipelines", timeout=300)
+
+A sync that fails is started again, with backoff, until `timeout`, as `retry_sh("argocd app sync ...")`
+did; the usual cause is a custom resource whose CRD the same sync is still establishing.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+import uuid
+from typing import TYPE_CHECKING
+
+from rhoai_in_kind.kube import FIELD_MANAGER
+from rhoai_in_kind.readiness import Waiter
+from rhoai_in_kind.retry import retry
+
+if TYPE_CHECKING:
+    from rhoai_in_kind.kube import KubeClient
+    from rhoai_in_kind.readiness import ReadinessEngine
+
+APPLICATIONS = "/apis/argoproj.io/v1alpha1/applications"
+ARGOCD_NAMESPACE = "argocd"
+
+# phases of `status.operationState` in which the operation is over
+FINISHED_PHASES = ("Succeeded", "Failed", "Error")
+# name of the `operation.info` entry that tells our operation apart from earlier ones
+OPERATION_ID = "rhoai-in-kind-sync"
+
+
+class SyncError(Exception):
+    """The sync operation finished, but did not succeed."""
+
+
+def _operation_state(app: dict) -> dict:
+    return (app.get("status") or {}).get("operationState") or {}
+
+
+def _health(app: dict) -> str:
+    return ((app.get("status") or {}).get("health") or {}).get("status", "Unknown")
+
+
+def _sync_status(app: dict) -> str:
+    return ((app.get("status") or {}).get("sync") or {}).get("status", "Unknown")
+
+
+def _operation_id(app: dict) -> str | None:
+    for info in (_operation_state(app).get("operation") or {}).get("info") or []:
+        if info.get("name") == OPERATION_ID:
+            return info.get("value")
+    return None
+
+
+def _idle(app: dict) -> bool:
+    """No operation is requested or running, like argocd-server checks before it starts one."""
+    return not app.get("operation") and _operation_state(app).get("phase") not in ("Running", "Terminating")
+
+
+def application_idle(namespace: str, name: str) -> Waiter:
+    return Waiter(
+        description=f"application {name} in {namespace} has no operation in progress",
+        path=APPLICATIONS,
+        ready=lambda objects: bool(objects) and all(_idle(o) for o in objects),
+        namespace=namespace, name=name,
+    )
+
+
+def operation_finished(namespace: str, name: str, operation_id: str, healthy: bool = False) -> Waiter:
+    """The sync operation `operation_id` of the Application finished, successfully or not.
+
+    With `healthy`, a successful one also waits for `status.health` to become Healthy.
+    """
+
+    def finished(app: dict) -> bool:
+        phase = _operation_state(app).get("phase")
+        if _operation_id(app) != operation_id or phase not in FINISHED_PHASES:
+            return False
+        return phase != "Succeeded" or not healthy or _health(app) == "Healthy"
+
+    return Waiter(
+        description=f"sync of application {name} in {namespace}" + (" and its health" if healthy else ""),
+        path=APPLICATIONS,
+        ready=lambda objects: bool(objects) and all(finished(o) for o in objects),
+        namespace=namespace, name=name,
+    )
+
+
+def sync_operation(app: dict, operation_id: str) -> dict:
+    """The `operation` that `argocd app sync` has argocd-server set, with the Application's own sync options."""
+    sync_policy = app["spec"].get("syncPolicy") or {}
+    operation = {
+        "initiatedBy": {"username": FIELD_MANAGER},
+        "info": [{"name": OPERATION_ID, "value": operation_id}],
+        "sync": {"syncStrategy": {"hook": {}}},
+    }
+    if sync_policy.get("syncOptions"):
+        operation["sync"]["syncOptions"] = sync_policy["syncOptions"]
+    if sync_policy.get("retry"):
+        operation["retry"] = sync_policy["retry"]
+    return operation
+
+
+def _failure(app: dict) -> str:
+    """The message of a failed operation, followed by those of the resources that failed to sync."""
+    state = _operation_state(app)
+    lines = [f"sync of application {app['metadata']['name']} {state.get('phase')}: {state.get('message')}"]
+    for resource in (state.get("syncResult") or {}).get("resources") or []:
+        if resource.get("status") == "SyncFailed" or resource.get("hookPhase") in ("Failed", "Error"):
+            what = "/".join(p for p in (resource.get("kind"), resource.get("namespace"), resource.get("name")) if p)
+            lines.append(f"  {what}: {resource.get('message')}")
+    return "\n".join(lines)
+
+
+def sync_application(client: KubeClient, readiness: ReadinessEngine, name: str, namespace: str = ARGOCD_NAMESPACE,
+                     timeout: float = 300.0, healthy: bool = False) -> dict:
+    """Syncs the Application and waits until the sync succeeded; returns the Application as it was then.
+
+    Raises `SyncError` if the last sync before `timeout` failed.
+    """
+    path = client.resource_path("argoproj.io/v1alpha1", "Application", namespace, name)
+    start = time.monotonic()
+
+    def attempt(remaining: float) -> dict:
+        readiness.wait(application_idle(namespace, name), timeout=remaining)
+        app = client.get(path)
+        if not _idle(app):
+            # raced with another sync; the message is what argocd-server says, which is retried
+            raise SyncError(f"application {name}: another operation is already in progress")
+        operation_id = uuid.uuid4().hex
+        # the resourceVersion makes this fail with a conflict if an operation was started since the get
+        client.patch(path, {
+            "metadata": {"resourceVersion": app["metadata"]["resourceVersion"]},
+            "operation": sync_operation(app, operation_id),
+        }, fieldManager=FIELD_MANAGER)
+        waiter = operation_finished(namespace, name, operation_id, healthy=healthy)
+        readiness.wait(waiter, timeout=max(0.0, start + timeout - time.monotonic()))
+        app = waiter.objects[0]
+        if _operation_state(app).get("phase") != "Succeeded":
+            raise SyncError(_failure(app))
+        return app
+
+    app = retry(attempt, f"sync of application {name}", timeout=timeout)
+    revision = ((app.get("status") or {}).get("sync") or {}).get("revision", "")
+    print(f"Synced application {name} to {revision[:12] or 'its target revision'} in {time.monotonic() - start:.1f}s "
+          f"(sync {_sync_status(app)}, health {_health(app)})")
+    sys.stdout.flush()
+    return app
@@ -0,0 +1,279 @@
+"""Downloads pinned release artifacts once and keeps them in a content-addressed cache.
+
+Files are stored under their sha256 digest, with an index from URL to digest,
+
+    ~/.cache/rhoai-in-kind/
+        sha256/3f1c...        the downloaded bytes
+        urls/9ab0....json     {"url": ..., "sha256": "3f1c...", "size": ...}
+
+so a repeated deploy reads them from disk instead of the network. An artifact with a known
+`sha256` (from `PINNED_SHA256`, or the checksum file its project publishes next to it, like
+Istio's `.sha256`) is verified against it before it is cached. One without is pinned to whatever
+digest was downloaded first (trust on first use) and verified against that afterwards; that is
+meant for moving URLs such as oc's "stable" only. After a version bump,
+
+    python src/rhoai_in_kind/artifacts.py
+
+downloads the versioned artifacts for every platform and prints their `PINNED_SHA256` entries.
+
+In offline mode (`RHOAI_IN_KIND_OFFLINE=1`) nothing is downloaded and a missing artifact raises
+`CacheMiss`; fill the cache beforehand with `prefetch` (`python components/deploy.py --prefetch`).
+The cache lives in `RHOAI_IN_KIND_CACHE_DIR`, by default `~/.cache/rhoai-in-kind`.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import dataclasses
+import hashlib
+import json
+import os
+import pathlib
+import platform
+import re
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Iterable
+
+CERT_MANAGER_VERSION = "v1.18.2"
+GATEWAY_API_VERSION = "v1.3.0"
+ISTIO_VERSION = "1.26.2"
+LOCAL_PATH_PROVISIONER_VERSION = "v0.0.33"
+
+# sha256 of the versioned artifacts by URL, as printed by `main`. An Istio tarball without an entry is
+# checked against the .sha256 file of its release; oc's moving "stable" URL cannot be pinned.
+PINNED_SHA256: dict[str, str] = {}
+
+# the platforms deploy.py runs on, as (platform.system(), platform.machine())
+PLATFORMS = (("Linux", "x86_64"), ("Linux", "aarch64"), ("Darwin", "x86_64"), ("Darwin", "arm64"))
+
+
+class CacheMiss(Exception):
+    """The artifact is not in the cache and the cache is offline."""
+
+
+@dataclasses.dataclass(frozen=True)
+class Artifact:
+    name: str
+    url: str
+    # expected digest; None trusts the first download, unless `sha256_url` is set
+    sha256: str | None = None
+    # a checksum file published with the artifact, whose first word is the artifact's sha256
+    sha256_url: str | None = None
+    # the URL serves different content over time, so the artifact cannot be pinned
+    moving: bool = False
+
+
+def go_arch(machine: str | None = None) -> str:
+    """Translates `uname -m` to the architecture names Go release binaries use."""
+    machine = machine or platform.machine()
+    return {"x86_64": "amd64", "aarch64": "arm64"}.get(machine, machine)
+
+
+def istio_platform(system: str | None = None, machine: str | None = None) -> str:
+    """The platform part of an Istio release tarball's name, as chosen by https://istio.io/downloadIstio."""
+    system = system or platform.system()
+    arch = go_arch(machine)
+    if system == "Darwin":
+        return "osx-arm64" if arch == "arm64" else "osx"
+    return f"linux-{arch}"
+
+
+def catalogue(machine: str | None = None, system: str | None = None) -> dict[str, Artifact]:
+    """The artifacts that deploy.py downloads, for this machine's operating system and architecture."""
+    machine = machine or platform.machine()
+    istio = istio_platform(system, machine)
+    istio_url = (f"https://github.com/istio/istio/releases/download/{ISTIO_VERSION}/"
+                 f"istio-{ISTIO_VERSION}-{istio}.tar.gz")
+    artifacts = [
+        Artifact("cert-manager",
+                 f"https://github.com/jetstack/cert-manager/releases/download/{CERT_MANAGER_VERSION}/cert-manager.yaml"),
+        # the same CRDs as `kubectl kustomize github.com/kubernetes-sigs/gateway-api/config/crd/experimental`,
+        # TLSRoute is considered "experimental" https://github.com/kubernetes-sigs/gateway-api/issues/2643
+        Artifact("gateway-api-crds",
+                 f"https://github.com/kubernetes-sigs/gateway-api/releases/download/{GATEWAY_API_VERSION}/experimental-install.yaml"),
+        # what `curl -L https://istio.io/downloadIstio | sh -` would download
+        Artifact("istio", istio_url, sha256_url=f"{istio_url}.sha256"),
+        # "stable" moves; the cache keeps the first one it downloaded until the cache is cleared
+        Artifact("oc",
+                 f"https://mirror.openshift.com/pub/openshift-v4/{machine}/clients/ocp/stable/openshift-client-linux.tar.gz",
+                 moving=True),
+        Artifact("local-path-provisioner",
+                 f"https://raw.githubusercontent.com/rancher/local-path-provisioner/{LOCAL_PATH_PROVISIONER_VERSION}/deploy/local-path-storage.yaml"),
+    ]
+    return {a.name: dataclasses.replace(a, sha256=PINNED_SHA256.get(a.url)) for a in artifacts}
+
+
+def default_cache_dir() -> pathlib.Path:
+    if "RHOAI_IN_KIND_CACHE_DIR" in os.environ:
+        return pathlib.Path(os.environ["RHOAI_IN_KIND_CACHE_DIR"])
+    return pathlib.Path(os.environ.get("XDG_CACHE_HOME", pathlib.Path.home() / ".cache")) / "rhoai-in-kind"
+
+
+def offline_from_environment() -> bool:
+    return os.environ.get("RHOAI_IN_KIND_OFFLINE", "") not in ("", "0", "false")
+
+
+class ArtifactCache:
+    def __init__(self, root: pathlib.Path | str | None = None, offline: bool | None = None,
+                 retries: int = 3, retry_delay: float = 5.0, timeout: float = 60.0):
+        self.root = pathlib.Path(root) if root is not None else default_cache_dir()
+        self.offline = offline_from_environment() if offline is None else offline
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def _blob_path(self, digest: str) -> pathlib.Path:
+        return self.root / "sha256" / digest
+
+    def _index_path(self, url: str) -> pathlib.Path:
+        return self.root / "urls" / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+    def _lock(self, url: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(url, threading.Lock())
+
+    def lookup(self, artifact: Artifact) -> pathlib.Path | None:
+        """Returns the cached file for `artifact` if there is one whose contents match its digest."""
+        digest = artifact.sha256
+        if digest is None:
+            try:
+                digest = json.loads(self._index_path(artifact.url).read_text())["sha256"]
+            except (FileNotFoundError, json.JSONDecodeError, KeyError):
+                return None
+        path = self._blob_path(digest)
+        if not path.exists():
+            return None
+        if file_sha256(path) != digest:
+            print(f"Cached {artifact.name} ({path}) is corrupted, removing it", file=sys.stderr)
+            path.unlink(missing_ok=True)
+            return None
+        return path
+
+    def fetch(self, artifact: Artifact) -> pathlib.Path:
+        """Returns the path of the cached file, downloading it first if needed.
+
+        The returned file is shared, copy it before modifying it.
+        """
+        with self._lock(artifact.url):
+            if path := self.lookup(artifact):
+                print(f"Using cached {artifact.name} from {path}")
+                sys.stdout.flush()
+                return path
+            if self.offline:
+                raise CacheMiss(f"{artifact.name} ({artifact.url}) is not in the cache at {self.root} "
+                                f"and downloads are disabled (offline mode)")
+            return self._download(artifact)
+
+    def _download(self, artifact: Artifact) -> pathlib.Path:
+        (self.root / "sha256").mkdir(parents=True, exist_ok=True)
+        (self.root / "urls").mkdir(parents=True, exist_ok=True)
+        expected = artifact.sha256
+        if expected is None and artifact.sha256_url is not None:
+            expected = self._published_sha256(artifact)
+        elif expected is None and not artifact.moving:
+            print(f"Warning: {artifact.name} has no pinned sha256, trusting the first download", file=sys.stderr)
+        for attempt in range(1, self.retries + 1):
+            print(f"Attempt {attempt}/{self.retries}: Downloading {artifact.name} from {artifact.url}...")
+            sys.stdout.flush()
+            start = time.monotonic()
+            try:
+                digest, size, tmp = self._download_to_temp(artifact.url)
+                break
+            except OSError as e:  # includes urllib.error.URLError
+                if isinstance(e, urllib.error.HTTPError) and 400 <= e.code < 500 and e.code not in (408, 429):
+                    raise  # not going to get better by asking again
+                print(f"Download of {artifact.name} failed (Attempt {attempt}/{self.retries}): {e}", file=sys.stderr)
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.retry_delay)
+
+        if expected is not None and digest != expected:
+            os.unlink(tmp)
+            raise ValueError(f"{artifact.name} from {artifact.url} has sha256 {digest}, expected {expected}")
+        path = self._blob_path(digest)
+        os.replace(tmp, path)
+        self._write_index(artifact.url, {"url": artifact.url, "sha256": digest, "size": size})
+        print(f"Downloaded {artifact.name} ({size} bytes, sha256 {digest}) in {time.monotonic() - start:.1f}s")
+        sys.stdout.flush()
+        return path
+
+    def _published_sha256(self, artifact: Artifact) -> str:
+        """Reads the digest from the artifact's checksum file, `<sha256>  <file name>` like sha256sum writes."""
+        with urllib.request.urlopen(artifact.sha256_url, timeout=self.timeout) as response:
+            words = response.read(4096).decode(errors="replace").split()
+        if not words or not re.fullmatch(r"[0-9a-fA-F]{64}", words[0]):
+            raise ValueError(f"{artifact.sha256_url} does not start with a sha256 digest")
+        return words[0].lower()
+
+    def _download_to_temp(self, url: str) -> tuple[str, int, str]:
+        """Streams `url` into a temporary file in the cache; returns its digest, size and path."""
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".download-")
+        try:
+            with os.fdopen(fd, "wb") as f, urllib.request.urlopen(url, timeout=self.timeout) as response:
+                while chunk := response.read(1024 * 1024):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return digest.hexdigest(), size, tmp
+
+    def _write_index(self, url: str, entry: dict):
+        fd, tmp = tempfile.mkstemp(dir=self.root / "urls", prefix=".index-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._index_path(url))
+
+    def prefetch(self, artifacts: Iterable[Artifact], jobs: int = 4) -> dict[str, pathlib.Path]:
+        """Makes sure all `artifacts` are in the cache, downloading up to `jobs` at a time."""
+        artifacts = list(artifacts)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="prefetch") as pool:
+            futures = {a.name: pool.submit(self.fetch, a) for a in artifacts}
+        errors = []
+        for name, future in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                e.add_note(f"while prefetching {name}")
+                errors.append(e)
+        if errors:
+            raise ExceptionGroup(f"{len(errors)} of {len(artifacts)} artifacts could not be prefetched", errors)
+        return {name: future.result() for name, future in futures.items()}
+
+
+def file_sha256(path: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def main():
+    """Downloads the versioned artifacts of every platform and prints their `PINNED_SHA256` entries."""
+    artifacts = {a.url: a for system, machine in PLATFORMS for a in catalogue(machine, system).values()
+                 if not a.moving}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = ArtifactCache(tmp, offline=False).prefetch(
+            [dataclasses.replace(a, name=a.url, sha256=None) for a in artifacts.values()], jobs=len(artifacts))
+        print("PINNED_SHA256: dict[str, str] = {")
+        for url, path in sorted(paths.items()):
+            print(f'    "{url}":\n        "{file_sha256(path)}",')
+        print("}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Applies many small objects at once instead of forking kubectl for each of them.
+
+    batch = ApplyBatch(client)
+    for username in users:
+        batch.add(service_account("oauth-server", username))
+    batch.apply()
+
+With a `KubeClient` every object is server-side applied over the client's pooled connections,
+a few at a time; without one, the whole batch goes to a single `kubectl apply -f -` as a
+multi-document stream. Either way `apply` reports each object, and raises `ApplyError` carrying
+all the results if any of them failed.
+
+The builders below stand in for `kubectl create <kind> ... --dry-run=client -o yaml`.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import dataclasses
+import json
+import subprocess
+import sys
+from typing import TYPE_CHECKING
+
+from rhoai_in_kind.kube import FIELD_MANAGER, dump_yaml
+
+if TYPE_CHECKING:
+    from typing import Iterable
+
+    from rhoai_in_kind.kube import KubeClient
+
+# applied before everything else, the rest of a batch may depend on them
+FIRST_KINDS = ("Namespace", "CustomResourceDefinition")
+
+
+@dataclasses.dataclass
+class ApplyResult:
+    kind: str
+    name: str
+    namespace: str | None = None
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def __str__(self):
+        ref = f"{self.kind.lower()}/{self.name}" + (f" -n {self.namespace}" if self.namespace else "")
+        return f"{ref} applied" if self.ok else f"{ref} failed: {self.error}"
+
+
+class ApplyError(Exception):
+    def __init__(self, results: list[ApplyResult]):
+        self.results = results
+        failed = [r for r in results if not r.ok]
+        super().__init__(f"{len(failed)} of {len(results)} objects failed to apply:\n"
+                         + "\n".join(str(r) for r in failed))
+
+
+def _result(obj: dict, error: str | None = None) -> ApplyResult:
+    metadata = obj.get("metadata") or {}
+    return ApplyResult(kind=obj["kind"], name=metadata["name"], namespace=metadata.get("namespace"), error=error)
+
+
+class ApplyBatch:
+    def __init__(self, client: KubeClient | None = None, field_manager: str = FIELD_MANAGER, jobs: int = 4,
+                 subresource: str | None = None):
+        self.client = client
+        self.field_manager = field_manager
+        self.jobs = jobs
+        # e.g. "status", to apply only that part of the objects
+        self.subresource = subresource
+        self.objects: list[dict] = []
+
+    def add(self, *objects: dict) -> ApplyBatch:
+        self.objects.extend(objects)
+        return self
+
+    def apply(self, check: bool = True) -> list[ApplyResult]:
+        """Applies all objects added so far and empties the batch."""
+        objects, self.objects = self.objects, []
+        if not objects:
+            return []
+        print(f"Applying {len(objects)} objects {'through the API' if self.client else 'with kubectl'}...")
+        sys.stdout.flush()
+        results = self._apply_with_client(objects) if self.client else self._apply_with_kubectl(objects)
+        for result in results:
+            print(f"  {result}")
+        sys.stdout.flush()
+        if check and not all(r.ok for r in results):
+            raise ApplyError(results)
+        return results
+
+    def _apply_one(self, obj: dict) -> ApplyResult:
+        try:
+            self.client.apply(obj, field_manager=self.field_manager, subresource=self.subresource)
+        except Exception as e:
+            return _result(obj, error=str(e) or repr(e))
+        return _result(obj)
+
+    def _apply_with_client(self, objects: list[dict]) -> list[ApplyResult]:
+        first, rest = _split_first(objects)
+        results = {id(o): self._apply_one(o) for o in first}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs, thread_name_prefix="apply") as pool:
+            results.update(zip(map(id, rest), pool.map(self._apply_one, rest)))
+        return [results[id(o)] for o in objects]
+
+    def _apply_with_kubectl(self, objects: list[dict]) -> list[ApplyResult]:
+        first, rest = _split_first(objects)
+        stream = "---\n".join(dump_yaml(o) for o in first + rest)
+        # kubectl applies the documents in order and carries on past the ones that fail
+        process = subprocess.run(["kubectl", "apply", "--server-side", "--force-conflicts",
+                                  f"--field-manager={self.field_manager}", "-f", "-", "-o", "json",
+                                  *([f"--subresource={self.subresource}"] if self.subresource else [])],
+                                 input=stream, capture_output=True, text=True)
+        applied = set()
+        if process.stdout.strip():
+            output = json.loads(process.stdout)
+            for item in output["items"] if output.get("kind") == "List" else [output]:
+                metadata = item["metadata"]
+                applied.add((item["kind"], metadata.get("namespace"), metadata["name"]))
+        error = process.stderr.strip() or f"kubectl exited with {process.returncode}"
+        return [
+            r if process.returncode == 0 or (r.kind, r.namespace, r.name) in applied
+            else dataclasses.replace(r, error=error)
+            for r in map(_result, objects)
+        ]
+
+
+def _split_first(objects: list[dict]) -> tuple[list[dict], list[dict]]:
+    return [o for o in objects if o["kind"] in FIRST_KINDS], [o for o in objects if o["kind"] not in FIRST_KINDS]
+
+
+def namespace(name: str) -> dict:
+    return {"apiVersion": "v1", "kind": "Namespace", "metadata": {"name": name}}
+
+
+def service_account(namespace: str, name: str) -> dict:
+    return {"apiVersion": "v1", "kind": "ServiceAccount", "metadata": {"name": name, "namespace": namespace}}
+
+
+def secret(namespace: str, name: str, string_data: dict[str, str], secret_type: str = "Opaque") -> dict:
+    return {"apiVersion": "v1", "kind": "Secret", "metadata": {"name": name, "namespace": namespace},
+            "type": secret_type, "stringData": string_data}
+
+
+def config_map(namespace: str, name: str, data: dict[str, str]) -> dict:
+    return {"apiVersion": "v1", "kind": "ConfigMap", "metadata": {"name": name, "namespace": namespace}, "data": data}
+
+
+def cluster_role(name: str, verbs: list[str], resources: list[str]) -> dict:
+    """Like `kubectl create clusterrole NAME --verb=... --resource=resource.group`, one rule per API group."""
+    by_group: dict[str, list[str]] = {}
+    for r in resources:
+        resource, _, group = r.partition(".")
+        by_group.setdefault(group, []).append(resource)
+    return {
+        "apiVersion": "rbac.authorization.k8s.io/v1", "kind": "ClusterRole", "metadata": {"name": name},
+        "rules": [{"apiGroups": [group], "resources": names, "verbs": verbs} for group, names in by_group.items()],
+    }
+
+
+def cluster_role_binding(name: str, cluster_role: str, users: Iterable[str] = (),
+                         service_accounts: Iterable[str] = (), groups: Iterable[str] = ()) -> dict:
+    """Like `kubectl create clusterrolebinding NAME --clusterrole=... --user=... --serviceaccount=NS:NAME`."""
+    subjects = [{"apiGroup": "rbac.authorization.k8s.io", "kind": "User", "name": u} for u in users]
+    subjects += [{"apiGroup": "rbac.authorization.k8s.io", "kind": "Group", "name": g} for g in groups]
+    for sa in service_accounts:
+        sa_namespace, _, sa_name = sa.partition(":")
+        subjects.append({"kind": "ServiceAccount", "name": sa_name, "namespace": sa_namespace})
+    return {
+        "apiVersion": "rbac.authorization.k8s.io/v1", "kind": "ClusterRoleBinding", "metadata": {"name": name},
+        "roleRef": {"apiGroup": "rbac.authorization.k8s.io", "kind": "ClusterRole", "name": cluster_role},
+        "subjects": subjects,
+    }
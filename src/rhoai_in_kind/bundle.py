@@ -0,0 +1,226 @@
+"""Where the debug bundle goes: a directory tree, or a single compressed tar written as it is collected.
+
+Both take paths relative to the bundle and hand out text files to write them,
+
+    with bundle.open("namespaces/minio/core/pods.yaml") as f:
+        f.write(...)
+
+`DirectoryBundle` creates the files on disk. `TarBundle` spools each file to a temporary file
+and, once it is closed, appends it to the archive, so thousands of small files turn into one
+upload and nothing has to walk and compress them afterwards.
+
+Every member of the archive is compressed as a gzip stream of its own. Concatenated gzip
+streams are a valid gzip file, so `tar -xzf bundle.tar.gz` works as usual, but a member can
+also be decompressed on its own: the index written next to the archive records, for every
+member, where its stream starts and how long it is,
+
+    {"format": 1, "members": [
+        {"path": "namespaces/minio/core/pods.yaml", "size": 10240,
+         "offset": 81920, "length": 2048, "tar_offset": 524288},
+        ...]}
+
+and `extract` uses it to pull out e.g. one namespace or one kind without reading the rest,
+
+    python -m rhoai_in_kind.bundle ci-debug-bundle/bundle.tar.gz 'namespaces/minio/*' --to minio
+"""
+
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import fnmatch
+import io
+import json
+import os
+import pathlib
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zlib
+from typing import TYPE_CHECKING, Protocol
+
+if TYPE_CHECKING:
+    from typing import BinaryIO, Iterable, TextIO
+
+# members up to this size are spooled in memory, larger ones in a temporary file
+SPOOL_BYTES = 1024 * 1024
+CHUNK_BYTES = 1024 * 1024
+
+
+class Bundle(Protocol):
+    def open(self, path: str) -> TextIO:
+        """Returns a new text file at `path` in the bundle; it is part of the bundle once it is closed."""
+
+    def close(self):
+        """Finishes the bundle; no more files can be opened."""
+
+
+class DirectoryBundle:
+    def __init__(self, root: pathlib.Path | str):
+        self.root = pathlib.Path(root)
+
+    def __str__(self):
+        return f"directory {self.root}"
+
+    def open(self, path: str) -> TextIO:
+        target = self.root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        return open(target, "w")
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+@dataclasses.dataclass
+class IndexEntry:
+    path: str
+    # uncompressed size of the file
+    size: int
+    # where the member's gzip stream starts in the archive, and its compressed length
+    offset: int
+    length: int
+    # where the member's tar header starts in the uncompressed tar
+    tar_offset: int
+
+
+class _MemberFile(io.TextIOWrapper):
+    """A spooled text file that appends itself to the archive when it is closed."""
+
+    def __init__(self, bundle: TarBundle, path: str):
+        super().__init__(tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, dir=bundle.archive.parent),
+                         encoding="utf-8")
+        self._bundle = bundle
+        self._path = path
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.flush()
+            self._bundle.append(self._path, self.buffer)
+        finally:
+            super().close()
+
+
+class TarBundle:
+    def __init__(self, archive: pathlib.Path | str, index: pathlib.Path | str | None = None, compresslevel: int = 6):
+        self.archive = pathlib.Path(archive)
+        self.index = pathlib.Path(index) if index is not None else self.archive.with_name(
+            self.archive.name.removesuffix(".tar.gz") + ".index.json")
+        self.compresslevel = compresslevel
+        self.entries: list[IndexEntry] = []
+        self.archive.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.archive, "wb")
+        self._tar_offset = 0
+        self._lock = threading.Lock()
+        self._mtime = time.time()
+
+    def __str__(self):
+        return f"archive {self.archive}"
+
+    def open(self, path: str) -> TextIO:
+        return _MemberFile(self, path)
+
+    def append(self, path: str, data: BinaryIO):
+        """Adds the contents of `data`, from its start, as the file `path`."""
+        size = data.seek(0, os.SEEK_END)
+        data.seek(0)
+        info = tarfile.TarInfo(path)
+        info.size = size
+        info.mtime = self._mtime
+        info.mode = 0o644
+        header = info.tobuf(format=tarfile.PAX_FORMAT)
+        padding = b"\0" * (-size % tarfile.BLOCKSIZE)
+
+        # compress outside the lock, so that concurrent writers only wait for each other's copying
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, dir=self.archive.parent) as compressed:
+            compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 31)  # 31: gzip framing
+            compressed.write(compressor.compress(header))
+            while chunk := data.read(CHUNK_BYTES):
+                compressed.write(compressor.compress(chunk))
+            compressed.write(compressor.compress(padding))
+            compressed.write(compressor.flush())
+            length = compressed.tell()
+            compressed.seek(0)
+            with self._lock:
+                offset = self._file.tell()
+                shutil.copyfileobj(compressed, self._file)
+                self.entries.append(IndexEntry(path=path, size=size, offset=offset, length=length,
+                                               tar_offset=self._tar_offset))
+                self._tar_offset += len(header) + size + len(padding)
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            # the end-of-archive marker, two empty blocks
+            compressor = zlib.compressobj(self.compresslevel, zlib.DEFLATED, 31)
+            self._file.write(compressor.compress(b"\0" * tarfile.BLOCKSIZE * 2) + compressor.flush())
+            self._file.close()
+            index = {"format": 1, "archive": self.archive.name,
+                     "members": [dataclasses.asdict(e) for e in self.entries]}
+            self.index.write_text(json.dumps(index, indent=1))
+        print(f"Wrote {len(self.entries)} files to {self.archive} ({self.archive.stat().st_size} bytes), "
+              f"index in {self.index}")
+        sys.stdout.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_index(index: pathlib.Path | str) -> list[IndexEntry]:
+    return [IndexEntry(**m) for m in json.loads(pathlib.Path(index).read_text())["members"]]
+
+
+def read_member(archive: BinaryIO, entry: IndexEntry) -> bytes:
+    """Decompresses just the one member of the archive that `entry` describes, and returns its contents."""
+    archive.seek(entry.offset)
+    block = zlib.decompress(archive.read(entry.length), 31)
+    # the header (two of them for long names), then the data padded to whole blocks
+    start = len(block) - entry.size - (-entry.size % tarfile.BLOCKSIZE)
+    return block[start:start + entry.size]
+
+
+def extract(archive: pathlib.Path | str, patterns: Iterable[str], to: pathlib.Path | str,
+            index: pathlib.Path | str | None = None) -> list[IndexEntry]:
+    """Extracts the members whose path matches any of the glob `patterns` into the directory `to`."""
+    archive = pathlib.Path(archive)
+    index = index or archive.with_name(archive.name.removesuffix(".tar.gz") + ".index.json")
+    patterns = list(patterns)
+    selected = [e for e in read_index(index) if any(fnmatch.fnmatchcase(e.path, p) for p in patterns)]
+    to = pathlib.Path(to)
+    with open(archive, "rb") as f:
+        for entry in selected:
+            target = to / entry.path
+            if not target.resolve().is_relative_to(to.resolve()):
+                raise ValueError(f"Refusing to extract {entry.path} outside of {to}")
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(read_member(f, entry))
+    return selected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extracts files from a debug bundle archive using its index.")
+    parser.add_argument("archive", help="The .tar.gz written by logs.py --output-format=tar.")
+    parser.add_argument("patterns", nargs="+", help="Glob patterns of member paths, e.g. 'namespaces/minio/*'.")
+    parser.add_argument("--to", default=".", help="Directory to extract into (default: .)")
+    parser.add_argument("--index", help="The index file, by default the one next to the archive.")
+    args = parser.parse_args()
+    for entry in extract(args.archive, args.patterns, args.to, args.index):
+        print(f"{entry.path} ({entry.size} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Records which deploy steps have completed, so that a failed deploy can be resumed.
+
+After a step finishes, its fingerprint is written to a JSON state file,
+
+    {"cluster": "<uid of the kube-system namespace>",
+     "steps": {"Install Kyverno": {"fingerprint": "3f1c...", "finished": 1760716976.2}}}
+
+The fingerprint covers the step's source code, its declared inputs (manifest files and
+directories by content, versions and branches as they are) and the fingerprints of the steps it
+needs, so a changed manifest re-runs the step and everything downstream of it. The state
+belongs to one cluster; once the cluster is recreated, the recorded steps no longer count.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import inspect
+import json
+import os
+import pathlib
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from rhoai_in_kind.artifacts import file_sha256
+from rhoai_in_kind.render import tree_hash
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Iterable
+
+    from rhoai_in_kind.kube import KubeClient
+
+
+def fingerprint(fn: Callable[[], Any], inputs: Iterable[str | pathlib.Path], needs: Iterable[str] = ()) -> str:
+    """Hashes the source of `fn`, `inputs` and `needs`, the fingerprints of the steps it depends on.
+
+    A `pathlib.Path` input is hashed by content, a directory including everything under it; a
+    missing path counts as an input of its own, so that creating it changes the fingerprint.
+    """
+    digest = hashlib.sha256()
+    try:
+        digest.update(inspect.getsource(fn).encode())
+    except (OSError, TypeError):
+        digest.update(fn.__code__.co_code)
+    for item in inputs:
+        if isinstance(item, pathlib.Path):
+            if item.is_dir():
+                value = f"dir {item} {tree_hash(item)}"
+            elif item.exists():
+                value = f"file {item} {file_sha256(item)}"
+            else:
+                value = f"missing {item}"
+        else:
+            value = f"str {item}"
+        digest.update(value.encode() + b"\0")
+    for need in needs:
+        digest.update(f"need {need}".encode() + b"\0")
+    return digest.hexdigest()
+
+
+class Checkpoints:
+    """The state file of one cluster.
+
+    `cluster` may be a function that returns the cluster's identity; it is called when the state
+    is first needed, so that a deploy can start before the cluster answers.
+    """
+
+    def __init__(self, path: pathlib.Path | str, cluster: str | Callable[[], str]):
+        self.path = pathlib.Path(path)
+        self._cluster = cluster
+        self._lock = threading.Lock()
+        self._steps: dict[str, dict] | None = None
+
+    def completed(self, step: str, fingerprint: str) -> bool:
+        """The step has finished on this cluster before, with the same fingerprint."""
+        with self._lock:
+            return (self._load().get(step) or {}).get("fingerprint") == fingerprint
+
+    def record(self, step: str, fingerprint: str):
+        with self._lock:
+            self._load()[step] = {"fingerprint": fingerprint, "finished": time.time()}
+            self._save()
+
+    def _load(self) -> dict[str, dict]:
+        """The recorded steps, read when first needed; caller holds the lock."""
+        if self._steps is not None:
+            return self._steps
+        if callable(self._cluster):
+            self._cluster = self._cluster()
+        self._steps = {}
+        try:
+            state = json.loads(self.path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return self._steps
+        if state.get("cluster") == self._cluster:
+            self._steps = state.get("steps") or {}
+        else:
+            print(f"Checkpoints in {self.path} are from another cluster, ignoring them")
+        return self._steps
+
+    def _save(self):
+        """Writes the state file atomically; caller holds the lock."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"cluster": self._cluster, "steps": self._steps}, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def cluster_uid(client: KubeClient) -> str:
+    """Identifies the cluster by the uid of its kube-system namespace, which is new in every cluster."""
+    return client.get("/api/v1/namespaces/kube-system")["metadata"]["uid"]
@@ -0,0 +1,137 @@
+"""Lists the resource types a cluster serves, from the aggregated discovery documents, cached on disk.
+
+`kubectl api-resources` asks every group version for its resources, one request each. Aggregated
+discovery (Kubernetes 1.26 and later) serves all of them in two documents, `/api` for the core
+group and `/apis` for the rest, with the verbs and scope of every resource,
+
+    for r in discover(client, verb="list"):
+        r.api_version, r.resource, r.namespaced
+
+Only the preferred version of each group is returned, so the same objects are not listed once
+per version, and neither under the aliases in `ALIASES`.
+
+The documents are cached in `discovery/` in the artifact cache directory together with their
+ETag, so that checking whether they are still current is a request that comes back empty. Within
+`ttl` seconds of being fetched, they are used without asking at all; a document the server sent
+without an ETag is only reused that way.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+import time
+from typing import TYPE_CHECKING
+
+from rhoai_in_kind.artifacts import default_cache_dir
+
+if TYPE_CHECKING:
+    from rhoai_in_kind.kube import KubeClient
+
+AGGREGATED_DISCOVERY = ("application/json;g=apidiscovery.k8s.io;v=v2;as=APIGroupDiscoveryList,"
+                        "application/json;g=apidiscovery.k8s.io;v=v2beta1;as=APIGroupDiscoveryList,"
+                        "application/json")
+
+# the same objects served by two groups, (group, resource) -> the one to keep if it is served too
+ALIASES = {
+    ("events.k8s.io", "events"): ("", "events"),
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class ApiResource:
+    group: str
+    version: str
+    # the plural name used in API paths, e.g. "deployments"
+    resource: str
+    kind: str
+    namespaced: bool
+    verbs: frozenset[str]
+
+    @property
+    def api_version(self) -> str:
+        return f"{self.group}/{self.version}" if self.group else self.version
+
+
+class DiscoveryCache:
+    def __init__(self, root: pathlib.Path | str | None = None, ttl: float = 0.0):
+        self.root = pathlib.Path(root) if root is not None else default_cache_dir() / "discovery"
+        self.ttl = ttl
+
+    def document(self, client: KubeClient, path: str) -> dict:
+        """Returns the discovery document at `path`, from the cache if the server says it is still current."""
+        server = hashlib.sha256(f"{client.host}:{client.port}{client.base_path}".encode()).hexdigest()[:16]
+        file = self.root / f"{server}{path.replace('/', '-')}.json"
+        try:
+            cached = json.loads(file.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            cached = None
+        if cached and time.time() - cached["fetched"] < self.ttl:
+            return cached["document"]
+
+        document, etag = client.get_if_changed(path, cached and cached["etag"], accept=AGGREGATED_DISCOVERY)
+        if document is None:
+            document = cached["document"]
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=f".{file.name}-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"etag": etag, "fetched": time.time(), "document": document}, f)
+        os.replace(tmp, file)
+        return document
+
+
+def _aggregated_resources(document: dict) -> list[ApiResource]:
+    resources = []
+    for group in document.get("items") or []:
+        versions = group.get("versions") or []
+        if not versions:
+            continue
+        # versions come in order of preference
+        preferred = versions[0]
+        for r in preferred.get("resources") or []:
+            resources.append(ApiResource(
+                group=(group.get("metadata") or {}).get("name", ""),
+                version=preferred["version"],
+                resource=r["resource"],
+                kind=(r.get("responseKind") or {}).get("kind", ""),
+                namespaced=r.get("scope") == "Namespaced",
+                verbs=frozenset(r.get("verbs") or []),
+            ))
+    return resources
+
+
+def _legacy_resources(client: KubeClient, document: dict) -> list[ApiResource]:
+    """Asks each preferred group version of a server without aggregated discovery, like kubectl does."""
+    if document.get("kind") == "APIVersions":
+        group_versions = [("", document["versions"][0])]
+    else:
+        group_versions = [(g["name"], g["preferredVersion"]["version"]) for g in document.get("groups") or []]
+    resources = []
+    for group, version in group_versions:
+        path = f"/apis/{group}/{version}" if group else f"/api/{version}"
+        for r in client.get(path).get("resources") or []:
+            if "/" in r["name"]:  # subresources such as deployments/status
+                continue
+            resources.append(ApiResource(group, version, r["name"], r["kind"], r["namespaced"],
+                                         frozenset(r.get("verbs") or [])))
+    return resources
+
+
+def discover(client: KubeClient, cache: DiscoveryCache | None = None, verb: str | None = None) -> list[ApiResource]:
+    """Returns the preferred version of every resource type the server has, that supports `verb` if given."""
+    cache = cache or DiscoveryCache()
+    resources = []
+    for path in ("/api", "/apis"):
+        document = cache.document(client, path)
+        if document.get("kind") == "APIGroupDiscoveryList":
+            resources += _aggregated_resources(document)
+        else:
+            resources += _legacy_resources(client, document)
+
+    served = {(r.group, r.resource) for r in resources}
+    return [r for r in resources
+            if (verb is None or verb in r.verbs) and ALIASES.get((r.group, r.resource)) not in served]
@@ -0,0 +1,296 @@
+"""Exports what a passing deploy set up as one ordered bundle of objects, and applies it to a new cluster.
+
+Once a deploy has passed, the objects it leaves in the cluster are fixed by its inputs: cert-manager,
+Istio, what Argo CD synced, the CRDs, the policies, the RBAC. A later deploy with the same inputs
+(the same `Plan.fingerprint()`) can apply them all at once instead of going through the steps,
+without istioctl, Argo CD syncs or rendering remote kustomizations,
+
+    bundles = BundleStore()
+    bundles.store(export_bundle(client, plan.fingerprint()))     # after the deploy passed
+    ...
+    bundle = bundles.lookup(plan.fingerprint())                   # on the next cluster
+    bundle.apply(client, readiness)
+
+Only what the deploy itself wrote is exported. Every object is cut down to the fields that its
+managedFields say belong to the deploy's field managers (`DEPLOY_MANAGERS`: kubectl, `ApplyBatch`,
+Argo CD, istioctl), so defaulted fields, cluster IPs, CA bundles filled in by injectors and the
+objects controllers create on their own are left out; the controllers make them again. Objects
+Kyverno generated from the deploy's policies are kept with all their fields.
+
+`apply` goes through the bundle in phases, each applied with one server-side apply request per
+object (the API has no batch apply), `jobs` at a time,
+
+    crds        CustomResourceDefinitions; waits until they are Established
+    namespaces  Namespaces
+    admission   cluster-scoped objects (webhook configurations, ClusterPolicies, RBAC) and
+                everything in `ADMISSION_NAMESPACES`; waits for their Deployments and policies,
+                so that the rest is admitted and mutated as it was during the deploy
+    rest        everything else; waits for the Deployments to be Available
+
+Objects that fail because something they depend on is not serving yet are applied again, with
+backoff, until `timeout`. Status that the deploy set (the fake DSC and DSCI) is applied last.
+
+Bundles are kept in `bundles/` in the artifact cache. They contain the secrets the deploy created,
+such as the cluster CA from pki/ next to them.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import dataclasses
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import time
+from typing import TYPE_CHECKING
+
+from rhoai_in_kind.artifacts import default_cache_dir
+from rhoai_in_kind.batch import ApplyBatch, ApplyError
+from rhoai_in_kind.discovery import discover
+from rhoai_in_kind.images import object_images
+from rhoai_in_kind.kube import FIELD_MANAGER
+from rhoai_in_kind.readiness import clusterpolicy_ready, crd_established, deployment_available
+from rhoai_in_kind.retry import retry
+from rhoai_in_kind.tracing import span
+
+if TYPE_CHECKING:
+    from typing import Any, Iterable, Iterator
+
+    from rhoai_in_kind.discovery import ApiResource
+    from rhoai_in_kind.kube import KubeClient
+    from rhoai_in_kind.readiness import ReadinessEngine, Waiter
+
+PHASES = ("crds", "namespaces", "admission", "rest")
+
+# prefixes of the field managers the deploy writes with; kubectl uses kubectl-client-side-apply, kubectl-create, ...
+DEPLOY_MANAGERS = ("kubectl", FIELD_MANAGER, "argocd", "istio-operator", "istioctl")
+GENERATED_LABEL = "generate.kyverno.io/policy-name"
+# the admission controllers the rest of the objects go through
+ADMISSION_NAMESPACES = ("cert-manager", "kyverno")
+
+# (group, resource) the deploy never writes, and of which there are many
+SKIPPED_RESOURCES = {
+    ("", "events"),
+    ("events.k8s.io", "events"),
+    ("", "pods"),
+    ("", "endpoints"),
+    ("discovery.k8s.io", "endpointslices"),
+    ("apps", "replicasets"),
+    ("apps", "controllerrevisions"),
+    ("coordination.k8s.io", "leases"),
+}
+
+LAST_APPLIED = "kubectl.kubernetes.io/last-applied-configuration"
+
+
+@dataclasses.dataclass
+class Bundle:
+    fingerprint: str
+    # phase -> objects, in the order they are applied
+    phases: dict[str, list[dict]]
+    # objects with only the `status` the deploy set, applied to the status subresource
+    status: list[dict] = dataclasses.field(default_factory=list)
+    exported: float = 0.0
+
+    @classmethod
+    def load(cls, path: pathlib.Path | str) -> Bundle:
+        return cls(**json.loads(pathlib.Path(path).read_text()))
+
+    def save(self, path: pathlib.Path | str):
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".bundle-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(dataclasses.asdict(self), f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def objects(self) -> Iterator[dict]:
+        for phase in PHASES:
+            yield from self.phases.get(phase) or []
+
+    def images(self) -> list[str]:
+        """The images the bundle's workloads and ImageStreams refer to, each once."""
+        return list(dict.fromkeys(image for obj in self.objects() for image in object_images(obj)))
+
+    def apply(self, client: KubeClient, readiness: ReadinessEngine, jobs: int = 4, timeout: float = 300):
+        """Applies the bundle phase by phase, see the module docstring."""
+        with span("Apply golden bundle", "step"):
+            start = time.monotonic()
+            phases = {phase: self.phases.get(phase) or [] for phase in PHASES}
+            self._apply_phase("crds", client, jobs, timeout, [crd_established(o["metadata"]["name"])
+                                                             for o in phases["crds"]], readiness)
+            self._apply_phase("namespaces", client, jobs, timeout, [], readiness)
+            self._apply_phase("admission", client, jobs, timeout, _deployments(phases["admission"]) + [
+                clusterpolicy_ready(o["metadata"]["name"]) for o in phases["admission"] if o["kind"] == "ClusterPolicy"
+            ], readiness)
+            self._apply_phase("rest", client, jobs, timeout, [], readiness)
+            if self.status:
+                _apply_until_applied(client, self.status, "apply the status in the golden bundle", jobs, timeout,
+                                     subresource="status")
+            with span("wait for deployments", "wait"):
+                readiness.wait(*_deployments(phases["rest"]), timeout=timeout)
+            print(f"Applied the golden bundle ({sum(map(len, phases.values()))} objects) "
+                  f"in {time.monotonic() - start:.1f}s")
+            sys.stdout.flush()
+
+    def _apply_phase(self, phase: str, client: KubeClient, jobs: int, timeout: float, waiters: list[Waiter],
+                     readiness: ReadinessEngine):
+        objects = self.phases.get(phase) or []
+        if not objects:
+            return
+        with span(f"apply {phase}", "bundle"):
+            _apply_until_applied(client, objects, f"apply the {phase} in the golden bundle", jobs, timeout)
+            if waiters:
+                readiness.wait(*waiters, timeout=timeout)
+
+
+class BundleStore:
+    """Golden bundles by plan fingerprint, in `bundles/` in the artifact cache."""
+
+    def __init__(self, root: pathlib.Path | str | None = None):
+        self.root = pathlib.Path(root) if root is not None else default_cache_dir() / "bundles"
+
+    def path(self, fingerprint: str) -> pathlib.Path:
+        return self.root / f"{fingerprint}.json"
+
+    def lookup(self, fingerprint: str) -> Bundle | None:
+        try:
+            return Bundle.load(self.path(fingerprint))
+        except FileNotFoundError:
+            return None
+
+    def store(self, bundle: Bundle) -> pathlib.Path:
+        path = self.path(bundle.fingerprint)
+        bundle.save(path)
+        print(f"Exported the golden bundle ({sum(map(len, bundle.phases.values()))} objects) to {path}")
+        sys.stdout.flush()
+        return path
+
+
+def export_bundle(client: KubeClient, fingerprint: str, jobs: int = 8,
+                  admission_namespaces: Iterable[str] = ADMISSION_NAMESPACES) -> Bundle:
+    """Lists every object in the cluster and keeps what the deploy wrote, see the module docstring."""
+    admission_namespaces = set(admission_namespaces)
+    resources = [r for r in discover(client, verb="list")
+                 if "patch" in r.verbs and (r.group, r.resource) not in SKIPPED_RESOURCES]
+    phases: dict[str, list[dict]] = {phase: [] for phase in PHASES}
+    status = []
+    with span("export golden bundle", "bundle"):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="export") as pool:
+            listed = {r: pool.submit(_list, client, r) for r in resources}
+        for r, future in listed.items():
+            try:
+                items = future.result()
+            except Exception as e:
+                # an aggregated API whose server is down; its objects are not stored in the cluster anyway
+                print(f"Warning: not exporting {r.resource} {r.api_version}: {e}", file=sys.stderr)
+                continue
+            for item in items:
+                obj, obj_status = desired_state({"apiVersion": r.api_version, "kind": r.kind, **item})
+                if obj is None:
+                    continue
+                phases[_phase(obj, admission_namespaces)].append(obj)
+                if obj_status is not None:
+                    status.append(obj_status)
+    for objects in phases.values():
+        objects.sort(key=lambda o: (o["metadata"].get("namespace") or "", o["kind"], o["metadata"]["name"]))
+    return Bundle(fingerprint=fingerprint, phases=phases, status=status, exported=time.time())
+
+
+def desired_state(obj: dict, managers: tuple[str, ...] = DEPLOY_MANAGERS) -> tuple[dict | None, dict | None]:
+    """`obj` cut down to the fields `managers` own, and its status likewise; None for what they do not own."""
+    metadata = obj["metadata"]
+    generated = GENERATED_LABEL in (metadata.get("labels") or {})
+    owned = [e for e in metadata.get("managedFields") or []
+             if (generated or e.get("manager", "").startswith(managers)) and e.get("fieldsV1")]
+    fields = _merge(e["fieldsV1"] for e in owned if not e.get("subresource"))
+    if not fields:
+        return None, None
+    ref = {"name": metadata["name"], **({"namespace": metadata["namespace"]} if metadata.get("namespace") else {})}
+    state = _prune(obj, fields)
+    state.pop("status", None)
+    state_metadata = {**ref, **(state.pop("metadata", None) or {})}
+    # kubectl's copy of what it applied, as big as the object itself
+    state_metadata.get("annotations", {}).pop(LAST_APPLIED, None)
+    if not state_metadata.get("annotations", True):
+        del state_metadata["annotations"]
+    state = {"apiVersion": obj["apiVersion"], "kind": obj["kind"], "metadata": state_metadata, **state}
+
+    status_fields = _merge(e["fieldsV1"] for e in owned if e.get("subresource") == "status").get("f:status")
+    status = None
+    if status_fields is not None and obj.get("status"):
+        status = {"apiVersion": obj["apiVersion"], "kind": obj["kind"], "metadata": ref,
+                  "status": _prune(obj["status"], status_fields)}
+    return state, status
+
+
+def _list(client: KubeClient, resource: ApiResource) -> list[dict]:
+    path = "/api/v1" if resource.api_version == "v1" else f"/apis/{resource.api_version}"
+    items, _ = client.list(f"{path}/{resource.resource}")
+    return items
+
+
+def _phase(obj: dict, admission_namespaces: set[str]) -> str:
+    if obj["kind"] == "CustomResourceDefinition":
+        return "crds"
+    if obj["kind"] == "Namespace":
+        return "namespaces"
+    namespace = obj["metadata"].get("namespace")
+    return "admission" if namespace is None or namespace in admission_namespaces else "rest"
+
+
+def _deployments(objects: list[dict]) -> list[Waiter]:
+    return [deployment_available(o["metadata"]["namespace"], o["metadata"]["name"])
+            for o in objects if o["kind"] == "Deployment"]
+
+
+def _apply_until_applied(client: KubeClient, objects: list[dict], description: str, jobs: int, timeout: float,
+                         subresource: str | None = None):
+    """Applies `objects`, then again the ones that failed for a transient reason, until all are applied."""
+    pending = list(objects)
+
+    def attempt(_remaining: float):
+        nonlocal pending
+        results = ApplyBatch(client, jobs=jobs, subresource=subresource).add(*pending).apply(check=False)
+        failed = [(o, r) for o, r in zip(pending, results) if not r.ok]
+        pending = [o for o, _ in failed]
+        if failed:
+            raise ApplyError(results)
+
+    retry(attempt, description, timeout=timeout)
+
+
+def _merge(field_sets: Iterable[dict]) -> dict:
+    """The union of managedFields `fieldsV1` sets."""
+    merged: dict = {}
+    for fields in field_sets:
+        for key, value in fields.items():
+            merged[key] = _merge([merged[key], value]) if key in merged else value
+    return merged
+
+
+def _prune(value: Any, fields: dict) -> Any:
+    """The parts of `value` listed in a `fieldsV1` set; a field listed without children is kept whole."""
+    if not fields or not isinstance(value, (dict, list)):
+        return value
+    if isinstance(value, dict):
+        return {k: _prune(v, fields[f"f:{k}"]) for k, v in value.items() if f"f:{k}" in fields}
+    # list items are listed by their key fields (k:{"name":"x"}), as values of a set (v:"x") or by index (i:0)
+    keys = [(key[0], json.loads(key[2:]) if key[0] in "kv" else key[2:], sub)
+            for key, sub in fields.items() if key[:2] in ("k:", "v:", "i:")]
+    kept = []
+    for i, item in enumerate(value):
+        for kind, key, sub in keys:
+            if kind == "k" and isinstance(item, dict) and all(item.get(k) == v for k, v in key.items()):
+                kept.append({**key, **_prune(item, sub)})
+                break
+            if (kind == "v" and item == key) or (kind == "i" and key == str(i)):
+                kept.append(_prune(item, sub))
+                break
+    return kept
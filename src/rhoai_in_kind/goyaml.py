@@ -0,0 +1,418 @@
+"""Formats JSON-like data as YAML byte for byte the way `kubectl -o yaml` prints it.
+
+kubectl turns objects into YAML with sigs.k8s.io/yaml, that is go-yaml v2 with its default
+settings: block style, keys in go-yaml's "natural" order (runs of digits compare as numbers),
+sequences in a mapping not indented below their key, no line wrapping. A string is written
+
+    plain           unless it would read back as something else (`"true"`, `"0755"`, a timestamp, ...)
+    'single'        when it starts with or contains a YAML indicator (`'*'`, `'foo: bar'`)
+    |               (a literal block) when it has line breaks
+    "double"        when nothing else can hold it, with go-yaml's escapes
+
+and a number as Go formats it (`strconv.FormatFloat(f, 'g', -1, 64)`), so the debug bundle
+stays the same as when it was written by `kubectl get -o yaml`.
+
+    print(dump_yaml({"apiVersion": "v1", "kind": "ConfigMap", "data": {"script": "set -e\\necho hi\\n"}}))
+"""
+
+from __future__ import annotations
+
+import calendar
+import decimal
+import functools
+import math
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any
+
+BEST_INDENT = 2
+# longer keys are written as `? key` / `: value`
+MAX_SIMPLE_KEY_BYTES = 128
+
+_BREAKS = "\r\n\x85\u2028\u2029"
+# everything go-yaml's is_printable rejects; it escapes these in double quotes and never writes them plain
+_NOT_PRINTABLE = re.compile("[^\n\x20-\x7e\xa0-\ud7ff\ue000-\ufefe\uff00-\ufffd]")
+_BREAK = re.compile(f"[{_BREAKS}]")
+_SPACE_BREAK = re.compile(f" [{_BREAKS}]")
+_BREAK_SPACE = re.compile(f"[{_BREAKS}] ")
+_BLOCK_INDICATOR = re.compile(f":(?:[ \t]|\\Z)|(?<=[ \t\0{_BREAKS}])#")
+
+# what plain scalars resolve to other than a string (go-yaml v2 resolve.go)
+_RESOLVED = {
+    "y", "Y", "yes", "Yes", "YES", "true", "True", "TRUE", "on", "On", "ON",
+    "n", "N", "no", "No", "NO", "false", "False", "FALSE", "off", "Off", "OFF",
+    "", "~", "null", "Null", "NULL",
+    ".nan", ".NaN", ".NAN", ".inf", ".Inf", ".INF", "+.inf", "+.Inf", "+.INF", "-.inf", "-.Inf", "-.INF",
+}
+_INT = re.compile(r"([-+]?)(0[xX][0-9a-fA-F]+|0[oO][0-7]+|0[bB][01]+|0[0-7]*|[1-9][0-9]*)")
+_FLOAT = re.compile(r"[-+]?(\.[0-9]+|[0-9]+(\.[0-9]*)?)([eE][-+]?[0-9]+)?")
+_DOT_FLOAT = re.compile(r"\.[0-9]+([eE][-+]?[0-9]+)?")
+# most keys and values: neither YAML indicators nor numbers, so they are plain unless they are in _RESOLVED
+_IDENTIFIER = re.compile(r"[A-Za-z_/][-A-Za-z0-9_./]*")
+_BASE60_FLOAT = re.compile(r"[-+]?[0-9][0-9_]*(?::[0-5]?[0-9])+(?:\.[0-9_]*)?")
+_TIMESTAMP = re.compile(r"([0-9]{4})-([0-9]{1,2})-([0-9]{1,2})"
+                        r"(?:(?:([Tt])|( ))([0-9]{1,2}):([0-9]{1,2}):([0-9]{1,2})(?:[.,][0-9]+)?"
+                        r"(Z|[-+][0-9]{2}:[0-9]{2})?)?")
+
+_ESCAPES = {
+    "\0": "0", "\a": "a", "\b": "b", "\t": "t", "\n": "n", "\v": "v", "\f": "f", "\r": "r", "\x1b": "e",
+    '"': '"', "\\": "\\", "\x85": "N", "\u2028": "L", "\u2029": "P",
+}
+
+
+def dump_yaml(obj: Any) -> str:
+    """Formats JSON-like data as block-style YAML, the way `kubectl -o yaml` prints it."""
+    emitter = _Emitter()
+    emitter.node(obj)
+    emitter.write_indent()
+    return "".join(emitter.out)
+
+
+def _is_timestamp(s: str) -> bool:
+    """Whether `time.Parse` accepts `s` in one of go-yaml's timestamp layouts."""
+    match = _TIMESTAMP.fullmatch(s)
+    if match is None:
+        return False
+    year, month, day = int(match[1]), int(match[2]), int(match[3])
+    if not 1 <= month <= 12 or not 1 <= day <= calendar.mdays[month] + (month == 2 and calendar.isleap(year)):
+        return False
+    if match[6] is None:
+        return True
+    # the layouts with a "T" have a time zone, the space-separated one does not
+    if (match[4] is None) != (match[9] is None):
+        return False
+    if int(match[6]) > 23 or int(match[7]) > 59 or int(match[8]) > 59:
+        return False
+    return match[9] in (None, "Z") or (int(match[9][1:3]) <= 24 and int(match[9][4:6]) <= 60)
+
+
+def _is_int(s: str) -> bool:
+    """Whether Go's `strconv.ParseInt(s, 0, 64)` or `strconv.ParseUint(s, 0, 64)` accepts `s`."""
+    match = _INT.fullmatch(s)
+    if match is None:
+        return False
+    digits = match[2]
+    prefix = digits[:2].lower()
+    if prefix in ("0x", "0o", "0b"):
+        value = int(digits[2:], {"0x": 16, "0o": 8, "0b": 2}[prefix])
+    else:
+        value = int(digits, 8 if digits.startswith("0") else 10)
+    if match[1] == "-":
+        return value <= 2 ** 63
+    return value < 2 ** 63 or (not match[1] and value < 2 ** 64)
+
+
+def _plain_is_string(s: str) -> bool:
+    """Whether `s` written plain reads back as the same string, not as a bool, null, number or timestamp."""
+    if not s:
+        return False
+    first = s[0]
+    if first not in "yYnNtTfFoO~.+-0123456789":
+        return True
+    if s in _RESOLVED:
+        return False
+    if first == ".":
+        return _DOT_FLOAT.fullmatch(s) is None
+    if first in "yYnNtTfFoO~":
+        return True
+    if _is_timestamp(s):
+        return False
+    plain = s.replace("_", "")
+    if _is_int(plain):
+        return False
+    # strconv.ParseFloat fails on what is out of range
+    return _FLOAT.fullmatch(plain) is None or math.isinf(float(plain))
+
+
+def _format_float(value: float) -> str:
+    """`strconv.FormatFloat(value, 'g', -1, 64)`, with go-yaml's spelling of infinities and NaN."""
+    if math.isnan(value):
+        return ".nan"
+    if math.isinf(value):
+        return ".inf" if value > 0 else "-.inf"
+    sign = "-" if math.copysign(1.0, value) < 0 else ""
+    if value == 0:
+        return sign + "0"
+    # repr has the same shortest digits that round-trip as Go
+    _, digit_tuple, exponent = decimal.Decimal(repr(abs(value))).as_tuple()
+    digits = "".join(map(str, digit_tuple))
+    point = len(digits) + exponent
+    digits = digits.rstrip("0")
+    if point - 1 < -4 or point - 1 >= 6:
+        mantissa = digits[0] + ("." + digits[1:] if len(digits) > 1 else "")
+        return f"{sign}{mantissa}e{'-' if point - 1 < 0 else '+'}{abs(point - 1):02d}"
+    if point <= 0:
+        return f"{sign}0.{'0' * -point}{digits}"
+    if len(digits) <= point:
+        return sign + digits + "0" * (point - len(digits))
+    return f"{sign}{digits[:point]}.{digits[point:]}"
+
+
+def _go_key_less(a: str, b: str) -> bool:
+    """go-yaml v2's keyList.Less for string keys: letters by code point, runs of digits as numbers."""
+    digits = False
+    for i in range(min(len(a), len(b))):
+        if a[i] == b[i]:
+            digits = a[i].isdecimal()
+            continue
+        a_letter, b_letter = a[i].isalpha(), b[i].isalpha()
+        if a_letter and b_letter:
+            return a[i] < b[i]
+        if a_letter or b_letter:
+            return a_letter if digits else b_letter
+        a_number = b_number = 0
+        if a[i] == "0" or b[i] == "0":
+            j = i - 1
+            while j >= 0 and a[j].isdecimal():
+                if a[j] != "0":
+                    a_number = b_number = 1
+                    break
+                j -= 1
+        a_end = i
+        while a_end < len(a) and a[a_end].isdecimal():
+            a_number = a_number * 10 + int(a[a_end])
+            a_end += 1
+        b_end = i
+        while b_end < len(b) and b[b_end].isdecimal():
+            b_number = b_number * 10 + int(b[b_end])
+            b_end += 1
+        if a_number != b_number:
+            return a_number < b_number
+        if a_end != b_end:
+            return a_end < b_end
+        return a[i] < b[i]
+    return len(a) < len(b)
+
+
+_go_key = functools.cmp_to_key(lambda a, b: -1 if _go_key_less(a, b) else 1 if _go_key_less(b, a) else 0)
+
+
+def _sorted_keys(mapping: dict) -> list[str]:
+    # the orders only differ around digits and some punctuation, so a code point sort usually is the go-yaml one
+    keys = sorted(mapping)
+    if all(_go_key_less(a, b) for a, b in zip(keys, keys[1:])):
+        return keys
+    return sorted(keys, key=_go_key)
+
+
+@functools.lru_cache(maxsize=4096)
+def _string_style(text: str, simple_key: bool) -> str:
+    """How go-yaml writes a string: what its encoder asks for, and what the emitter then makes of it."""
+    if _IDENTIFIER.fullmatch(text):
+        return "double" if text in _RESOLVED else "plain"
+    if "\n" in text:
+        style = "literal"
+    elif _plain_is_string(text) and _BASE60_FLOAT.fullmatch(text) is None:
+        style = "plain"
+    else:
+        style = "double"
+    return _select_style(text, style, simple_key)
+
+
+def _select_style(text: str, style: str, simple_key: bool) -> str:
+    """go-yaml's yaml_emitter_analyze_scalar and yaml_emitter_select_scalar_style, in block context."""
+    if not text:
+        return style
+    line_breaks = _BREAK.search(text) is not None
+    special = _NOT_PRINTABLE.search(text) is not None
+    space_break = _SPACE_BREAK.search(text) is not None
+    break_space = _BREAK_SPACE.search(text) is not None
+    leading = text[0] == " " or text[0] in _BREAKS
+    trailing_space = text[-1] == " "
+    trailing = trailing_space or text[-1] in _BREAKS
+    followed_by_blank = len(text) == 1 or text[1] in " \t"
+    block_indicators = (
+        text[:3] in ("---", "...")
+        or text[0] in "#,[]{}&*!|>'\"%@`"
+        or text[0] in "?:-" and followed_by_blank
+        or _BLOCK_INDICATOR.search(text, 1) is not None
+    )
+
+    plain_allowed = not (leading or trailing or break_space or space_break or special or line_breaks
+                         or block_indicators)
+    single_allowed = not (break_space or space_break or special)
+    block_allowed = not (trailing_space or space_break or special)
+
+    if simple_key and line_breaks:
+        style = "double"
+    if style == "plain" and not plain_allowed:
+        style = "single"
+    if style == "single" and not single_allowed:
+        style = "double"
+    if style == "literal" and (not block_allowed or simple_key):
+        style = "double"
+    return style
+
+
+class _Emitter:
+    """The parts of go-yaml's emitter that block-style output of JSON data goes through."""
+
+    def __init__(self):
+        self.out: list[str] = []
+        self.column = 0
+        self.indent = -1
+        self.whitespace = True
+        self.indention = True
+
+    def put(self, text: str):
+        self.out.append(text)
+        self.column += len(text)
+
+    def put_break(self):
+        self.out.append("\n")
+        self.column = 0
+
+    def write_break(self, char: str):
+        if char == "\n":
+            self.put_break()
+        else:
+            self.out.append(char)
+            self.column = 0
+
+    def write_indent(self):
+        indent = max(self.indent, 0)
+        if not self.indention or self.column > indent or (self.column == indent and not self.whitespace):
+            self.put_break()
+        if self.column < indent:
+            self.put(" " * (indent - self.column))
+        self.whitespace = True
+        self.indention = True
+
+    def write_indicator(self, indicator: str, need_whitespace: bool, is_whitespace: bool, is_indention: bool):
+        if need_whitespace and not self.whitespace:
+            self.put(" ")
+        self.put(indicator)
+        self.whitespace = is_whitespace
+        self.indention = self.indention and is_indention
+
+    def increase_indent(self, flow: bool, indentless: bool) -> int:
+        previous = self.indent
+        if self.indent < 0:
+            self.indent = BEST_INDENT if flow else 0
+        elif not indentless:
+            self.indent += BEST_INDENT
+        return previous
+
+    def node(self, value: Any, mapping_context: bool = False, simple_key: bool = False):
+        if isinstance(value, dict) and value:
+            self.block_mapping(value)
+        elif isinstance(value, list) and value:
+            self.block_sequence(value, mapping_context)
+        elif isinstance(value, (dict, list)):
+            self.write_indicator("{" if isinstance(value, dict) else "[", True, True, False)
+            self.write_indicator("}" if isinstance(value, dict) else "]", False, False, False)
+        else:
+            self.scalar(value, simple_key)
+
+    def block_mapping(self, mapping: dict):
+        previous = self.increase_indent(False, False)
+        for key in _sorted_keys(mapping):
+            self.write_indent()
+            if len(key.encode()) <= MAX_SIMPLE_KEY_BYTES and not _BREAK.search(key):
+                self.node(key, mapping_context=True, simple_key=True)
+                self.write_indicator(":", False, False, False)
+            else:
+                self.write_indicator("?", True, False, True)
+                self.node(key, mapping_context=True)
+                self.write_indent()
+                self.write_indicator(":", True, False, True)
+            self.node(mapping[key], mapping_context=True)
+        self.indent = previous
+
+    def block_sequence(self, items: list, mapping_context: bool):
+        previous = self.increase_indent(False, mapping_context and not self.indention)
+        for item in items:
+            self.write_indent()
+            self.write_indicator("-", True, False, True)
+            self.node(item)
+        self.indent = previous
+
+    def scalar(self, value: Any, simple_key: bool):
+        if value is None:
+            text, style = "null", "plain"
+        elif isinstance(value, bool):
+            text, style = ("true" if value else "false"), "plain"
+        elif isinstance(value, int):
+            text, style = str(value), "plain"
+        elif isinstance(value, float):
+            text, style = _format_float(value), "plain"
+        else:
+            text = str(value)
+            style = _string_style(text, simple_key)
+
+        previous = self.increase_indent(True, False)
+        if style == "plain":
+            if not self.whitespace:
+                self.put(" ")
+            self.put(text)
+            self.whitespace = False
+            self.indention = False
+        elif style == "single":
+            self.write_single_quoted(text)
+        elif style == "literal":
+            self.write_literal(text)
+        else:
+            self.write_double_quoted(text)
+        self.indent = previous
+
+    def write_single_quoted(self, text: str):
+        self.write_indicator("'", True, False, False)
+        breaks = False
+        for char in text:
+            if char in _BREAKS:
+                if not breaks and char == "\n":
+                    self.put_break()
+                self.write_break(char)
+                self.indention = True
+                breaks = True
+            else:
+                if breaks:
+                    self.write_indent()
+                self.put("''" if char == "'" else char)
+                self.indention = False
+                breaks = False
+        self.write_indicator("'", False, False, False)
+
+    def write_double_quoted(self, text: str):
+        self.write_indicator('"', True, False, False)
+        chunk = []
+        for char in text:
+            if char in _ESCAPES:
+                chunk.append("\\" + _ESCAPES[char])
+            elif _NOT_PRINTABLE.match(char):
+                code = ord(char)
+                chunk.append(f"\\x{code:02X}" if code <= 0xFF else f"\\u{code:04X}" if code <= 0xFFFF
+                             else f"\\U{code:08X}")
+            else:
+                chunk.append(char)
+        self.put("".join(chunk))
+        self.write_indicator('"', False, False, False)
+
+    def write_literal(self, text: str):
+        self.write_indicator("|", True, False, False)
+        if text[0] == " " or text[0] in _BREAKS:
+            self.write_indicator(str(BEST_INDENT), False, False, False)
+        if text[-1] not in _BREAKS:
+            self.write_indicator("-", False, False, False)
+        elif len(text) == 1 or text[-2] in _BREAKS:
+            self.write_indicator("+", False, False, False)
+        self.put_break()
+        self.indention = True
+        self.whitespace = True
+        breaks = True
+        # whole lines at a time; only the line breaks need go-yaml's handling
+        for part in re.split(f"([{_BREAKS}])", text):
+            if not part:
+                continue
+            if part in _BREAKS:
+                self.write_break(part)
+                self.indention = True
+                breaks = True
+            else:
+                if breaks:
+                    self.write_indent()
+                self.put(part)
+                self.indention = False
+                breaks = False
@@ -0,0 +1,455 @@
+"""Finds the images the deploy is going to run and pulls them into the kind node up front.
+
+Pods otherwise pull their images one after another, each only once the step that creates it
+ran, and the readiness waits spend most of their time on that. The prefetcher renders the
+manifests in the background, picks the image references out of them, and loads each image
+once, a few at a time, while the deploy goes on,
+
+    prefetcher = ImagePrefetcher(NodeLoader(), jobs=4)
+    prefetcher.start([lambda: renders.local("components/01-argocd"), lambda: pathlib.Path("minio.yaml")],
+                     renders=renders)
+    with prefetcher:
+        plan.run()
+
+Images are taken from `image:` fields (containers and init containers, and custom resources
+that name an image the same way) and from the DockerImage tags of ImageStreams. An Argo CD
+Application is followed to the kustomization it syncs, with its `kustomize.images` overrides
+applied. The manifests are not parsed as YAML; they are scanned line by line, which is enough
+for kustomize output and for the hand-written files in components/.
+
+Prefetching is best effort: an image that cannot be loaded is reported and then pulled by the
+kubelet as it would have been anyway. Loaders (`LOADERS`) differ in where the image comes from:
+
+    node      `crictl pull` inside the node, through the registry mirrors containerd there uses
+    kind      pulled on the host, then `kind load docker-image`
+    archive   saved into the artifact cache once, then `kind load image-archive` (works offline)
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import dataclasses
+import hashlib
+import os
+import pathlib
+import re
+import shlex
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING, Protocol
+
+from rhoai_in_kind import sh
+from rhoai_in_kind.artifacts import CacheMiss, default_cache_dir, offline_from_environment
+from rhoai_in_kind.tracing import span
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Iterable, Iterator
+
+    from rhoai_in_kind.render import RenderCache
+
+KIND_CLUSTER = "kind"
+KIND_NODE = f"{KIND_CLUSTER}-control-plane"
+
+# registry/repository[:tag][@digest], lowercase repository path; excludes $(VARS), {{templates}} and the like
+IMAGE_REFERENCE = re.compile(
+    r"[a-z0-9]+(?:[._-]+[a-z0-9]+)*(?:\.[a-z0-9-]+)*(?::[0-9]+)?"
+    r"(?:/[a-z0-9]+(?:(?:[._]|__|-+)[a-z0-9]+)*)*"
+    r"(?::[A-Za-z0-9_][A-Za-z0-9_.-]{0,127})?"
+    r"(?:@sha256:[0-9a-f]{64})?"
+)
+
+_IMAGE_LINE = re.compile(r"\s*(?:-\s+)?image:\s+(\S.*)")
+_KEY_LINE = re.compile(r"(\s*)(?:-\s+)?([A-Za-z]+):\s*(.*)")
+
+
+def container_engine() -> str:
+    """The engine kind runs its nodes with: `KIND_EXPERIMENTAL_PROVIDER`, or docker if installed, like kind picks it."""
+    return os.environ.get("KIND_EXPERIMENTAL_PROVIDER") or ("docker" if shutil.which("docker") else "podman")
+
+
+def image_name(image: str) -> str:
+    """The image without its tag and digest, which is what kustomize matches `images` overrides on."""
+    name = image.split("@", 1)[0]
+    head, _, tail = name.rpartition(":")
+    return head if head and "/" not in tail else name
+
+
+def image_references(manifests: str) -> list[str]:
+    """The images named in a stream of manifests, each once, in the order they first appear."""
+    images = []
+    for document in _documents(manifests):
+        images += _container_images(document)
+        if _top_level(document, "kind") == "ImageStream":
+            images += _imagestream_images(document)
+    return list(dict.fromkeys(images))
+
+
+def object_images(obj: Any) -> list[str]:
+    """The images named in a manifest that has been parsed already, like `image_references` for its text."""
+    images = []
+    if isinstance(obj, dict):
+        if isinstance(obj.get("image"), str) and IMAGE_REFERENCE.fullmatch(obj["image"]):
+            images.append(obj["image"])
+        source = obj.get("from")
+        if isinstance(source, dict) and source.get("kind") == "DockerImage" and \
+                IMAGE_REFERENCE.fullmatch(source.get("name") or ""):
+            images.append(source["name"])
+        for value in obj.values():
+            images += object_images(value)
+    elif isinstance(obj, list):
+        for item in obj:
+            images += object_images(item)
+    return list(dict.fromkeys(images))
+
+
+@dataclasses.dataclass(frozen=True)
+class ArgoSource:
+    """The kustomization an Argo CD Application syncs."""
+    repo: str
+    path: str
+    revision: str
+    # `kustomize.images`, in Argo CD's `[old=]new[:tag][@digest]` format
+    images: tuple[str, ...] = ()
+
+    def apply_overrides(self, images: Iterable[str]) -> list[str]:
+        """Rewrites `images` the way the `kustomize.images` overrides rewrite the rendered manifests."""
+        rewritten = []
+        for image in images:
+            for override in self.images:
+                old, _, new = override.rpartition("=")
+                old = old or image_name(new)
+                if image == old or image_name(image) == old:
+                    # a new name without tag and digest keeps the ones the image had
+                    image = new if image_name(new) != new else new + image[len(image_name(image)):]
+                    break
+            rewritten.append(image)
+        return list(dict.fromkeys(rewritten))
+
+
+def argo_sources(manifests: str) -> list[ArgoSource]:
+    """The kustomize sources of the Argo CD Applications in a stream of manifests."""
+    sources = []
+    for document in _documents(manifests):
+        if _top_level(document, "kind") != "Application":
+            continue
+        lines = _lines(document)
+        indent = next((m.group(1) for m in map(_KEY_LINE.fullmatch, lines) if m and m.group(2) == "repoURL"), None)
+        if indent is None:
+            continue
+        fields, images, in_images = {}, [], False
+        for line in lines:
+            m = _KEY_LINE.fullmatch(line)
+            if in_images and line.lstrip().startswith("- ") and len(line) - len(line.lstrip()) >= len(indent) + 2:
+                images.append(_scalar(line.lstrip()[2:]))
+                continue
+            in_images = False
+            if m and m.group(1) == indent and m.group(2) in ("repoURL", "path", "targetRevision"):
+                fields[m.group(2)] = _scalar(m.group(3))
+            elif m and m.group(1) == indent + "  " and m.group(2) == "images":
+                in_images = True
+        if {"repoURL", "path"} <= fields.keys():
+            sources.append(ArgoSource(fields["repoURL"], fields["path"], fields.get("targetRevision") or "HEAD",
+                                      tuple(images)))
+    return sources
+
+
+def plan_images(sources: Iterable[Callable[[], pathlib.Path | str]], renders: RenderCache | None = None,
+                on_error: Callable[[BaseException], None] | None = None) -> Iterator[str]:
+    """Yields the images of all manifests `sources` return paths to, each once, as soon as its source is rendered.
+
+    Argo CD Applications are rendered with `renders` after the other sources, when given.
+    A source that fails is passed to `on_error` and skipped.
+    """
+    seen = set()
+    argo: list[ArgoSource] = []
+
+    def fresh(images: Iterable[str]) -> Iterator[str]:
+        for image in images:
+            if image not in seen:
+                seen.add(image)
+                yield image
+
+    for source in sources:
+        try:
+            manifests = pathlib.Path(source()).read_text()
+        except Exception as e:
+            if on_error is None:
+                raise
+            on_error(e)
+            continue
+        yield from fresh(image_references(manifests))
+        argo += argo_sources(manifests)
+    for application in argo if renders is not None else ():
+        try:
+            rendered = renders.remote(application.repo, application.path, application.revision)
+            images = application.apply_overrides(image_references(rendered.read_text()))
+        except Exception as e:
+            if on_error is None:
+                raise
+            e.add_note(f"while rendering {application.repo}//{application.path} at {application.revision}")
+            on_error(e)
+            continue
+        yield from fresh(images)
+
+
+class ImageLoader(Protocol):
+    def load(self, image: str):
+        """Makes `image` available to the kubelet on the kind node; raises if it could not."""
+
+
+@dataclasses.dataclass
+class NodeLoader:
+    """Pulls into the node's containerd with `crictl pull`, so a registry mirror configured for kind applies."""
+    node: str = KIND_NODE
+    engine: str = dataclasses.field(default_factory=container_engine)
+    timeout: float = 900
+
+    def load(self, image: str):
+        sh(f"{self.engine} exec {self.node} crictl pull {shlex.quote(image)}", capture_output=True,
+           timeout=self.timeout)
+
+
+@dataclasses.dataclass
+class KindLoader:
+    """Pulls on the host and copies the image in with `kind load docker-image`; needs a tag, not a digest."""
+    cluster: str = KIND_CLUSTER
+    engine: str = dataclasses.field(default_factory=container_engine)
+    timeout: float = 900
+
+    def load(self, image: str):
+        sh(f"{self.engine} pull {shlex.quote(image)} && "
+           f"kind load docker-image --name {self.cluster} {shlex.quote(image)}",
+           env={"KIND_EXPERIMENTAL_PROVIDER": self.engine}, capture_output=True, timeout=self.timeout)
+
+
+@dataclasses.dataclass
+class ArchiveLoader:
+    """Keeps a tarball of each image in the artifact cache and loads it with `kind load image-archive`.
+
+    A missing tarball is pulled and saved on the host first; in offline mode it raises `CacheMiss`.
+    """
+    root: pathlib.Path = dataclasses.field(default_factory=lambda: default_cache_dir() / "images")
+    offline: bool = dataclasses.field(default_factory=offline_from_environment)
+    cluster: str = KIND_CLUSTER
+    engine: str = dataclasses.field(default_factory=container_engine)
+    timeout: float = 900
+
+    def archive(self, image: str) -> pathlib.Path:
+        path = self.root / f"{hashlib.sha256(image.encode()).hexdigest()}.tar"
+        if path.exists():
+            return path
+        if self.offline:
+            raise CacheMiss(f"{image} is not in the image cache and pulling is disabled in offline mode")
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".image-", suffix=".tar")
+        os.close(fd)
+        try:
+            sh(f"{self.engine} pull {shlex.quote(image)} && "
+               f"{self.engine} save -o {shlex.quote(tmp)} {shlex.quote(image)}",
+               capture_output=True, timeout=self.timeout)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return path
+
+    def load(self, image: str):
+        sh(f"kind load image-archive --name {self.cluster} {shlex.quote(str(self.archive(image)))}",
+           env={"KIND_EXPERIMENTAL_PROVIDER": self.engine}, capture_output=True, timeout=self.timeout)
+
+
+@dataclasses.dataclass
+class FakeLoader:
+    """Loads nothing; records what it was asked to load, taking `delay` seconds for each. For trying out plans."""
+    delay: float = 0.0
+    # images whose load fails
+    failing: frozenset[str] = frozenset()
+    loaded: list[str] = dataclasses.field(default_factory=list)
+    peak_concurrency: int = 0
+    _running: int = 0
+    _lock: threading.Lock = dataclasses.field(default_factory=threading.Lock, repr=False)
+
+    def load(self, image: str):
+        with self._lock:
+            self._running += 1
+            self.peak_concurrency = max(self.peak_concurrency, self._running)
+        try:
+            time.sleep(self.delay)
+            if image in self.failing:
+                raise RuntimeError(f"failed to load {image}")
+            with self._lock:
+                self.loaded.append(image)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+
+LOADERS: dict[str, Callable[[], ImageLoader]] = {
+    "node": NodeLoader,
+    "kind": KindLoader,
+    "archive": ArchiveLoader,
+    "fake": FakeLoader,
+}
+
+
+class ImagePrefetcher:
+    """Loads images with up to `jobs` loads at a time, in the background, each image once.
+
+    Leaving the `with` block waits for the loads that are still running and prints what failed;
+    leaving it with an exception cancels the loads that have not started yet instead.
+    """
+
+    def __init__(self, loader: ImageLoader, jobs: int = 4):
+        self.loader = loader
+        self.jobs = jobs
+        self.failures: dict[str, BaseException] = {}
+        self.timings: dict[str, float] = {}
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="image")
+        self._planner: threading.Thread | None = None
+        self._futures: dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    def start(self, sources: Iterable[Callable[[], pathlib.Path | str]], renders: RenderCache | None = None):
+        """Renders `sources` in a background thread (see `plan_images`) and loads their images as they are found."""
+        def plan():
+            with span("plan image prefetch", "images"):
+                for image in plan_images(sources, renders, on_error=self._planning_failed):
+                    if self.submit(image) is None:
+                        return
+
+        self._planner = threading.Thread(target=plan, name="image-planner", daemon=True)
+        self._planner.start()
+        return self
+
+    def submit(self, image: str) -> concurrent.futures.Future | None:
+        """Loads `image` unless it was already; returns None once cancelled."""
+        with self._lock:
+            if self._cancelled.is_set():
+                return None
+            if image not in self._futures:
+                self._futures[image] = self._pool.submit(self._load, image)
+            return self._futures[image]
+
+    def _load(self, image: str):
+        start = time.monotonic()
+        try:
+            with span(image, "image"):
+                self.loader.load(image)
+        except Exception as e:
+            with self._lock:
+                self.failures[image] = e
+        finally:
+            with self._lock:
+                self.timings[image] = time.monotonic() - start
+
+    def _planning_failed(self, e: BaseException):
+        print(f"Warning: not prefetching the images of a manifest that could not be rendered: {e!r}", file=sys.stderr)
+        sys.stderr.flush()
+
+    def join(self):
+        """Waits until every image found has been loaded or failed to, and prints a summary."""
+        if self._planner is not None:
+            self._planner.join()
+        self._pool.shutdown(wait=True)
+        self.print_summary()
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def print_summary(self):
+        with self._lock:
+            loaded = len(self.timings) - len(self.failures)
+            total = sum(self.timings.values())
+            print(f"Prefetched {loaded} of {len(self._futures)} images ({total:.1f}s of loading)")
+            for image, e in sorted(self.failures.items()):
+                print(f"  failed to prefetch {image}: {_first_line(e)}")
+        sys.stdout.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.join()
+        else:
+            self.cancel()
+
+
+def _first_line(e: BaseException) -> str:
+    stderr = getattr(e, "stderr", None)
+    lines = (stderr or str(e) or repr(e)).strip().splitlines()
+    return lines[-1] if lines else repr(e)
+
+
+def _documents(manifests: str) -> Iterator[str]:
+    yield from re.split(r"^---[ \t]*(?:#.*)?$", manifests, flags=re.MULTILINE)
+
+
+def _lines(document: str) -> list[str]:
+    """The lines of a document, without comments, blank lines and block scalar contents."""
+    lines = []
+    block_indent = None
+    for line in document.splitlines():
+        stripped = line.lstrip()
+        indent = len(line) - len(stripped)
+        if block_indent is not None:
+            if not stripped or indent > block_indent:
+                continue
+            block_indent = None
+        if not stripped or stripped.startswith("#"):
+            continue
+        lines.append(line.rstrip())
+        if re.search(r":\s*[|>][-+0-9]*\s*(?:#.*)?$", line):
+            block_indent = indent
+    return lines
+
+
+def _scalar(value: str) -> str:
+    value = value.strip()
+    if value[:1] in ("'", '"'):
+        end = value.find(value[0], 1)
+        return value[1:end] if end > 0 else value[1:]
+    return re.sub(r"\s+#.*$", "", value)
+
+
+def _top_level(document: str, key: str) -> str | None:
+    for line in _lines(document):
+        if line.startswith(f"{key}:"):
+            return _scalar(line[len(key) + 1:])
+    return None
+
+
+def _container_images(document: str) -> list[str]:
+    images = []
+    for line in _lines(document):
+        m = _IMAGE_LINE.fullmatch(line)
+        if m and IMAGE_REFERENCE.fullmatch(image := _scalar(m.group(1))):
+            images.append(image)
+    return images
+
+
+def _imagestream_images(document: str) -> list[str]:
+    """The `spec.tags[].from.name` of the tags that refer to a DockerImage."""
+    images = []
+    lines = _lines(document)
+    for i, line in enumerate(lines):
+        m = _KEY_LINE.fullmatch(line)
+        if not (m and m.group(2) == "from" and not m.group(3)):
+            continue
+        indent = len(line) - len(line.lstrip())
+        fields = {}
+        for child in lines[i + 1:]:
+            if len(child) - len(child.lstrip()) <= indent:
+                break
+            c = _KEY_LINE.fullmatch(child)
+            if c:
+                fields[c.group(2)] = _scalar(c.group(3))
+        if fields.get("kind") == "DockerImage" and IMAGE_REFERENCE.fullmatch(fields.get("name", "")):
+            images.append(fields["name"])
+    return images
@@ -0,0 +1,384 @@
+"""Small Kubernetes API client that talks HTTPS directly and keeps its connections open.
+
+Every `kubectl` invocation pays for process startup, kubeconfig parsing, API discovery and a
+fresh TLS handshake. `KubeClient` does the kubeconfig and TLS setup once and then reuses
+keep-alive connections from a pool, so a request costs one round trip.
+
+    client = KubeClient.from_kubeconfig()
+    pods, _ = client.list("/api/v1/namespaces/kube-system/pods")
+    client.apply({"apiVersion": "v1", "kind": "Namespace", "metadata": {"name": "minio"}})
+
+The client is thread-safe. Paths are plain API paths; `resource_path` builds them from an
+apiVersion and kind using (cached) API discovery.
+"""
+
+from __future__ import annotations
+
+import base64
+import http.client
+import json
+import os
+import queue
+import ssl
+import subprocess
+import tempfile
+import threading
+import urllib.parse
+from typing import TYPE_CHECKING
+
+from rhoai_in_kind.goyaml import dump_yaml  # noqa: F401, the collectors and ApplyBatch import it from here
+
+if TYPE_CHECKING:
+    from typing import Any, Iterator
+
+FIELD_MANAGER = "rhoai-in-kind"
+
+PATCH_CONTENT_TYPES = {
+    "merge": "application/merge-patch+json",
+    "json": "application/json-patch+json",
+    "strategic": "application/strategic-merge-patch+json",
+    # JSON is YAML, so server-side apply takes the same body as the other patches
+    "apply": "application/apply-patch+yaml",
+}
+
+# lists only the metadata of the objects; servers that cannot do that send the full objects instead
+METADATA_ONLY = "application/json;as=PartialObjectMetadataList;v=v1;g=meta.k8s.io,application/json"
+
+
+class ApiError(Exception):
+    """The API server answered with an error status; `body` is the decoded `Status` object, if any."""
+
+    def __init__(self, method: str, path: str, status: int, body: dict | None):
+        self.status = status
+        self.body = body or {}
+        self.reason = self.body.get("reason", "")
+        message = self.body.get("message") or http.client.responses.get(status, "")
+        super().__init__(f"{method} {path}: {status} {message}")
+
+
+def _status_body(payload: bytes) -> dict | None:
+    """The `Status` object of an error response; a proxy's HTML or plain text becomes its `message`."""
+    try:
+        body = json.loads(payload) if payload else None
+    except ValueError:
+        return {"message": payload.decode(errors="replace").strip()}
+    return body if isinstance(body, dict) else None
+
+
+class ResponseTooLarge(Exception):
+    """The response body is larger than the caller allowed; it was not read in full."""
+
+    def __init__(self, method: str, path: str, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(f"{method} {path}: response is larger than {max_bytes} bytes")
+
+
+class KubeClient:
+    def __init__(self, server: str, ssl_context: ssl.SSLContext, token: str | None = None,
+                 namespace: str = "default", timeout: float = 30.0, max_idle_connections: int = 8):
+        url = urllib.parse.urlsplit(server)
+        self.host = url.hostname
+        self.port = url.port or 443
+        self.base_path = url.path.rstrip("/")
+        self.ssl_context = ssl_context
+        self.token = token
+        self.namespace = namespace
+        self.timeout = timeout
+        self._idle: queue.LifoQueue[http.client.HTTPSConnection] = queue.LifoQueue(maxsize=max_idle_connections)
+        self._discovery: dict[str, dict[str, tuple[str, bool]]] = {}
+        self._discovery_lock = threading.Lock()
+
+    @classmethod
+    def from_kubeconfig(cls, context: str | None = None, **kwargs) -> KubeClient:
+        """Creates a client for the current (or given) kubeconfig context.
+
+        The kubeconfig is read through `kubectl config view`, once, so that KUBECONFIG merging and
+        file references behave exactly as they do for kubectl.
+        """
+        command = ["kubectl", "config", "view", "--raw", "--minify", "--flatten", "-o", "json"]
+        if context:
+            command += ["--context", context]
+        config = json.loads(subprocess.run(command, capture_output=True, text=True, check=True).stdout)
+        cluster = config["clusters"][0]["cluster"]
+        user = config["users"][0]["user"]
+        namespace = config["contexts"][0]["context"].get("namespace") or "default"
+
+        if "exec" in user or "auth-provider" in user:
+            raise ValueError("kubeconfig users with exec or auth-provider credentials are not supported")
+
+        ssl_context = ssl.create_default_context()
+        if cluster.get("insecure-skip-tls-verify"):
+            ssl_context.check_hostname = False
+            ssl_context.verify_mode = ssl.CERT_NONE
+        elif "certificate-authority-data" in cluster:
+            ssl_context.load_verify_locations(cadata=base64.b64decode(cluster["certificate-authority-data"]).decode())
+
+        if "client-certificate-data" in user:
+            # load_cert_chain only reads files; keep the key on disk only for as long as it takes to load it
+            with tempfile.TemporaryDirectory() as tmp:
+                cert_file = os.path.join(tmp, "client.crt")
+                key_file = os.path.join(tmp, "client.key")
+                with open(cert_file, "wb") as f:
+                    f.write(base64.b64decode(user["client-certificate-data"]))
+                with open(os.open(key_file, os.O_WRONLY | os.O_CREAT, 0o600), "wb") as f:
+                    f.write(base64.b64decode(user["client-key-data"]))
+                ssl_context.load_cert_chain(cert_file, key_file)
+
+        token = user.get("token")
+        if not token and "tokenFile" in user:
+            # read once, as kubectl does within one invocation; token takes precedence, as it does for kubectl
+            with open(user["tokenFile"]) as f:
+                token = f.read().strip()
+        return cls(cluster["server"], ssl_context, token=token, namespace=namespace, **kwargs)
+
+    def _connect(self, timeout: float | None = None) -> http.client.HTTPSConnection:
+        return http.client.HTTPSConnection(self.host, self.port, context=self.ssl_context,
+                                           timeout=timeout or self.timeout)
+
+    def _headers(self, content_type: str | None = None, accept: str = "application/json") -> dict[str, str]:
+        headers = {"Accept": accept, "User-Agent": FIELD_MANAGER}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if content_type:
+            headers["Content-Type"] = content_type
+        return headers
+
+    def _url(self, path: str, query: dict[str, Any] | None = None) -> str:
+        query = {k: v for k, v in (query or {}).items() if v is not None}
+        return self.base_path + path + (f"?{urllib.parse.urlencode(query)}" if query else "")
+
+    def request(self, method: str, path: str, body: Any = None, content_type: str = "application/json",
+                query: dict[str, Any] | None = None, max_response_bytes: int | None = None,
+                accept: str = "application/json") -> dict:
+        """Sends one request on a pooled connection and returns the decoded JSON response.
+
+        With `max_response_bytes`, at most that much of the body is ever held in memory;
+        a longer response raises `ResponseTooLarge`.
+        """
+        data = json.dumps(body).encode() if body is not None else None
+        headers = self._headers(content_type if data is not None else None, accept)
+        conn, response = self._send(method, self._url(path, query), data, headers)
+        try:
+            payload = response.read() if max_response_bytes is None else response.read(max_response_bytes + 1)
+        except BaseException:
+            conn.close()
+            raise
+
+        if max_response_bytes is not None and len(payload) > max_response_bytes:
+            # the rest of the body is still unread, the connection cannot be reused
+            conn.close()
+            raise ResponseTooLarge(method, path, max_response_bytes)
+        self._release(conn, response)
+
+        if response.status >= 400:
+            raise ApiError(method, path, response.status, _status_body(payload))
+        return json.loads(payload) if payload else {}
+
+    def get_if_changed(self, path: str, etag: str | None,
+                       accept: str = "application/json") -> tuple[dict | None, str | None]:
+        """GETs `path` unless it still has the ETag `etag`; returns the body (None if unchanged) and its ETag."""
+        headers = self._headers(accept=accept)
+        if etag:
+            headers["If-None-Match"] = etag
+        conn, response = self._send("GET", self._url(path), None, headers)
+        try:
+            payload = response.read()
+        except BaseException:
+            conn.close()
+            raise
+        self._release(conn, response)
+        if response.status == 304:
+            return None, etag
+        if response.status >= 400:
+            raise ApiError("GET", path, response.status, _status_body(payload))
+        return json.loads(payload) if payload else {}, response.getheader("ETag")
+
+    def stream(self, path: str, timeout: float | None = None, chunk_bytes: int = 64 * 1024,
+               **query) -> Iterator[bytes]:
+        """GETs a non-JSON body, e.g. container logs, and yields it in chunks as it arrives.
+
+        `timeout` bounds every read from the connection, not the request as a whole.
+        """
+        conn, response = self._send("GET", self._url(path, query), None, self._headers(accept="*/*"),
+                                    timeout=timeout)
+        try:
+            if response.status >= 400:
+                payload = response.read()
+            else:
+                payload = None
+                while chunk := response.read(chunk_bytes):
+                    yield chunk
+        except BaseException:
+            conn.close()
+            raise
+        self._release(conn, response)
+        if payload is not None:
+            raise ApiError("GET", path, response.status, _status_body(payload))
+
+    def _send(self, method: str, url: str, data: bytes | None, headers: dict[str, str],
+              timeout: float | None = None) -> tuple[http.client.HTTPSConnection, http.client.HTTPResponse]:
+        """Sends a request on a pooled connection and returns the connection and the response, unread."""
+        while True:
+            try:
+                conn, reused = self._idle.get_nowait(), True
+            except queue.Empty:
+                conn, reused = self._connect(), False
+            conn.timeout = timeout or self.timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(conn.timeout)
+            try:
+                conn.request(method, url, body=data, headers=headers)
+                return conn, conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                # the server may close an idle keep-alive connection at any time, try again on a new one
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+
+    def _release(self, conn: http.client.HTTPSConnection, response: http.client.HTTPResponse):
+        """Returns a connection whose response has been read in full to the pool."""
+        if response.will_close:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def get(self, path: str, **query) -> dict:
+        return self.request("GET", path, query=query)
+
+    def list_pages(self, path: str, limit: int = 500, max_page_bytes: int | None = None,
+                   accept: str = "application/json", **query) -> Iterator[dict]:
+        """Yields the pages of a list, following `metadata.continue` until the list is complete.
+
+        Like kubectl, fills in `apiVersion` and `kind` of the items, which the API leaves out in lists.
+        With `max_page_bytes`, a page that comes back larger is requested again with half the
+        `limit`, so that no more than that is buffered at a time, however large the objects are.
+        With `accept=METADATA_ONLY`, the items only have their metadata.
+        """
+        continue_token = None
+        while True:
+            try:
+                page = self.request("GET", path, query={"limit": limit, "continue": continue_token, **query},
+                                    max_response_bytes=max_page_bytes, accept=accept)
+            except ResponseTooLarge:
+                if limit == 1:
+                    raise  # a single object is larger than the ceiling
+                limit = max(1, limit // 2)
+                continue
+            kind = page.get("kind", "").removesuffix("List")
+            for item in page.get("items") or []:
+                item.setdefault("apiVersion", page.get("apiVersion"))
+                item.setdefault("kind", kind)
+            yield page
+            continue_token = (page.get("metadata") or {}).get("continue")
+            if not continue_token:
+                return
+
+    def list(self, path: str, limit: int = 500, **query) -> tuple[list[dict], str]:
+        """Returns all items at `path` and the resourceVersion of the list, see `list_pages`."""
+        items: list[dict] = []
+        resource_version = ""
+        for page in self.list_pages(path, limit=limit, **query):
+            items.extend(page.get("items") or [])
+            resource_version = (page.get("metadata") or {}).get("resourceVersion", "")
+        return items, resource_version
+
+    def apply(self, obj: dict, field_manager: str = FIELD_MANAGER, force: bool = True,
+              subresource: str | None = None) -> dict:
+        """Server-side applies `obj`, like `kubectl apply --server-side --force-conflicts [--subresource=status]`."""
+        metadata = obj["metadata"]
+        path = self.resource_path(obj["apiVersion"], obj["kind"], metadata.get("namespace"), metadata["name"])
+        if subresource:
+            path += f"/{subresource}"
+        return self.request("PATCH", path, body=obj, content_type=PATCH_CONTENT_TYPES["apply"],
+                            query={"fieldManager": field_manager, "force": "true" if force else None})
+
+    def patch(self, path: str, body: Any, patch_type: str = "merge", **query) -> dict:
+        return self.request("PATCH", path, body=body, content_type=PATCH_CONTENT_TYPES[patch_type], query=query)
+
+    def delete(self, path: str, ignore_not_found: bool = False, **query) -> dict | None:
+        try:
+            return self.request("DELETE", path, query=query)
+        except ApiError as e:
+            if ignore_not_found and e.status == 404:
+                return None
+            raise
+
+    def watch(self, path: str, resource_version: str | None = None, timeout_seconds: int = 300,
+              **query) -> Iterator[dict]:
+        """Yields watch events for `path` until the server ends the watch after `timeout_seconds`.
+
+        A watch holds its connection for its whole duration, so it gets one of its own.
+        """
+        url = self._url(path, {
+            "watch": "1",
+            "allowWatchBookmarks": "true",
+            "timeoutSeconds": timeout_seconds,
+            "resourceVersion": resource_version,
+            **query,
+        })
+        conn = self._connect(timeout=timeout_seconds + self.timeout)
+        try:
+            conn.request("GET", url, headers=self._headers())
+            response = conn.getresponse()
+            if response.status >= 400:
+                payload = response.read()
+                raise ApiError("GET", path, response.status, _status_body(payload))
+            for line in response:
+                if line.strip():
+                    yield json.loads(line)
+        finally:
+            conn.close()
+
+    def resource_path(self, api_version: str, kind: str, namespace: str | None = None, name: str | None = None) -> str:
+        """Returns the API path of a resource, e.g. `/apis/apps/v1/namespaces/minio/deployments/minio`.
+
+        Namespaced resources without a namespace go to the kubeconfig context's namespace.
+        """
+        resources = self._discover(api_version)
+        if kind not in resources:
+            # the kind may be served since the group version was discovered, e.g. by a CRD just established
+            resources = self._discover(api_version, refresh=True)
+        if kind not in resources:
+            # worded like kubectl's error, which `retry` treats as a kind that is not established yet
+            raise LookupError(f'no matches for kind "{kind}" in version "{api_version}"')
+        resource, namespaced = resources[kind]
+        path = "/api/v1" if api_version == "v1" else f"/apis/{api_version}"
+        if namespaced:
+            path += f"/namespaces/{namespace or self.namespace}"
+        path += f"/{resource}"
+        if name:
+            path += f"/{name}"
+        return path
+
+    def _discover(self, api_version: str, refresh: bool = False) -> dict[str, tuple[str, bool]]:
+        """Returns `kind -> (resource, namespaced)` for an API group version, fetched once unless `refresh`."""
+        with self._discovery_lock:
+            if refresh or api_version not in self._discovery:
+                path = "/api/v1" if api_version == "v1" else f"/apis/{api_version}"
+                self._discovery[api_version] = {
+                    r["kind"]: (r["name"], r["namespaced"])
+                    for r in self.get(path).get("resources") or []
+                    if "/" not in r["name"]  # skip subresources such as deployments/status
+                }
+            return self._discovery[api_version]
+
@@ -0,0 +1,189 @@
+"""Generates the cluster CA and the `*.apps.127.0.0.1.sslip.io` certificate, and keeps them for reuse.
+
+    pki = CertificateCache()
+    ca = pki.ca("My Cluster CA")
+    leaf = pki.leaf(ca, ["*.apps.127.0.0.1.sslip.io"])
+    leaf.cert_pem, leaf.key_pem
+
+Both are stored as PEM files in `pki/` in the artifact cache directory,
+
+    ~/.cache/rhoai-in-kind/pki/
+        ca.crt  ca.key     the CA
+        tls.crt tls.key    the leaf, signed by the CA
+
+and are generated again only when they are missing, expire within `renew_before`, or (for the
+leaf) no longer match the CA or the requested names. Reusing them keeps the cluster's secrets,
+and everything that already trusts the CA, unchanged between deploys.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import datetime
+import os
+import pathlib
+import sys
+import tempfile
+from typing import TYPE_CHECKING
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+from rhoai_in_kind.artifacts import default_cache_dir
+
+if TYPE_CHECKING:
+    from typing import Sequence
+
+CA_VALIDITY = datetime.timedelta(days=3650)
+LEAF_VALIDITY = datetime.timedelta(days=365)
+
+
+@dataclasses.dataclass(frozen=True)
+class KeyPair:
+    cert_pem: str
+    key_pem: str
+
+    @property
+    def certificate(self) -> x509.Certificate:
+        return x509.load_pem_x509_certificate(self.cert_pem.encode())
+
+
+def _private_key() -> rsa.RSAPrivateKey:
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+def _key_pem(key: rsa.RSAPrivateKey) -> str:
+    return key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                             serialization.NoEncryption()).decode()
+
+
+def _cert_pem(cert: x509.Certificate) -> str:
+    return cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+def generate_ca(common_name: str, dns_names: Sequence[str] = (), validity: datetime.timedelta = CA_VALIDITY) -> KeyPair:
+    """A self-signed CA, like `openssl req -x509 -new -nodes -subj '/CN=<common_name>'`."""
+    key = _private_key()
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + validity)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .add_extension(x509.KeyUsage(digital_signature=True, key_cert_sign=True, crl_sign=True,
+                                     content_commitment=False, key_encipherment=False, data_encipherment=False,
+                                     key_agreement=False, encipher_only=False, decipher_only=False), critical=True)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False)
+    )
+    if dns_names:
+        builder = builder.add_extension(x509.SubjectAlternativeName([x509.DNSName(n) for n in dns_names]),
+                                        critical=False)
+    cert = builder.sign(key, hashes.SHA256())
+    return KeyPair(_cert_pem(cert), _key_pem(key))
+
+
+def generate_leaf(ca: KeyPair, dns_names: Sequence[str], validity: datetime.timedelta = LEAF_VALIDITY) -> KeyPair:
+    """A server certificate for `dns_names` signed by `ca`, the first name being its common name."""
+    ca_cert = ca.certificate
+    ca_key = serialization.load_pem_private_key(ca.key_pem.encode(), password=None)
+    key = _private_key()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, dns_names[0])]))
+        .issuer_name(ca_cert.subject)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(min(now + validity, ca_cert.not_valid_after_utc))
+        .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+        .add_extension(x509.KeyUsage(digital_signature=True, key_encipherment=True, key_cert_sign=False,
+                                     crl_sign=False, content_commitment=False, data_encipherment=False,
+                                     key_agreement=False, encipher_only=False, decipher_only=False), critical=True)
+        .add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]), critical=False)
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(n) for n in dns_names]), critical=False)
+        .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_key.public_key()), critical=False)
+        .sign(ca_key, hashes.SHA256())
+    )
+    return KeyPair(_cert_pem(cert), _key_pem(key))
+
+
+def _dns_names(cert: x509.Certificate) -> list[str]:
+    try:
+        san = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+    except x509.ExtensionNotFound:
+        return []
+    return san.get_values_for_type(x509.DNSName)
+
+
+def _signed_by(cert: x509.Certificate, ca: x509.Certificate) -> bool:
+    try:
+        cert.verify_directly_issued_by(ca)
+    except (ValueError, TypeError, InvalidSignature):
+        return False
+    return True
+
+
+class CertificateCache:
+    def __init__(self, root: pathlib.Path | str | None = None,
+                 renew_before: datetime.timedelta = datetime.timedelta(days=30)):
+        self.root = pathlib.Path(root) if root is not None else default_cache_dir() / "pki"
+        self.renew_before = renew_before
+        # the names ("ca", "tls") generated rather than reused by this cache
+        self.generated: set[str] = set()
+
+    def _load(self, name: str) -> KeyPair | None:
+        try:
+            pair = KeyPair((self.root / f"{name}.crt").read_text(), (self.root / f"{name}.key").read_text())
+            expires = pair.certificate.not_valid_after_utc
+        except (FileNotFoundError, ValueError):
+            return None
+        if expires - datetime.datetime.now(datetime.timezone.utc) < self.renew_before:
+            print(f"Cached {name}.crt expires {expires:%Y-%m-%d}, generating a new one")
+            return None
+        return pair
+
+    def _store(self, name: str, pair: KeyPair):
+        self.root.mkdir(parents=True, exist_ok=True)
+        for suffix, content in (("key", pair.key_pem), ("crt", pair.cert_pem)):
+            fd, tmp = tempfile.mkstemp(dir=self.root, prefix=f".{name}.{suffix}-")
+            with os.fdopen(fd, "w") as f:  # mkstemp creates the file readable only by us
+                f.write(content)
+            os.replace(tmp, self.root / f"{name}.{suffix}")
+
+    def ca(self, common_name: str, dns_names: Sequence[str] = ()) -> KeyPair:
+        """Returns the cached CA, or a new one if there is none or it is about to expire."""
+        if pair := self._load("ca"):
+            print(f"Using cached CA from {self.root / 'ca.crt'}")
+        else:
+            pair = generate_ca(common_name, dns_names)
+            self._store("ca", pair)
+            self.generated.add("ca")
+            print(f"Generated CA {common_name} in {self.root / 'ca.crt'}")
+        sys.stdout.flush()
+        return pair
+
+    def leaf(self, ca: KeyPair, dns_names: Sequence[str]) -> KeyPair:
+        """Returns the cached certificate for `dns_names`, or a new one signed by `ca`."""
+        pair = self._load("tls")
+        if pair and (sorted(_dns_names(pair.certificate)) != sorted(dns_names)
+                     or not _signed_by(pair.certificate, ca.certificate)):
+            print("Cached tls.crt is for other names or from another CA, generating a new one")
+            pair = None
+        if pair:
+            print(f"Using cached certificate from {self.root / 'tls.crt'}")
+        else:
+            pair = generate_leaf(ca, dns_names)
+            self._store("tls", pair)
+            self.generated.add("tls")
+            print(f"Generated certificate for {', '.join(dns_names)} in {self.root / 'tls.crt'}")
+        sys.stdout.flush()
+        return pair
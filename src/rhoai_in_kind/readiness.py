@@ -0,0 +1,351 @@
+"""Waits for cluster resources to become ready by watching them, instead of polling.
+
+A `ReadinessEngine` keeps one list+watch stream per resource path (e.g. all Deployments in the
+cluster) and evaluates every registered `Waiter` for that path whenever an event arrives, so a
+waiter is released as soon as the event that makes it ready is received.
+
+    with ReadinessEngine() as readiness:
+        readiness.wait(
+            deployment_available("minio", labels={"app": "minio"}),
+            crd_established("notebooks.kubeflow.org"),
+            timeout=120,
+        )
+
+The streams come from a `source`, by default a `KubeClient` talking to the API server directly;
+`KubectlSource` runs `kubectl get --raw` instead, and any object with the same `list` and `watch`
+methods can be used, e.g. one replaying recorded watch events.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import dataclasses
+import json
+import subprocess
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING, Protocol
+
+from rhoai_in_kind.kube import KubeClient
+
+if TYPE_CHECKING:
+    from typing import Callable, Iterator
+
+DEPLOYMENTS = "/apis/apps/v1/deployments"
+ENDPOINTSLICES = "/apis/discovery.k8s.io/v1/endpointslices"
+CUSTOMRESOURCEDEFINITIONS = "/apis/apiextensions.k8s.io/v1/customresourcedefinitions"
+CLUSTERPOLICIES = "/apis/kyverno.io/v1/clusterpolicies"
+IMAGESTREAMS = "/apis/image.openshift.io/v1/imagestreams"
+
+# the server ends every watch after this long; the engine then resumes from the last resourceVersion
+WATCH_TIMEOUT_SECONDS = 300
+
+
+class WatchSource(Protocol):
+    def list(self, path: str) -> tuple[list[dict], str]:
+        """Returns the items at `path` and the resourceVersion of the list."""
+
+    def watch(self, path: str, resource_version: str) -> Iterator[dict]:
+        """Yields watch events (`{"type": ..., "object": ...}`) for `path` newer than `resource_version`."""
+
+
+class KubectlSource:
+    """Lists and watches through `kubectl get --raw`, one long-running kubectl process per watch."""
+
+    def list(self, path: str) -> tuple[list[dict], str]:
+        result = subprocess.run(["kubectl", "get", "--raw", path], capture_output=True, text=True, check=True)
+        body = json.loads(result.stdout)
+        return body.get("items") or [], body["metadata"]["resourceVersion"]
+
+    def watch(self, path: str, resource_version: str) -> Iterator[dict]:
+        query = f"watch=1&allowWatchBookmarks=true&timeoutSeconds={WATCH_TIMEOUT_SECONDS}&resourceVersion={resource_version}"
+        with subprocess.Popen(["kubectl", "get", "--raw", f"{path}?{query}"], stdout=subprocess.PIPE, text=True) as p:
+            try:
+                for line in p.stdout:
+                    if line.strip():
+                        yield json.loads(line)
+                p.wait()
+            finally:
+                if p.poll() is None:
+                    p.kill()
+        if p.returncode != 0:
+            raise subprocess.CalledProcessError(p.returncode, p.args)
+
+
+def has_condition(obj: dict, condition_type: str, status: str = "True") -> bool:
+    """Checks `status.conditions` the way `kubectl wait --for=condition=...` does."""
+    for condition in (obj.get("status") or {}).get("conditions") or []:
+        if condition.get("type") == condition_type:
+            return condition.get("status") == status
+    return False
+
+
+@dataclasses.dataclass(eq=False)
+class Waiter:
+    """Waits until the objects at `path` that match `namespace`, `name` and `labels` satisfy `ready`.
+
+    `ready` is given the list of all matching objects, which may be empty.
+    """
+    description: str
+    path: str
+    ready: Callable[[list[dict]], bool]
+    namespace: str | None = None
+    name: str | None = None
+    labels: dict[str, str] = dataclasses.field(default_factory=dict)
+    done: threading.Event = dataclasses.field(default_factory=threading.Event)
+    # the matching objects at the moment the waiter was released
+    objects: list[dict] = dataclasses.field(default_factory=list)
+    # called once, from the watch thread, when the waiter is released
+    callbacks: list[Callable[[], None]] = dataclasses.field(default_factory=list)
+
+    def matches(self, obj: dict) -> bool:
+        metadata = obj.get("metadata") or {}
+        if self.namespace is not None and metadata.get("namespace") != self.namespace:
+            return False
+        if self.name is not None and metadata.get("name") != self.name:
+            return False
+        labels = metadata.get("labels") or {}
+        return all(labels.get(k) == v for k, v in self.labels.items())
+
+    def evaluate(self, objects: list[dict]) -> bool:
+        matching = [o for o in objects if self.matches(o)]
+        if self.ready(matching):
+            self.objects = matching
+            if not self.done.is_set():
+                self.done.set()
+                for callback in list(self.callbacks):
+                    callback()
+        return self.done.is_set()
+
+
+def _all(condition: Callable[[dict], bool]) -> Callable[[list[dict]], bool]:
+    """At least one object, and every object satisfies `condition`; like `kubectl wait --all`."""
+    return lambda objects: bool(objects) and all(condition(o) for o in objects)
+
+
+def deployment_available(namespace: str | None, name: str | None = None,
+                         labels: dict[str, str] | None = None) -> Waiter:
+    """All matching Deployments (in all namespaces if `namespace` is None) have condition Available."""
+    what = name or (",".join(f"{k}={v}" for k, v in labels.items()) if labels else "all")
+    return Waiter(
+        description=f"deployment {what} in {namespace or 'all namespaces'} Available",
+        path=DEPLOYMENTS,
+        ready=_all(lambda o: has_condition(o, "Available")),
+        namespace=namespace, name=name, labels=labels or {},
+    )
+
+
+def service_endpoints_ready(namespace: str, service: str) -> Waiter:
+    """Some EndpointSlice of the Service has an endpoint that is ready to receive traffic."""
+
+    def ready(slices: list[dict]) -> bool:
+        return any(
+            endpoint.get("addresses") and (endpoint.get("conditions") or {}).get("ready") is not False
+            for s in slices
+            for endpoint in s.get("endpoints") or []
+        )
+
+    return Waiter(
+        description=f"endpoints of service {service} in {namespace} ready",
+        path=ENDPOINTSLICES,
+        ready=ready,
+        namespace=namespace, labels={"kubernetes.io/service-name": service},
+    )
+
+
+def crd_established(name: str) -> Waiter:
+    return Waiter(
+        description=f"CRD {name} Established",
+        path=CUSTOMRESOURCEDEFINITIONS,
+        ready=_all(lambda o: has_condition(o, "Established")),
+        name=name,
+    )
+
+
+def clusterpolicy_ready(name: str | None = None) -> Waiter:
+    """The Kyverno ClusterPolicy (or all of them, if `name` is None) has condition Ready."""
+    return Waiter(
+        description=f"clusterpolicy {name or 'all'} Ready",
+        path=CLUSTERPOLICIES,
+        ready=_all(lambda o: has_condition(o, "Ready")),
+        name=name,
+    )
+
+
+def imagestream_resolved(namespace: str, name: str) -> Waiter:
+    """The ImageStream has a `status.tags[].items[].dockerImageReference`."""
+
+    def resolved(o: dict) -> bool:
+        return any(
+            item.get("dockerImageReference")
+            for tag in (o.get("status") or {}).get("tags") or []
+            for item in tag.get("items") or []
+        )
+
+    return Waiter(
+        description=f"imagestream {name} in {namespace} has resolved status tags",
+        path=IMAGESTREAMS,
+        ready=_all(resolved),
+        namespace=namespace, name=name,
+    )
+
+
+class ReadinessEngine:
+    def __init__(self, source: WatchSource | None = None, retry_interval: float = 1.0):
+        self.source = source or KubeClient.from_kubeconfig()
+        self.retry_interval = retry_interval
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._objects: dict[str, dict[tuple[str, str], dict]] = {}
+        self._synced: set[str] = set()
+        self._waiters: dict[str, list[Waiter]] = {}
+        self._threads: dict[str, threading.Thread] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Stops watching; the watch threads are daemons and exit with their current stream."""
+        self._closed.set()
+
+    def register(self, waiter: Waiter) -> Waiter:
+        """Starts evaluating `waiter` without blocking; `wait` registers waiters itself."""
+        with self._lock:
+            if waiter in self._waiters.get(waiter.path, ()):
+                return waiter
+            # one that is ready already is not kept for the watch to evaluate
+            if waiter.path not in self._synced or not waiter.evaluate(list(self._objects[waiter.path].values())):
+                self._waiters.setdefault(waiter.path, []).append(waiter)
+            if waiter.path not in self._threads:
+                thread = threading.Thread(target=self._watch, args=(waiter.path,), daemon=True,
+                                          name=f"watch {waiter.path}")
+                self._threads[waiter.path] = thread
+                thread.start()
+        return waiter
+
+    def unregister(self, *waiters: Waiter):
+        """Stops evaluating `waiters`, e.g. after a wait for them timed out."""
+        with self._lock:
+            for waiter in waiters:
+                with contextlib.suppress(ValueError):
+                    self._waiters.get(waiter.path, []).remove(waiter)
+
+    def wait(self, *waiters: Waiter, timeout: float):
+        """Blocks until all `waiters` are ready; raises TimeoutError naming the ones that are not."""
+        deadline = time.monotonic() + timeout
+        for waiter in waiters:
+            self.register(waiter)
+        for waiter in waiters:
+            print(f"Waiting for {waiter.description}...")
+        sys.stdout.flush()
+        pending = [w for w in waiters if not w.done.wait(max(0.0, deadline - time.monotonic()))]
+        if pending:
+            # otherwise every event of their kind re-evaluates them for as long as the engine lives
+            self.unregister(*pending)
+            raise TimeoutError(
+                f"Timed out after {timeout}s waiting for {', '.join(w.description for w in pending)}")
+        for waiter in waiters:
+            print(f"Ready: {waiter.description}")
+        sys.stdout.flush()
+
+    async def async_wait(self, *waiters: Waiter, timeout: float):
+        """`wait` for asyncio: awaits the waiters without blocking the event loop or a thread of its own."""
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in waiters]
+
+        def release(future: asyncio.Future):
+            if not future.done():
+                future.set_result(None)
+
+        def callback(future: asyncio.Future) -> Callable[[], None]:
+            def threadsafe_release():
+                # the loop may be gone if the waiter is released just as the wait ends
+                with contextlib.suppress(RuntimeError):
+                    loop.call_soon_threadsafe(release, future)
+            return threadsafe_release
+
+        callbacks = [callback(f) for f in futures]
+        for waiter, threadsafe_release in zip(waiters, callbacks):
+            waiter.callbacks.append(threadsafe_release)
+        try:
+            for waiter, future in zip(waiters, futures):
+                # it may have been released before the callback was added
+                if waiter.done.is_set():
+                    release(future)
+                self.register(waiter)
+                print(f"Waiting for {waiter.description}...")
+            sys.stdout.flush()
+            _, pending = await asyncio.wait(futures, timeout=timeout)
+        finally:
+            for waiter, threadsafe_release in zip(waiters, callbacks):
+                waiter.callbacks.remove(threadsafe_release)
+        if pending:
+            self.unregister(*(w for w, f in zip(waiters, futures) if f in pending))
+            raise TimeoutError(f"Timed out after {timeout}s waiting for "
+                               f"{', '.join(w.description for w, f in zip(waiters, futures) if f in pending)}")
+        for waiter in waiters:
+            print(f"Ready: {waiter.description}")
+        sys.stdout.flush()
+
+    def is_ready(self, *waiters: Waiter, timeout: float = 10) -> bool:
+        """Tells whether all `waiters` are ready right now, allowing `timeout` for the watches to sync."""
+        try:
+            self.wait(*waiters, timeout=timeout)
+        except TimeoutError:
+            return False
+        return True
+
+    def _update(self, path: str, event_type: str, obj: dict):
+        metadata = obj.get("metadata") or {}
+        key = (metadata.get("namespace", ""), metadata.get("name", ""))
+        with self._lock:
+            objects = self._objects.setdefault(path, {})
+            if event_type == "DELETED":
+                objects.pop(key, None)
+            else:
+                objects[key] = obj
+            self._evaluate(path)
+
+    def _evaluate(self, path: str):
+        """Re-checks the pending waiters of `path` against the cached objects; caller holds the lock."""
+        objects = list(self._objects.get(path, {}).values())
+        self._waiters[path] = [w for w in self._waiters.get(path, []) if not w.evaluate(objects)]
+
+    def _watch(self, path: str):
+        resource_version = None
+        last_error = None
+        while not self._closed.is_set():
+            try:
+                if resource_version is None:
+                    items, resource_version = self.source.list(path)
+                    with self._lock:
+                        self._objects[path] = {
+                            ((o.get("metadata") or {}).get("namespace", ""), o["metadata"]["name"]): o for o in items
+                        }
+                        self._synced.add(path)
+                        self._evaluate(path)
+                for event in self.source.watch(path, resource_version):
+                    if self._closed.is_set():
+                        return
+                    obj = event.get("object") or {}
+                    if event.get("type") == "ERROR":
+                        # 410 Gone: our resourceVersion is too old to resume from, list again
+                        print(f"Watch of {path} ended with {obj.get('code')}: {obj.get('message')}", file=sys.stderr)
+                        resource_version = None
+                        break
+                    resource_version = obj["metadata"]["resourceVersion"]
+                    if event.get("type") != "BOOKMARK":
+                        self._update(path, event["type"], obj)
+            except Exception as e:
+                # typically the kind does not exist yet because its CRD is still being installed
+                error = getattr(e, "stderr", None) or str(e)
+                if error != last_error:
+                    print(f"Watching {path} failed, will retry: {error}", file=sys.stderr)
+                    last_error = error
+                resource_version = None
+                self._closed.wait(self.retry_interval)
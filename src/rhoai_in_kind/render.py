@@ -0,0 +1,200 @@
+"""Caches the output of `kubectl kustomize`, so that deploy applies a rendered file instead of
+building (and for remote bases, git cloning) the kustomization every time.
+
+    renders = RenderCache()
+    sh(f"kubectl apply -f {renders.local('components/01-argocd')}")
+    sh(f"kubectl apply -f {renders.remote('https://github.com/opendatahub-io/notebooks', 'manifests/base', 'main')}")
+
+A local kustomization is keyed by the hash of every file in its directory, a remote one by the
+commit its ref resolves to (`git ls-remote`), both together with the kubectl version that renders
+them. Remote resources that a local kustomization refers to are part of its key too: git remotes
+and raw.githubusercontent.com files by the commit their ref resolves to, so that a branch such as
+`refs/heads/master` is rendered again once it moves, and GitHub release downloads by their tag.
+A kustomization with any other remote resource is not cached, it is rendered every time.
+
+Renders are kept next to the downloads in the artifact cache. In offline mode a remote ref is
+not resolved; the commit it last resolved to is used, and a missing render raises `CacheMiss`.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pathlib
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import urllib.parse
+
+from rhoai_in_kind import sh
+from rhoai_in_kind.artifacts import CacheMiss, default_cache_dir, offline_from_environment
+
+
+def tree_hash(directory: pathlib.Path | str) -> str:
+    """The sha256 of the names and contents of all files under `directory`."""
+    directory = pathlib.Path(directory)
+    digest = hashlib.sha256()
+    for path in sorted(p for p in directory.rglob("*") if p.is_file() and "__pycache__" not in p.parts):
+        digest.update(path.relative_to(directory).as_posix().encode() + b"\0")
+        digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return digest.hexdigest()
+
+
+def resolve_git_ref(repo: str, ref: str) -> str:
+    """Returns the commit a branch or tag points to, like `git ls-remote`; commit SHAs are returned as they are."""
+    if re.fullmatch(r"[0-9a-f]{40}", ref):
+        return ref
+    result = subprocess.run(["git", "ls-remote", repo, ref, f"{ref}^{{}}"],
+                            capture_output=True, text=True, check=True, timeout=60)
+    refs = {name: sha for sha, name in (line.split("\t") for line in result.stdout.splitlines() if line)}
+    # an annotated tag resolves to the commit it points to, listed as refs/tags/<tag>^{}
+    for name in (f"refs/tags/{ref}^{{}}", f"refs/heads/{ref}", f"refs/tags/{ref}", ref):
+        if name in refs:
+            return refs[name]
+    raise ValueError(f"{repo} has no ref {ref!r}")
+
+
+# list items of a kustomization that are URLs: remote resources, bases and components
+_REMOTE_ITEM = re.compile(r"\s*-\s+['\"]?((?:https?://|github\.com/)[^'\"\s#]+)")
+_RELEASE_DOWNLOAD = re.compile(r"https://github\.com/[^/]+/[^/]+/releases/download/[^/]+/.+")
+
+
+def remote_resources(directory: pathlib.Path | str) -> list[str]:
+    """The URLs the kustomization files under `directory` refer to, in order, each once."""
+    urls = []
+    for path in sorted(pathlib.Path(directory).rglob("*")):
+        if path.name in ("kustomization.yaml", "kustomization.yml", "Kustomization") and path.is_file():
+            urls += [m.group(1) for m in map(_REMOTE_ITEM.match, path.read_text().splitlines()) if m]
+    return list(dict.fromkeys(urls))
+
+
+def remote_git_ref(url: str) -> tuple[str, str] | None:
+    """The repository and ref a remote resource is read from, None if it is not read from git.
+
+    Understands kustomize's git URLs (`https://github.com/org/repo//path?ref=v1`, `github.com/org/repo/path`)
+    and raw.githubusercontent.com files (`https://raw.githubusercontent.com/org/repo/refs/heads/main/file`).
+    """
+    parts = urllib.parse.urlsplit(url if "://" in url else f"https://{url}")
+    segments = parts.path.strip("/").split("/")
+    if parts.hostname == "raw.githubusercontent.com" and len(segments) >= 4:
+        ref_segments = 3 if segments[2] == "refs" and segments[3] in ("heads", "tags") else 1
+        return f"https://github.com/{segments[0]}/{segments[1]}", "/".join(segments[2:2 + ref_segments])
+    if _RELEASE_DOWNLOAD.fullmatch(url):
+        return None
+    if parts.hostname == "github.com" and len(segments) >= 2:
+        query = urllib.parse.parse_qs(parts.query)
+        ref = (query.get("ref") or query.get("version") or ["HEAD"])[0]
+        return f"https://github.com/{segments[0]}/{segments[1].removesuffix('.git')}", ref
+    return None
+
+
+class RenderCache:
+    def __init__(self, root: pathlib.Path | str | None = None, offline: bool | None = None):
+        self.root = pathlib.Path(root) if root is not None else default_cache_dir() / "renders"
+        self.offline = offline_from_environment() if offline is None else offline
+        self._kubectl_version: str | None = None
+        self._lock = threading.Lock()
+        self._locks: dict[str, threading.Lock] = {}
+        # (repo, ref) -> commit, resolved by this cache
+        self._commits: dict[tuple[str, str], str] = {}
+        # renders made by this cache; ones that are not reused across deploys are still reused within one
+        self._rendered: set[str] = set()
+
+    def kubectl_version(self) -> str:
+        """The kubectl (and so kustomize) version renders are made with; part of every cache key."""
+        with self._lock:
+            if self._kubectl_version is None:
+                result = subprocess.run(["kubectl", "version", "--client", "-o", "json"],
+                                        capture_output=True, text=True, check=True)
+                self._kubectl_version = json.loads(result.stdout)["clientVersion"]["gitVersion"]
+            return self._kubectl_version
+
+    def local(self, directory: pathlib.Path | str) -> pathlib.Path:
+        """Returns the rendered `kubectl kustomize <directory>`, building it only if it or its remotes changed."""
+        key = f"{self.kubectl_version()}\0{tree_hash(directory)}"
+        reuse = True
+        for url in remote_resources(directory):
+            if _RELEASE_DOWNLOAD.fullmatch(url):
+                continue  # the URL names the release tag
+            git_ref = remote_git_ref(url)
+            if git_ref is None:
+                print(f"Not caching the render of {directory}, {url} may change and cannot be resolved to a commit")
+                reuse = False
+                continue
+            key += f"\0{url}\0{self._resolve(*git_ref)}"
+        key = hashlib.sha256(key.encode()).hexdigest()
+        return self._render(f"{pathlib.Path(directory).name}-{key[:16]}", str(directory), reuse=reuse)
+
+    def _resolve(self, repo: str, ref: str) -> str:
+        """The commit `ref` resolves to, once per cache; in offline mode, the one it last resolved to."""
+        with self._lock:
+            if (repo, ref) in self._commits:
+                return self._commits[repo, ref]
+        ref_index = self.root / "refs" / hashlib.sha256(f"{repo}\0{ref}".encode()).hexdigest()
+        if self.offline:
+            try:
+                return ref_index.read_text().strip()
+            except FileNotFoundError:
+                raise CacheMiss(f"{ref} of {repo} has never been resolved and git is not consulted in offline mode") \
+                    from None
+        commit = resolve_git_ref(repo, ref)
+        ref_index.parent.mkdir(parents=True, exist_ok=True)
+        ref_index.write_text(commit)
+        with self._lock:
+            self._commits[repo, ref] = commit
+        return commit
+
+    def remote(self, repo: str, path: str, ref: str, query: str = "timeout=90s&depth=1&submodules=false",
+               env: dict[str, str] | None = None) -> pathlib.Path:
+        """Returns the rendered `kubectl kustomize '<repo>//<path>?ref=<ref>&<query>'`.
+
+        The render is cached per commit, so a branch is only built again after it moved.
+        """
+        ref_index = self.root / "refs" / hashlib.sha256(f"{repo}\0{path}\0{ref}".encode()).hexdigest()
+        if self.offline:
+            try:
+                commit = ref_index.read_text().strip()
+            except FileNotFoundError:
+                raise CacheMiss(f"{repo}//{path} at {ref} has never been rendered "
+                                f"and git is not consulted in offline mode") from None
+        else:
+            commit = resolve_git_ref(repo, ref)
+        print(f"{repo} {ref} is at {commit}")
+
+        key = hashlib.sha256(f"{self.kubectl_version()}\0{repo}\0{path}\0{commit}".encode()).hexdigest()
+        # render the commit that was resolved, in case the branch moves in the meantime
+        rendered = self._render(f"{pathlib.Path(path).name or 'remote'}-{key[:16]}",
+                                f"{repo}//{path}?ref={commit}&{query}", env=env)
+        ref_index.parent.mkdir(parents=True, exist_ok=True)
+        ref_index.write_text(commit)
+        return rendered
+
+    def _render(self, name: str, target: str, env: dict[str, str] | None = None, reuse: bool = True) -> pathlib.Path:
+        with self._lock:
+            lock = self._locks.setdefault(name, threading.Lock())
+        # the image prefetcher renders in the background; wait for it rather than build the same render twice
+        with lock:
+            return self._render_locked(name, target, env, reuse)
+
+    def _render_locked(self, name: str, target: str, env: dict[str, str] | None, reuse: bool) -> pathlib.Path:
+        path = self.root / f"{name}.yaml"
+        if path.exists() and (reuse or self.offline or name in self._rendered):
+            print(f"Using cached render of {target} from {path}")
+            sys.stdout.flush()
+            return path
+        if self.offline:
+            raise CacheMiss(f"{target} has not been rendered yet and rendering is disabled in offline mode")
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".render-")
+        try:
+            with os.fdopen(fd, "w") as f:
+                sh(f"kubectl kustomize '{target}'", env=env, stdout=f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._rendered.add(name)
+        return path
@@ -0,0 +1,222 @@
+"""Retries operations that fail while the cluster is still coming up, and only those.
+
+Replaces `timeout 30s bash -c 'while ! kubectl apply ...; do sleep 1; done'`,
+
+    retry_sh("kubectl apply -f components/02-kyverno/policy.yaml", timeout=30)
+
+Each failure is classified by its output. A transient error (a webhook whose pod is not
+serving yet, a kind whose CRD is not established yet, an API server that is busy) is retried
+with exponential backoff and jitter, starting at a delay that suits its class, until the
+deadline. A permanent error (the manifest does not validate, a policy denied it) is raised
+right away, there is no point in sending the same request again. Output that matches no class
+is retried, like the shell loops did.
+
+Every retried operation is recorded in the process-wide `retries` log, which `print_summary`
+reports: how many attempts it took and which errors it ran into.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from rhoai_in_kind import sh
+from rhoai_in_kind.kube import ApiError
+
+if TYPE_CHECKING:
+    from typing import Callable
+
+
+@dataclasses.dataclass(frozen=True)
+class ErrorClass:
+    name: str
+    pattern: re.Pattern[str] | None
+    transient: bool
+    # the delay before the first retry; every further retry waits `Backoff.multiplier` times longer
+    delay: float = 1.0
+
+
+# transient classes are matched first, so that e.g. an "error validating data" caused by a refused
+# connection to the OpenAPI endpoint is retried
+ERROR_CLASSES = [
+    ErrorClass("conflict", re.compile(r"the object has been modified|Operation cannot be fulfilled"),
+               transient=True, delay=0.2),
+    ErrorClass("kind not established", re.compile(
+        r"no matches for kind|ensure CRDs are installed first|resource mapping not found"
+        r"|the server could not find the requested resource"), transient=True, delay=0.5),
+    ErrorClass("webhook not serving", re.compile(
+        r"failed calling webhook|failed to call webhook|no endpoints available for service|connection refused"),
+        transient=True, delay=1.0),
+    ErrorClass("server busy", re.compile(
+        r"ServiceUnavailable|TooManyRequests|the server is currently unable|i/o timeout|TLS handshake timeout"
+        r"|connection reset by peer|unexpected EOF|code = Unavailable|another operation is already in progress"),
+        transient=True, delay=2.0),
+    ErrorClass("invalid", re.compile(
+        r"is invalid|strict decoding error|unknown field|error validating|error converting YAML|error parsing"
+        r"|cannot unmarshal"), transient=False),
+    ErrorClass("denied", re.compile(r"admission webhook \S+ denied the request"), transient=False),
+    ErrorClass("bad credentials", re.compile(r"Invalid username or password"), transient=False),
+    ErrorClass("missing file", re.compile(r"the path \S+ does not exist|[Nn]o such file or directory"),
+               transient=False),
+]
+
+UNCLASSIFIED = ErrorClass("unclassified", None, transient=True, delay=1.0)
+
+# errors from `KubeClient` carry an HTTP status, which says more than the message does
+API_STATUS_CLASSES = {
+    400: "invalid",
+    409: "conflict",
+    422: "invalid",
+    429: "server busy",
+    500: "server busy",
+    502: "server busy",
+    503: "server busy",
+    504: "server busy",
+}
+
+
+def _error_class(name: str) -> ErrorClass:
+    return next(c for c in ERROR_CLASSES if c.name == name)
+
+
+class PermanentError(Exception):
+    """The operation failed in a way that retrying will not fix; the original error is the `__cause__`."""
+
+
+def error_text(error: BaseException) -> str:
+    """What an error said, including the output of a failed command."""
+    if isinstance(error, subprocess.SubprocessError):
+        output = [getattr(error, "stderr", None), getattr(error, "stdout", None)]
+        return "\n".join(o if isinstance(o, str) else o.decode(errors="replace") for o in output if o) or str(error)
+    return str(error)
+
+
+def classify(error: BaseException) -> ErrorClass:
+    if isinstance(error, subprocess.TimeoutExpired):
+        return UNCLASSIFIED
+    if isinstance(error, ApiError) and error.status in API_STATUS_CLASSES:
+        return _error_class(API_STATUS_CLASSES[error.status])
+    text = error_text(error)
+    for error_class in ERROR_CLASSES:
+        if error_class.pattern.search(text):
+            return error_class
+    return UNCLASSIFIED
+
+
+@dataclasses.dataclass(frozen=True)
+class Backoff:
+    max_delay: float = 10.0
+    multiplier: float = 2.0
+    # each delay is randomly shortened or lengthened by up to this fraction
+    jitter: float = 0.2
+
+    def delay(self, error_class: ErrorClass, retry: int) -> float:
+        """The delay before the `retry`th retry (counting from 1) after an error of `error_class`."""
+        delay = min(self.max_delay, error_class.delay * self.multiplier ** (retry - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+@dataclasses.dataclass
+class RetryRecord:
+    description: str
+    attempts: int = 0
+    succeeded: bool = False
+    duration: float = 0.0
+    # the class of every failed attempt, in order
+    errors: list[str] = dataclasses.field(default_factory=list)
+
+
+class RetryLog:
+    def __init__(self):
+        self.records: list[RetryRecord] = []
+        self._lock = threading.Lock()
+
+    def add(self, record: RetryRecord):
+        with self._lock:
+            self.records.append(record)
+
+    def print_summary(self):
+        """Prints the operations that did not succeed on their first attempt."""
+        with self._lock:
+            retried = [r for r in self.records if r.attempts > 1 or not r.succeeded]
+        if not retried:
+            return
+        print(f"\nRetried operations ({len(retried)} of {len(self.records)}, "
+              f"{sum(r.attempts - 1 for r in retried)} retries in total):")
+        for r in sorted(retried, key=lambda r: r.attempts, reverse=True):
+            counts = {name: r.errors.count(name) for name in dict.fromkeys(r.errors)}
+            errors = ", ".join(f"{count}x {name}" for name, count in counts.items())
+            outcome = "" if r.succeeded else "  [failed]"
+            print(f"  {r.attempts:3d} attempts {r.duration:6.1f}s  {r.description}: {errors}{outcome}")
+        sys.stdout.flush()
+
+
+retries = RetryLog()
+
+
+def retry[T](fn: Callable[[float], T], description: str, timeout: float = 30.0,
+             backoff: Backoff = Backoff()) -> T:
+    """Calls `fn` until it succeeds, fails permanently, or `timeout` seconds have passed.
+
+    `fn` is given the seconds left until the deadline, to bound a single attempt by. When the
+    deadline would pass during the next delay, the last error is raised; a permanent error is
+    raised as `PermanentError`.
+    """
+    record = RetryRecord(description)
+    retries.add(record)
+    start = time.monotonic()
+    deadline = start + timeout
+    try:
+        while True:
+            record.attempts += 1
+            try:
+                result = fn(max(0.0, deadline - time.monotonic()))
+            except Exception as e:
+                error_class = classify(e)
+                record.errors.append(error_class.name)
+                e.add_note(f"attempt {record.attempts} of {description} ({error_class.name})")
+                if not error_class.transient:
+                    raise PermanentError(f"{description} failed permanently: {error_class.name}") from e
+                delay = backoff.delay(error_class, record.attempts)
+                if time.monotonic() + delay >= deadline:
+                    e.add_note(f"gave up after {record.attempts} attempts in {time.monotonic() - start:.1f}s")
+                    raise
+                print(f"{description} failed ({error_class.name}), retrying in {delay:.1f}s", file=sys.stderr)
+                sys.stderr.flush()
+                time.sleep(delay)
+            else:
+                record.succeeded = True
+                return result
+    finally:
+        record.duration = time.monotonic() - start
+
+
+def retry_sh(cmd: str, timeout: float = 30.0, env: dict[str, str] | None = None, input: str | None = None,
+             backoff: Backoff = Backoff()) -> subprocess.CompletedProcess[str]:
+    """Runs a shell command with `retry`; its output is captured to classify failures, and then printed."""
+
+    def attempt(remaining: float) -> subprocess.CompletedProcess[str]:
+        try:
+            result = sh(cmd, env=env, input=input, capture_output=True, timeout=remaining)
+        except subprocess.SubprocessError as e:
+            _echo(e.stdout, e.stderr)
+            raise
+        _echo(result.stdout, result.stderr)
+        return result
+
+    return retry(attempt, cmd, timeout=timeout, backoff=backoff)
+
+
+def _echo(stdout: str | bytes | None, stderr: str | bytes | None):
+    for output, stream in ((stdout, sys.stdout), (stderr, sys.stderr)):
+        if isinstance(output, bytes):
+            output = output.decode(errors="replace")
+        if output:
+            stream.write(output)
+            stream.flush()
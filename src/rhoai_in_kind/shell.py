@@ -0,0 +1,422 @@
+"""Runs shell scripts on long-lived bash workers instead of starting a new bash for each one.
+
+`run` takes the same script and keyword arguments as `subprocess.run(script, shell=True,
+executable="/bin/bash", text=True)` and returns the same `CompletedProcess`,
+
+    result = run("set -Eeuxo pipefail; kubectl get nodes -o name", capture_output=True, check=True)
+
+A worker is a bash process that reads scripts from a pipe and runs each one in a subshell of
+its own, a fork rather than a new bash, so `set -e`, `exit` and `cd` end with the script, and
+the exit status is written back on a second pipe. The environment (`os.environ` merged with
+`env`) and the working directory are those of the moment `run` is called, as they would be for
+a new process. Output goes where the caller's goes, or with `capture_output` (or `stdout`/`stderr`
+set to `subprocess.PIPE`) into files of the worker that are read back afterwards.
+
+A worker inherits the stdout and stderr of the moment it started, so output that is not captured
+only goes to a worker whose outputs are still the same files as the caller's (device and inode of
+file descriptors 1 and 2); if the caller redirected them since, e.g. to /dev/null, a new worker is
+started in place of an idle one.
+
+There are as many workers as scripts running at the same time; `prestart(n)` starts n of them
+ahead of time, so that n scripts can then run at once without waiting for a bash to start. A
+worker whose script timed out is killed together with everything the script started, and is
+replaced by a new one.
+
+`set_mode("spawn")`, or `RHOAI_IN_KIND_SHELL=spawn`, goes back to one bash process per script,
+which is also what happens for keyword arguments a worker cannot honour, e.g. `stdout=<file>`.
+
+`run_async` is the same for asyncio, see `rhoai_in_kind.aio`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import atexit
+import locale
+import os
+import re
+import select
+import shlex
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any
+
+MODES = ("worker", "spawn")
+
+_mode = os.environ.get("RHOAI_IN_KIND_SHELL") or "worker"
+
+# with the file descriptors of the two pipes for @COMMANDS@ and @STATUS@,
+# reads each script as five NUL-terminated fields: stdin, stdout and stderr files ("" to inherit),
+# setup (cd and exports) and the script, which becomes a function so that `set -x` traces it at
+# the top level, as `+ command` and not as `++ command` like `eval` would
+_WORKER = r"""
+while IFS= read -r -d '' stdin <&@COMMANDS@ && IFS= read -r -d '' stdout <&@COMMANDS@ \
+        && IFS= read -r -d '' stderr <&@COMMANDS@ && IFS= read -r -d '' setup <&@COMMANDS@ \
+        && IFS= read -r -d '' script <&@COMMANDS@; do
+    (
+        exec @COMMANDS@<&- @STATUS@>&-
+        if [[ -n $stdin ]]; then exec <"$stdin"; fi
+        if [[ -n $stdout ]]; then exec >"$stdout"; fi
+        if [[ -n $stderr ]]; then exec 2>"$stderr"; fi
+        eval "$setup" || exit
+        eval "__script() {
+$script
+}" || exit 2
+        __script
+    )
+    printf '%d\n' "$?" >&@STATUS@
+done
+"""
+
+_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def set_mode(mode: str):
+    """Selects "worker" (the default) or "spawn", one bash process per script."""
+    global _mode
+    if mode not in MODES:
+        raise ValueError(f"shell mode must be one of {', '.join(MODES)}, got {mode!r}")
+    _mode = mode
+
+
+def mode() -> str:
+    return _mode
+
+
+def _outputs() -> tuple[tuple[int, int] | None, tuple[int, int] | None]:
+    """Where stdout and stderr of this process go now, as the device and inode of each; None if closed."""
+    outputs = []
+    for fd in (1, 2):
+        try:
+            stat = os.fstat(fd)
+        except OSError:
+            outputs.append(None)
+        else:
+            outputs.append((stat.st_dev, stat.st_ino))
+    return outputs[0], outputs[1]
+
+
+class Worker:
+    """One bash process that runs one script at a time."""
+
+    def __init__(self):
+        self.scratch = tempfile.mkdtemp(prefix="rhoai-in-kind-shell-")
+        self.files = {name: os.path.join(self.scratch, name) for name in ("stdin", "stdout", "stderr")}
+        self.environ = dict(os.environ)
+        self.outputs = _outputs()
+        commands_r, self._commands = os.pipe()
+        self._status, status_w = os.pipe()
+        try:
+            # its own process group, to kill a timed-out script together with everything it started
+            worker = _WORKER.replace("@COMMANDS@", str(commands_r)).replace("@STATUS@", str(status_w))
+            self.process = subprocess.Popen(["/bin/bash", "--noprofile", "--norc", "-c", worker],
+                                            pass_fds=(commands_r, status_w), env=self.environ, process_group=0)
+        finally:
+            os.close(commands_r)
+            os.close(status_w)
+        self._pending = b""
+        self.encoding = locale.getpreferredencoding(False)
+        # the script running, and which of its outputs go to files
+        self._script = ""
+        self._captured = {"stdout": False, "stderr": False}
+
+    def run(self, script: str, environ: dict[str, str], input: str | None, capture_stdout: bool, capture_stderr: bool,
+            timeout: float | None) -> subprocess.CompletedProcess[str]:
+        self._send(script, environ, input, capture_stdout, capture_stderr)
+        try:
+            returncode = self._wait(timeout)
+        except TimeoutError:
+            raise self._timed_out(timeout) from None
+        except BaseException:
+            self.kill()
+            self.close()
+            raise
+        return self._result(returncode)
+
+    async def run_async(self, script: str, environ: dict[str, str], input: str | None, capture_stdout: bool,
+                        capture_stderr: bool, timeout: float | None) -> subprocess.CompletedProcess[str]:
+        """`run` for asyncio; cancelling it kills the worker like a timeout does."""
+        self._send(script, environ, input, capture_stdout, capture_stderr)
+        try:
+            async with asyncio.timeout(timeout):
+                returncode = await self._wait_async()
+        except TimeoutError:
+            raise self._timed_out(timeout) from None
+        except BaseException:
+            self.kill()
+            self.close()
+            raise
+        return self._result(returncode)
+
+    def _send(self, script: str, environ: dict[str, str], input: str | None, capture_stdout: bool,
+              capture_stderr: bool):
+        self._script = script
+        self._captured = {"stdout": capture_stdout, "stderr": capture_stderr}
+        if input is not None:
+            with open(self.files["stdin"], "w", encoding=self.encoding) as f:
+                f.write(input)
+        fields = [
+            self.files["stdin"] if input is not None else "",
+            self.files["stdout"] if capture_stdout else "",
+            self.files["stderr"] if capture_stderr else "",
+            self._setup(environ),
+            script,
+        ]
+        os.write(self._commands, "".join(f"{field}\0" for field in fields).encode(self.encoding))
+
+    def _output(self, name: str) -> str | None:
+        if not self._captured[name]:
+            return None
+        with open(self.files[name], encoding=self.encoding) as f:
+            return f.read()
+
+    def _result(self, returncode: int | None) -> subprocess.CompletedProcess[str]:
+        stdout, stderr = self._output("stdout"), self._output("stderr")
+        if returncode is None:
+            # the worker itself is gone, e.g. killed from outside
+            returncode = self.process.wait()
+            self.close()
+            raise subprocess.CalledProcessError(returncode, self._script, stdout, stderr)
+        return subprocess.CompletedProcess(self._script, returncode, stdout, stderr)
+
+    def _timed_out(self, timeout: float | None) -> subprocess.TimeoutExpired:
+        self.kill()
+        error = subprocess.TimeoutExpired(self._script, timeout, self._output("stdout"), self._output("stderr"))
+        self.close()
+        return error
+
+    def _setup(self, environ: dict[str, str]) -> str:
+        """`cd` and the exports that turn the worker's environment into `environ`."""
+        commands = [f"cd -- {shlex.quote(os.getcwd())}"]
+        commands += [f"export {name}={shlex.quote(value)}" for name, value in environ.items()
+                     if self.environ.get(name) != value]
+        commands += [f"unset {name}" for name in self.environ if name not in environ]
+        return " && ".join(commands)
+
+    def _wait(self, timeout: float | None) -> int | None:
+        """Returns the exit status of the script, or None if the worker itself exited."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while b"\n" not in self._pending:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError
+            readable, _, _ = select.select([self._status], [], [], remaining)
+            if readable and not self._read():
+                return None
+        return self._status_line()
+
+    async def _wait_async(self) -> int | None:
+        loop = asyncio.get_running_loop()
+        while b"\n" not in self._pending:
+            readable = loop.create_future()
+            loop.add_reader(self._status, lambda: readable.done() or readable.set_result(None))
+            try:
+                await readable
+            finally:
+                loop.remove_reader(self._status)
+            if not self._read():
+                return None
+        return self._status_line()
+
+    def _read(self) -> bool:
+        """Reads what the worker wrote on the status pipe; False at its end, when the worker exited."""
+        chunk = os.read(self._status, 64)
+        self._pending += chunk
+        return bool(chunk)
+
+    def _status_line(self) -> int:
+        line, self._pending = self._pending.split(b"\n", 1)
+        return int(line)
+
+    @property
+    def alive(self) -> bool:
+        return self._commands >= 0 and self.process.poll() is None
+
+    def inherits(self, outputs: tuple, capture_stdout: bool = False, capture_stderr: bool = False) -> bool:
+        """Whether the outputs that are not captured go to `outputs`, see `_outputs`."""
+        return ((capture_stdout or self.outputs[0] == outputs[0])
+                and (capture_stderr or self.outputs[1] == outputs[1]))
+
+    def kill(self):
+        """Kills the worker and everything its script started."""
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+
+    def close(self):
+        if self._commands >= 0:
+            # end of input ends the worker's loop
+            os.close(self._commands)
+            os.close(self._status)
+            self._commands = self._status = -1
+        shutil.rmtree(self.scratch, ignore_errors=True)
+
+
+class _Pool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle: list[Worker] = []
+        self._all: set[Worker] = set()
+
+    def acquire(self, capture_stdout: bool = False, capture_stderr: bool = False) -> Worker:
+        """An idle worker whose outputs that are not captured go where this process's go now, or a new one."""
+        outputs = _outputs()
+        stale = None
+        with self._lock:
+            for worker in reversed(self._idle):
+                if worker.inherits(outputs, capture_stdout, capture_stderr):
+                    self._idle.remove(worker)
+                    return worker
+            # replaced by the new one, so that redirecting back and forth does not pile up workers
+            if self._idle:
+                stale = self._idle.pop(0)
+                self._all.discard(stale)
+        if stale is not None:
+            _retire(stale)
+        worker = Worker()
+        with self._lock:
+            self._all.add(worker)
+        return worker
+
+    def prestart(self, workers: int):
+        outputs = _outputs()
+        with self._lock:
+            stale = [w for w in self._idle if not w.inherits(outputs)]
+            self._idle = [w for w in self._idle if w.inherits(outputs)]
+            self._all.difference_update(stale)
+            missing = workers - len(self._idle)
+        for worker in stale:
+            _retire(worker)
+        started = [Worker() for _ in range(missing)]
+        with self._lock:
+            self._all.update(started)
+            self._idle.extend(started)
+
+    def release(self, worker: Worker):
+        with self._lock:
+            if worker.alive:
+                self._idle.append(worker)
+            else:
+                self._all.discard(worker)
+
+    def close(self):
+        with self._lock:
+            workers, self._idle, self._all = list(self._all), [], set()
+        for worker in workers:
+            _retire(worker)
+
+
+def _retire(worker: Worker):
+    """Ends an idle worker."""
+    worker.close()
+    try:
+        worker.process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        worker.kill()
+
+
+_pool = _Pool()
+atexit.register(_pool.close)
+
+
+def prestart(workers: int):
+    """Starts idle workers until there are `workers` of them; does nothing in "spawn" mode."""
+    if _mode == "worker":
+        _pool.prestart(workers)
+
+
+def _worker_options(kwargs: dict[str, Any]) -> dict[str, Any] | None:
+    """Translates `subprocess.run` keyword arguments for `Worker.run`, None if a worker cannot honour them."""
+    options = {"capture_stdout": False, "capture_stderr": False, "timeout": kwargs.pop("timeout", None)}
+    if kwargs.pop("capture_output", False):
+        options["capture_stdout"] = options["capture_stderr"] = True
+    for stream in ("stdout", "stderr"):
+        if stream in kwargs:
+            target = kwargs.pop(stream)
+            if target not in (None, subprocess.PIPE):
+                return None
+            options[f"capture_{stream}"] |= target == subprocess.PIPE
+    return None if kwargs else options
+
+
+def run(script: str, env: dict[str, str] | None = None, input: str | None = None, check: bool = False,
+        **kwargs) -> subprocess.CompletedProcess[str]:
+    """Runs `script` with bash, in text mode, with `env` on top of `os.environ`; see the module docstring."""
+    environ = {**os.environ, **(env or {})}
+    options = _worker_options(dict(kwargs)) if _mode == "worker" else None
+    # a worker can only export variables whose names bash accepts
+    if options is None or not all(_NAME.fullmatch(name) for name in env or ()):
+        return subprocess.run(script, shell=True, executable="/bin/bash", env=environ, input=input, check=check,
+                              text=True, **kwargs)
+
+    worker = _pool.acquire(options["capture_stdout"], options["capture_stderr"])
+    try:
+        completed_process = worker.run(script, environ, input, **options)
+    finally:
+        _pool.release(worker)
+    if check:
+        completed_process.check_returncode()
+    return completed_process
+
+
+async def run_async(script: str, env: dict[str, str] | None = None, input: str | None = None, check: bool = False,
+                    capture_output: bool = False, stdout: int | None = None, stderr: int | None = None,
+                    timeout: float | None = None) -> subprocess.CompletedProcess[str]:
+    """`run` for asyncio: waits for the script without blocking the event loop, or a thread.
+
+    Cancelling it kills the script and everything it started. Output can only be inherited or
+    captured, with `capture_output` or `subprocess.PIPE`.
+    """
+    environ = {**os.environ, **(env or {})}
+    options = _worker_options({"capture_output": capture_output, "stdout": stdout, "stderr": stderr,
+                               "timeout": timeout})
+    if options is None:
+        raise ValueError("stdout and stderr can only be subprocess.PIPE or None")
+    if _mode == "worker" and all(_NAME.fullmatch(name) for name in env or ()):
+        worker = _pool.acquire(options["capture_stdout"], options["capture_stderr"])
+        try:
+            completed_process = await worker.run_async(script, environ, input, **options)
+        finally:
+            _pool.release(worker)
+    else:
+        completed_process = await _spawn_async(script, environ, input, **options)
+    if check:
+        completed_process.check_returncode()
+    return completed_process
+
+
+async def _spawn_async(script: str, environ: dict[str, str], input: str | None, capture_stdout: bool,
+                       capture_stderr: bool, timeout: float | None) -> subprocess.CompletedProcess[str]:
+    encoding = locale.getpreferredencoding(False)
+    pipe = asyncio.subprocess.PIPE
+    # its own process group, like a worker, to kill everything the script started
+    process = await asyncio.create_subprocess_exec(
+        "/bin/bash", "-c", script, env=environ, process_group=0,
+        stdin=pipe if input is not None else None,
+        stdout=pipe if capture_stdout else None,
+        stderr=pipe if capture_stderr else None,
+    )
+    try:
+        async with asyncio.timeout(timeout):
+            stdout, stderr = await process.communicate(input.encode(encoding) if input is not None else None)
+    except BaseException as e:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await process.wait()
+        if isinstance(e, TimeoutError):
+            raise subprocess.TimeoutExpired(script, timeout) from None
+        raise
+    return subprocess.CompletedProcess(script, process.returncode,
+                                       stdout.decode(encoding) if stdout is not None else None,
+                                       stderr.decode(encoding) if stderr is not None else None)
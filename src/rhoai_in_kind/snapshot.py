@@ -0,0 +1,162 @@
+"""Remembers which version of every object a debug bundle collected, so the next one only needs what changed.
+
+A snapshot records the `resourceVersion` of each object, grouped by resource type, and which
+bundle holds that version of it,
+
+    {"format": 1, "name": "archive before/bundle.tar.gz", "base": null,
+     "types": {"pods v1": {"minio/minio-0": ["48213", "archive before/bundle.tar.gz"]},
+               "nodes v1": {"kind-control-plane": ["47990", "archive before/bundle.tar.gz"]}}}
+
+Given the snapshot of an earlier collection, `SnapshotRecorder.changed` tells which objects have
+to be fetched and written again; everything else is carried over, pointing to the bundle that
+already has it. Objects of a type that was listed in full but is no longer there are deleted.
+
+    recorder = SnapshotRecorder("archive after/bundle.tar.gz", Snapshot.load("before/snapshot.json"))
+    ...
+    snapshot, changes = recorder.finish(namespaces)
+    snapshot.save("after/snapshot.json")
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import os
+import pathlib
+import tempfile
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Iterable
+
+
+def object_key(metadata: dict) -> str:
+    """`<namespace>/<name>` for namespaced objects, `<name>` for cluster-scoped ones."""
+    namespace = metadata.get("namespace")
+    return f"{namespace}/{metadata['name']}" if namespace else metadata["name"]
+
+
+@dataclasses.dataclass
+class Snapshot:
+    name: str
+    # resource type -> object key -> (resourceVersion, name of the snapshot whose bundle has that version)
+    types: dict[str, dict[str, tuple[str, str]]] = dataclasses.field(default_factory=dict)
+    # the snapshot this one was taken incrementally against
+    base: str | None = None
+
+    @classmethod
+    def load(cls, path: pathlib.Path | str) -> Snapshot:
+        state = json.loads(pathlib.Path(path).read_text())
+        if state.get("format") != 1:
+            raise ValueError(f"{path} is not a snapshot this version can read")
+        types = {t: {key: tuple(value) for key, value in objects.items()} for t, objects in state["types"].items()}
+        return cls(state["name"], types, state.get("base"))
+
+    def save(self, path: pathlib.Path | str):
+        path = pathlib.Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"format": 1, "name": self.name, "base": self.base, "types": self.types}, f, indent=1)
+        os.replace(tmp, path)
+
+
+@dataclasses.dataclass
+class Changes:
+    """Objects as `<resource type> <object key>`, compared with the base snapshot."""
+    base: str
+    added: list[str] = dataclasses.field(default_factory=list)
+    modified: list[str] = dataclasses.field(default_factory=list)
+    deleted: list[str] = dataclasses.field(default_factory=list)
+    unchanged: int = 0
+
+    def summary(self) -> dict:
+        return {"base": self.base, "unchanged": self.unchanged,
+                "added": self.added, "modified": self.modified, "deleted": self.deleted}
+
+    def print_summary(self):
+        print(f"\nChanges since {self.base}: {len(self.added)} added, {len(self.modified)} modified, "
+              f"{len(self.deleted)} deleted, {self.unchanged} unchanged")
+        for label, keys in (("added", self.added), ("modified", self.modified), ("deleted", self.deleted)):
+            per_type: dict[str, int] = {}
+            for key in keys:
+                resource_type = key.rsplit(" ", 1)[0]
+                per_type[resource_type] = per_type.get(resource_type, 0) + 1
+            for resource_type, count in sorted(per_type.items(), key=lambda kv: kv[1], reverse=True)[:10]:
+                print(f"  {label:8s} {count:5d}  {resource_type}")
+
+
+class SnapshotRecorder:
+    """Collects the snapshot of a collection as it runs; thread-safe."""
+
+    def __init__(self, name: str, previous: Snapshot | None = None):
+        self.name = name
+        self.previous = previous
+        self._types: dict[str, dict[str, tuple[str, str]]] = {}
+        # (resource type, namespace or None for all of them) that were listed completely
+        self._listed: set[tuple[str, str | None]] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def incremental(self) -> bool:
+        return self.previous is not None
+
+    def changed(self, resource_type: str, metadata: dict) -> bool:
+        """The object is new or at another version than in the previous snapshot."""
+        if self.previous is None:
+            return True
+        known = self.previous.types.get(resource_type, {}).get(object_key(metadata))
+        return known is None or known[0] != metadata.get("resourceVersion")
+
+    def record(self, resource_type: str, metadata: dict, written: bool):
+        """Records the object's version; `written` if it is in this bundle, otherwise it is where it was before."""
+        key = object_key(metadata)
+        if written:
+            entry = (metadata.get("resourceVersion", ""), self.name)
+        else:
+            entry = self.previous.types[resource_type][key]
+        with self._lock:
+            self._types.setdefault(resource_type, {})[key] = entry
+
+    def listed(self, resource_type: str, namespace: str | None = None):
+        """All objects of the type (in the namespace) have been recorded; the ones that were not are gone."""
+        with self._lock:
+            self._listed.add((resource_type, namespace))
+
+    def finish(self, namespaces: Iterable[str]) -> tuple[Snapshot, Changes | None]:
+        """Returns the snapshot and, if there was a previous one, what changed since.
+
+        Objects of a type that could not be listed are carried over, as far as we know they are
+        still there; objects in namespaces that no longer exist are not.
+        """
+        namespaces = set(namespaces)
+        with self._lock:
+            types = {t: dict(objects) for t, objects in self._types.items()}
+            listed = set(self._listed)
+        if self.previous is None:
+            return Snapshot(self.name, types), None
+
+        changes = Changes(self.previous.name)
+        for resource_type, objects in self.previous.types.items():
+            current = types.setdefault(resource_type, {})
+            for key, entry in objects.items():
+                if key in current:
+                    continue
+                namespace = key.split("/", 1)[0] if "/" in key else None
+                if ((resource_type, None) in listed or (resource_type, namespace) in listed
+                        or (namespace is not None and namespace not in namespaces)):
+                    changes.deleted.append(f"{resource_type} {key}")
+                else:
+                    current[key] = entry
+        for resource_type, objects in types.items():
+            before = self.previous.types.get(resource_type, {})
+            for key, (version, _) in objects.items():
+                if key not in before:
+                    changes.added.append(f"{resource_type} {key}")
+                elif before[key][0] != version:
+                    changes.modified.append(f"{resource_type} {key}")
+                else:
+                    changes.unchanged += 1
+        types = {t: objects for t, objects in types.items() if objects}
+        return Snapshot(self.name, types, base=self.previous.name), changes
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import concurrent.futures
+import contextvars
+import dataclasses
+import hashlib
+import sys
+import time
+from typing import TYPE_CHECKING
+
+from rhoai_in_kind import gha_log_group
+from rhoai_in_kind.checkpoint import fingerprint
+from rhoai_in_kind.tracing import span
+
+if TYPE_CHECKING:
+    import pathlib
+    from typing import Any, Callable, Iterable
+
+    from rhoai_in_kind.checkpoint import Checkpoints
+
+
+@dataclasses.dataclass
+class Step:
+    """A named unit of deploy work that may start once every step in `needs` has finished."""
+    name: str
+    fn: Callable[[], Any]
+    needs: tuple[str, ...] = ()
+    # disabled steps still take part in the graph (dependents wait on them), they just do nothing
+    enabled: bool = True
+    # what the step's outcome depends on besides its code: manifest paths, versions, branches
+    inputs: tuple[str | pathlib.Path, ...] = ()
+    # tells whether what the step set up is still in place on the cluster, for resuming
+    check: Callable[[], bool] | None = None
+    fingerprint: str | None = None
+    resumed: bool = False
+    started: float | None = None
+    finished: float | None = None
+
+    @property
+    def duration(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+        return self.finished - self.started
+
+
+class Plan:
+    """Dependency graph of deploy steps.
+
+    Steps are declared with the `step` decorator, in the order they would run sequentially,
+
+        plan = Plan()
+
+        @plan.step("Install ArgoCD")
+        def install_argocd():
+            ...
+
+        @plan.step("Configure Argo applications", needs=["Install ArgoCD"])
+        def configure_argo_applications():
+            ...
+
+        plan.run(jobs=4)
+
+    and `run` then starts every step whose dependencies are done, up to `jobs` at a time.
+    With `jobs=1` the steps run one at a time, each in its own log group.
+
+    Given `Checkpoints`, `run` records every step that finishes. With `resume=True` it then
+    skips the steps that finished before with the same fingerprint (see `checkpoint.fingerprint`)
+    and whose `check`, if they have one, says that their work is still in place.
+    """
+
+    def __init__(self):
+        self.steps: dict[str, Step] = {}
+
+    def step(self, name: str, needs: Iterable[str] = (), enabled: bool = True,
+             inputs: Iterable[str | pathlib.Path] = (), check: Callable[[], bool] | None = None):
+        def decorator[F: Callable[[], Any]](fn: F) -> F:
+            if name in self.steps:
+                raise ValueError(f"Step '{name}' is declared twice")
+            self.steps[name] = Step(name=name, fn=fn, needs=tuple(needs), enabled=enabled,
+                                    inputs=tuple(inputs), check=check)
+            return fn
+
+        return decorator
+
+    def topological_order(self) -> list[Step]:
+        """Returns the steps so that every step comes after its dependencies, ties broken by declaration order."""
+        for step in self.steps.values():
+            for need in step.needs:
+                if need not in self.steps:
+                    raise ValueError(f"Step '{step.name}' needs unknown step '{need}'")
+
+        order: list[Step] = []
+        placed: set[str] = set()
+        remaining = list(self.steps.values())
+        while remaining:
+            ready = [s for s in remaining if all(n in placed for n in s.needs)]
+            if not ready:
+                raise ValueError(f"Dependency cycle among steps: {', '.join(s.name for s in remaining)}")
+            for s in ready:
+                order.append(s)
+                placed.add(s.name)
+            remaining = [s for s in remaining if s.name not in placed]
+        return order
+
+    def run(self, jobs: int = 1, checkpoints: Checkpoints | None = None, resume: bool = False):
+        """Runs all steps, at most `jobs` concurrently.
+
+        After the first failure no further steps are started; the ones already running are
+        allowed to finish and then the first exception is re-raised.
+        """
+        if jobs < 1:
+            raise ValueError(f"jobs must be at least 1, got {jobs}")
+        if resume and checkpoints is None:
+            raise ValueError("resuming needs checkpoints")
+
+        # validates the graph before anything starts
+        self.fingerprint()
+        pending = list(self.steps.values())
+        done: set[str] = set()
+        running: dict[concurrent.futures.Future, Step] = {}
+        failure: BaseException | None = None
+        start = time.monotonic()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="step") as pool:
+            while True:
+                if failure is None:
+                    ready = [s for s in pending if all(n in done for n in s.needs)]
+                    for step in ready:
+                        pending.remove(step)
+                        future = pool.submit(contextvars.copy_context().run, self._run_step, step, jobs,
+                                             checkpoints if resume else None)
+                        running[future] = step
+                if not running:
+                    break
+                finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    try:
+                        future.result()
+                    except BaseException as e:
+                        print(f"Step '{step.name}' failed after {step.duration:.1f}s: {e!r}", file=sys.stderr)
+                        if failure is None:
+                            failure = e
+                    else:
+                        done.add(step.name)
+                        if checkpoints is not None and step.enabled and not step.resumed:
+                            checkpoints.record(step.name, step.fingerprint)
+
+        self.print_summary(wall_time=time.monotonic() - start)
+        if failure is not None:
+            raise failure
+
+    def fingerprint(self) -> str:
+        """Fingerprints every step and returns a fingerprint of them all, i.e. of what the whole plan sets up."""
+        digest = hashlib.sha256()
+        for step in self.topological_order():
+            step.fingerprint = fingerprint(step.fn, step.inputs, [self.steps[n].fingerprint for n in step.needs])
+            digest.update(f"{step.name}\0{step.fingerprint}\0".encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _resumable(step: Step, checkpoints: Checkpoints | None) -> bool:
+        if checkpoints is None or not checkpoints.completed(step.name, step.fingerprint):
+            return False
+        if step.check is not None and not step.check():
+            print(f"Step '{step.name}' completed before, but its check no longer passes; running it again")
+            return False
+        return True
+
+    @classmethod
+    def _run_step(cls, step: Step, jobs: int, checkpoints: Checkpoints | None = None):
+        step.started = time.monotonic()
+        try:
+            if not step.enabled:
+                print(f"Skipping disabled step '{step.name}'")
+            elif cls._resumable(step, checkpoints):
+                step.resumed = True
+                print(f"Skipping step '{step.name}', it completed before with the same inputs")
+            elif jobs == 1:
+                with span(step.name, "step"), gha_log_group(step.name, trace=False):
+                    step.fn()
+            else:
+                # log groups cannot interleave, so concurrent steps only mark where they start and end
+                print(f">>> {step.name}")
+                sys.stdout.flush()
+                with span(step.name, "step"):
+                    step.fn()
+        finally:
+            step.finished = time.monotonic()
+            if step.enabled and not step.resumed and jobs > 1:
+                print(f"<<< {step.name} ({step.duration:.1f}s)")
+                sys.stdout.flush()
+
+    def critical_path(self) -> list[Step]:
+        """Returns the chain of steps that determined the total run time.
+
+        Walks back from the step that finished last, each time to the dependency that finished
+        last, i.e. the one the step was actually waiting for.
+        """
+        ran = [s for s in self.steps.values() if s.finished is not None]
+        if not ran:
+            return []
+        step = max(ran, key=lambda s: s.finished)
+        path = [step]
+        while True:
+            needs = [self.steps[n] for n in step.needs if self.steps[n].finished is not None]
+            if not needs:
+                break
+            step = max(needs, key=lambda s: s.finished)
+            path.append(step)
+        return path[::-1]
+
+    def print_summary(self, wall_time: float):
+        path = self.critical_path()
+        print(f"\nCritical path ({sum(s.duration for s in path):.1f}s of {wall_time:.1f}s wall time):")
+        for step in path:
+            print(f"  {step.duration:8.1f}s  {step.name}")
+        sys.stdout.flush()
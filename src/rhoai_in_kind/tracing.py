@@ -0,0 +1,147 @@
+"""Records how long log groups, shell commands, deploy steps and deferred functions take.
+
+Every `span` is recorded in the process-wide `tracer`, with its parent being the span that was
+open in the same context when it started,
+
+    with span("Install Istio", "step"):
+        sh("istioctl install ...")  # records an "sh" span inside the "step" span
+
+and at the end `tracer.write_chrome_trace(path)` saves them in the Chrome trace event format
+(open in https://ui.perfetto.dev or chrome://tracing), and `tracer.print_summary()` prints the
+slowest ones. Threads started through `contextvars.copy_context().run` keep the parent of the
+code that started them, and so do asyncio tasks, which copy the context themselves.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import dataclasses
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Any, Iterator
+
+
+def _lane() -> str:
+    """The thread a span runs in, or its asyncio task; concurrent tasks of one thread get rows of their own."""
+    name = threading.current_thread().name
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        return name
+    return f"{name} {task.get_name()}" if task else name
+
+
+@dataclasses.dataclass
+class Span:
+    id: int
+    name: str
+    category: str
+    parent: int | None
+    thread: str
+    start_ns: int
+    end_ns: int | None = None
+    # the exit code of a command; 0 for anything else that finished, 1 if it raised
+    exit_code: int | None = None
+    error: str | None = None
+
+    @property
+    def duration(self) -> float:
+        if self.end_ns is None:
+            return 0.0
+        return (self.end_ns - self.start_ns) / 1e9
+
+
+class Tracer:
+    def __init__(self):
+        self.spans: list[Span] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._current: contextvars.ContextVar[Span | None] = contextvars.ContextVar("current_span", default=None)
+        self._origin_ns = time.perf_counter_ns()
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str) -> Iterator[Span]:
+        parent = self._current.get()
+        s = Span(id=next(self._ids), name=name, category=category, parent=parent.id if parent else None,
+                 thread=_lane(), start_ns=time.perf_counter_ns())
+        with self._lock:
+            self.spans.append(s)
+        token = self._current.set(s)
+        try:
+            yield s
+        except BaseException as e:
+            if isinstance(e, subprocess.CalledProcessError):
+                s.exit_code = e.returncode
+            elif s.exit_code is None:
+                s.exit_code = 1
+            s.error = repr(e)
+            raise
+        else:
+            if s.exit_code is None:
+                s.exit_code = 0
+        finally:
+            s.end_ns = time.perf_counter_ns()
+            self._current.reset(token)
+
+    def chrome_trace(self) -> dict[str, Any]:
+        """The spans as "complete" (`X`) trace events, one row per thread."""
+        threads: dict[str, int] = {}
+        events = []
+        for s in self.spans:
+            tid = threads.setdefault(s.thread, len(threads) + 1)
+            end_ns = s.end_ns if s.end_ns is not None else time.perf_counter_ns()
+            args: dict[str, Any] = {"id": s.id, "parent": s.parent, "exit_code": s.exit_code}
+            if s.error:
+                args["error"] = s.error
+            events.append({
+                "name": s.name, "cat": s.category, "ph": "X", "pid": os.getpid(), "tid": tid,
+                "ts": (s.start_ns - self._origin_ns) / 1000, "dur": (end_ns - s.start_ns) / 1000,
+                "args": args,
+            })
+        for name, tid in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str):
+        with self._lock:
+            trace = self.chrome_trace()
+        with open(path, "w") as f:
+            json.dump(trace, f)
+        print(f"Wrote {len(self.spans)} timing spans to {path}")
+        sys.stdout.flush()
+
+    def print_summary(self, count: int = 15):
+        """Prints the slowest spans of each category."""
+        with self._lock:
+            spans = [s for s in self.spans if s.end_ns is not None]
+        for category in sorted({s.category for s in spans}):
+            in_category = sorted((s for s in spans if s.category == category), key=lambda s: s.duration, reverse=True)
+            print(f"\nSlowest {category} spans ({min(count, len(in_category))} of {len(in_category)}, "
+                  f"{sum(s.duration for s in in_category):.1f}s in total):")
+            for s in in_category[:count]:
+                status = "" if s.exit_code == 0 else f"  [exit {s.exit_code}]"
+                print(f"  {s.duration:8.1f}s  {_shorten(s.name)}{status}")
+        sys.stdout.flush()
+
+
+def _shorten(text: str, width: int = 100) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+tracer = Tracer()
+
+
+def span(name: str, category: str) -> contextlib.AbstractContextManager[Span]:
+    """Records a span in the process-wide `tracer`."""
+    return tracer.span(name, category)
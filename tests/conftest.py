@@ -0,0 +1,67 @@
+"""Fixtures that run the benchmarks' fake API server (benchmarks/fakecluster.py) in-process.
+
+`fake_api` serves a small synthetic cluster for the whole session; `kubectl` puts the kubectl
+stand-in (benchmarks/fake_kubectl.py) first on PATH, so that `KubeClient.from_kubeconfig` reads
+the kubeconfig of a state directory, by default the fake API server's.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import os
+import pathlib
+import sys
+import threading
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(ROOT / "benchmarks"))
+
+from fakecluster import ClusterShape, FakeCluster, Faults, serve
+from rhoai_in_kind.kube import KubeClient
+
+SHAPE = ClusterShape(namespaces=3, namespaced_types=6, cluster_types=3, objects=7, object_bytes=256, pods=2,
+                     containers=2, log_bytes=1000)
+
+
+@dataclasses.dataclass
+class FakeApi:
+    state_dir: pathlib.Path
+    cluster: FakeCluster
+
+    @property
+    def kubeconfig(self) -> dict:
+        return json.loads((self.state_dir / "kubeconfig.json").read_text())
+
+
+@pytest.fixture(scope="session")
+def fake_api(tmp_path_factory) -> FakeApi:
+    state_dir = tmp_path_factory.mktemp("fakecluster")
+    server = serve(SHAPE, Faults(latency=0.0), state_dir)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield FakeApi(state_dir, server.RequestHandlerClass.cluster)
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def kubectl(fake_api, tmp_path, monkeypatch) -> pathlib.Path:
+    """Installs the kubectl stand-in; returns the state directory whose kubeconfig.json it prints."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    script = bin_dir / "kubectl"
+    script.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{ROOT / "benchmarks" / "fake_kubectl.py"}" "$@"\n')
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    monkeypatch.setenv("BENCH_STATE_DIR", str(fake_api.state_dir))
+    return fake_api.state_dir
+
+
+@pytest.fixture
+def client(kubectl) -> KubeClient:
+    with KubeClient.from_kubeconfig() as client:
+        yield client
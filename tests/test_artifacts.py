@@ -0,0 +1,63 @@
+import functools
+import hashlib
+import http.server
+import threading
+
+import pytest
+
+from rhoai_in_kind.artifacts import Artifact, ArtifactCache, CacheMiss, catalogue
+
+CONTENT = b"release artifact\n"
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def releases(tmp_path):
+    """Serves a release directory with an artifact, its checksum file and a checksum file that does not match."""
+    root = tmp_path / "releases"
+    root.mkdir()
+    (root / "tool.tar.gz").write_bytes(CONTENT)
+    (root / "tool.tar.gz.sha256").write_text(f"{DIGEST}  tool.tar.gz\n")
+    (root / "wrong.sha256").write_text(f"{'0' * 64}  tool.tar.gz\n")
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=str(root))
+    handler.log_message = lambda *args: None
+    server = http.server.ThreadingHTTPServer(("localhost", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://localhost:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_pinned_digest_is_verified(releases, tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", offline=False, retries=1)
+
+    assert cache.fetch(Artifact("tool", f"{releases}/tool.tar.gz", sha256=DIGEST)).read_bytes() == CONTENT
+    with pytest.raises(ValueError, match="expected"):
+        cache.fetch(Artifact("tool", f"{releases}/tool.tar.gz?other", sha256="0" * 64))
+
+
+def test_published_checksum_is_verified(releases, tmp_path):
+    cache = ArtifactCache(tmp_path / "cache", offline=False, retries=1)
+
+    path = cache.fetch(Artifact("tool", f"{releases}/tool.tar.gz", sha256_url=f"{releases}/tool.tar.gz.sha256"))
+    assert path.read_bytes() == CONTENT
+    with pytest.raises(ValueError, match="expected"):
+        cache.fetch(Artifact("tool", f"{releases}/tool.tar.gz?other", sha256_url=f"{releases}/wrong.sha256"))
+
+
+def test_offline_cache_serves_what_was_downloaded(releases, tmp_path):
+    artifact = Artifact("tool", f"{releases}/tool.tar.gz", sha256=DIGEST)
+    ArtifactCache(tmp_path / "cache", offline=False, retries=1).fetch(artifact)
+    offline = ArtifactCache(tmp_path / "cache", offline=True)
+
+    assert offline.fetch(artifact).read_bytes() == CONTENT
+    with pytest.raises(CacheMiss):
+        offline.fetch(Artifact("other", f"{releases}/other.tar.gz"))
+
+
+def test_only_moving_artifacts_are_left_to_trust_on_first_use():
+    for system, machine in (("Linux", "x86_64"), ("Darwin", "arm64")):
+        for artifact in catalogue(machine, system).values():
+            if artifact.name == "istio":
+                assert artifact.sha256_url == f"{artifact.url}.sha256"
+            assert artifact.moving == (artifact.name == "oc")
@@ -0,0 +1,38 @@
+import dataclasses
+import json
+
+from rhoai_in_kind.discovery import DiscoveryCache, discover
+
+DOCUMENT = {"kind": "APIGroupDiscoveryList", "items": []}
+
+
+@dataclasses.dataclass
+class NoETagServer:
+    """Serves a discovery document without an ETag, counting the requests."""
+    host: str = "localhost"
+    port: int = 6443
+    base_path: str = ""
+    requests: int = 0
+
+    def get_if_changed(self, path, etag, accept):
+        self.requests += 1
+        return DOCUMENT, None
+
+
+def test_document_without_etag_is_reused_within_ttl(tmp_path):
+    server = NoETagServer()
+
+    for _ in range(3):
+        assert DiscoveryCache(tmp_path, ttl=60).document(server, "/apis") == DOCUMENT
+    assert server.requests == 1
+
+    DiscoveryCache(tmp_path, ttl=0).document(server, "/apis")
+    assert server.requests == 2
+
+
+def test_discover_revalidates_with_the_etag(client, tmp_path):
+    first = discover(client, DiscoveryCache(tmp_path), verb="list")
+
+    assert all(json.loads(file.read_text())["etag"] for file in tmp_path.glob("*.json"))
+    assert discover(client, DiscoveryCache(tmp_path), verb="list") == first
+    assert {("apps", "deployments"), ("", "configmaps")} <= {(r.group, r.resource) for r in first}
@@ -0,0 +1,150 @@
+import pytest
+
+from rhoai_in_kind.images import (
+    ArgoSource,
+    FakeLoader,
+    ImagePrefetcher,
+    argo_sources,
+    image_references,
+    object_images,
+    plan_images,
+)
+
+MANIFESTS = """\
+apiVersion: apps/v1
+kind: Deployment
+metadata:
+  name: controller
+spec:
+  template:
+    spec:
+      initContainers:
+      - name: init
+        image: quay.io/example/init:1.0
+      containers:
+      - name: manager
+        image: "quay.io/example/controller:v2"
+        env:
+        - name: RELATED_IMAGE
+          value: quay.io/example/not-an-image-field:1
+      - name: sidecar
+        image: $(SIDECAR_IMAGE)
+      - name: proxy
+        image: quay.io/example/init:1.0
+---
+# a comment, then a script whose lines look like fields
+apiVersion: v1
+kind: ConfigMap
+metadata:
+  name: script
+data:
+  run.sh: |
+    image: quay.io/example/from-a-script:1
+---
+apiVersion: image.openshift.io/v1
+kind: ImageStream
+metadata:
+  name: notebook
+spec:
+  tags:
+  - name: "2025.1"
+    from:
+      kind: DockerImage
+      name: quay.io/example/notebook@sha256:0123456789abcdef0123456789abcdef0123456789abcdef0123456789abcdef
+"""
+
+APPLICATION = """\
+apiVersion: argoproj.io/v1alpha1
+kind: Application
+metadata:
+  name: dashboard
+spec:
+  source:
+    repoURL: https://github.com/example/dashboard
+    path: manifests/overlays/kind
+    targetRevision: main
+    kustomize:
+      images:
+      - quay.io/example/dashboard=quay.io/example/dashboard:pr-1
+      - quay.io/example/oauth-proxy:latest
+"""
+
+
+def test_image_references():
+    assert image_references(MANIFESTS) == [
+        "quay.io/example/init:1.0",
+        "quay.io/example/controller:v2",
+        "quay.io/example/notebook@sha256:0123456789abcdef0123456789abcdef0123456789abcdef0123456789abcdef",
+    ]
+
+
+def test_object_images_finds_the_same_images_in_parsed_objects():
+    deployment = {"spec": {"template": {"spec": {"containers": [
+        {"name": "a", "image": "quay.io/example/a:1"},
+        {"name": "b", "image": "quay.io/example/a:1"},
+        {"name": "c", "image": "{{ .Image }}"},
+    ]}}}}
+    imagestream = {"spec": {"tags": [{"from": {"kind": "DockerImage", "name": "quay.io/example/b:2"}}]}}
+
+    assert object_images([deployment, imagestream]) == ["quay.io/example/a:1", "quay.io/example/b:2"]
+
+
+def test_argo_sources_and_overrides():
+    [source] = argo_sources(APPLICATION)
+
+    assert source == ArgoSource("https://github.com/example/dashboard", "manifests/overlays/kind", "main", (
+        "quay.io/example/dashboard=quay.io/example/dashboard:pr-1",
+        "quay.io/example/oauth-proxy:latest",
+    ))
+    assert source.apply_overrides([
+        "quay.io/example/dashboard:main",
+        "quay.io/example/oauth-proxy@sha256:" + "a" * 64,
+        "quay.io/example/other:1",
+    ]) == [
+        "quay.io/example/dashboard:pr-1",
+        "quay.io/example/oauth-proxy:latest",
+        "quay.io/example/other:1",
+    ]
+
+
+def test_plan_images_deduplicates_across_sources(tmp_path):
+    first, second = tmp_path / "first.yaml", tmp_path / "second.yaml"
+    first.write_text(MANIFESTS)
+    second.write_text("kind: Pod\nspec:\n  containers:\n  - image: quay.io/example/init:1.0\n"
+                      "  - image: quay.io/example/new:1\n")
+    errors = []
+
+    def broken():
+        raise FileNotFoundError("not rendered")
+
+    images = list(plan_images([lambda: first, broken, lambda: second], on_error=errors.append))
+
+    assert images == image_references(MANIFESTS) + ["quay.io/example/new:1"]
+    assert [str(e) for e in errors] == ["not rendered"]
+
+
+def test_prefetcher_loads_each_image_once_and_at_most_jobs_at_a_time(tmp_path):
+    manifests = []
+    for n in range(4):
+        manifests.append(tmp_path / f"manifests-{n}.yaml")
+        manifests[-1].write_text("\n".join(f"  - image: quay.io/example/app-{(n + i) % 6}:1" for i in range(5)))
+    loader = FakeLoader(delay=0.02, failing=frozenset({"quay.io/example/app-3:1"}))
+
+    with ImagePrefetcher(loader, jobs=3).start([lambda path=path: path for path in manifests]) as prefetcher:
+        prefetcher.submit("quay.io/example/app-0:1")
+
+    assert sorted(loader.loaded) == [f"quay.io/example/app-{i}:1" for i in range(6) if i != 3]
+    assert loader.peak_concurrency <= 3
+    assert list(prefetcher.failures) == ["quay.io/example/app-3:1"]
+
+
+def test_prefetcher_cancels_pending_loads_on_error(tmp_path):
+    loader = FakeLoader(delay=0.05)
+
+    with pytest.raises(RuntimeError):
+        with ImagePrefetcher(loader, jobs=1) as prefetcher:
+            for i in range(20):
+                prefetcher.submit(f"quay.io/example/app-{i}:1")
+            raise RuntimeError("step failed")
+
+    assert len(loader.loaded) < 20
@@ -0,0 +1,144 @@
+import base64
+import json
+import ssl
+
+import pytest
+
+from conftest import SHAPE
+from rhoai_in_kind.kube import ApiError, KubeClient, ResponseTooLarge
+
+CONFIGMAPS = "/api/v1/namespaces/bench-0/configmaps"
+
+
+def test_list_pages_follows_continue(client):
+    pages = list(client.list_pages(CONFIGMAPS, limit=3))
+
+    assert [len(p["items"]) for p in pages] == [3, 3, 1]
+    names = [item["metadata"]["name"] for page in pages for item in page["items"]]
+    assert names == [f"configmap-{i}" for i in range(SHAPE.objects)]
+
+
+def test_list_pages_fills_in_kind_and_api_version(client):
+    items, resource_version = client.list(CONFIGMAPS)
+
+    assert len(items) == SHAPE.objects
+    assert all(item["kind"] == "ConfigMap" and item["apiVersion"] == "v1" for item in items)
+    assert resource_version
+
+
+def test_list_pages_halves_the_limit_of_pages_over_max_page_bytes(client):
+    one_object = len(json.dumps(client.get(f"{CONFIGMAPS}/configmap-0")))
+
+    pages = list(client.list_pages(CONFIGMAPS, max_page_bytes=3 * one_object))
+
+    # a page of more than three objects cannot fit
+    assert max(len(p["items"]) for p in pages) <= 3
+    names = [item["metadata"]["name"] for page in pages for item in page["items"]]
+    assert names == [f"configmap-{i}" for i in range(SHAPE.objects)]
+
+
+def test_list_pages_raises_if_one_object_is_over_max_page_bytes(client):
+    with pytest.raises(ResponseTooLarge):
+        list(client.list_pages(CONFIGMAPS, max_page_bytes=100))
+
+
+def test_metadata_only_lists(client):
+    from rhoai_in_kind.kube import METADATA_ONLY
+
+    items, _ = client.list(CONFIGMAPS, accept=METADATA_ONLY)
+
+    assert len(items) == SHAPE.objects
+    assert all(item["kind"] == "PartialObjectMetadata" and "data" not in item for item in items)
+
+
+def test_error_status_raises_api_error(client):
+    with pytest.raises(ApiError) as e:
+        client.get(f"{CONFIGMAPS}/missing")
+
+    assert e.value.status == 404
+    assert e.value.reason == "NotFound"
+
+
+@pytest.mark.parametrize("path, status", [
+    ("/apis/bench.example.com/v1/namespaces/bench-0/missings", 404),
+    ("/api/v1/namespaces/bench-0/bindings", 405),
+])
+def test_refused_watch_raises_api_error(client, path, status):
+    with pytest.raises(ApiError) as e:
+        next(client.watch(path, timeout_seconds=5))
+
+    assert e.value.status == status
+
+
+def test_resource_path_discovers_resources(client):
+    assert client.resource_path("apps/v1", "Deployment", "bench-1", "x") == \
+        "/apis/apps/v1/namespaces/bench-1/deployments/x"
+    assert client.resource_path("v1", "Namespace", name="bench-1") == "/api/v1/namespaces/bench-1"
+    with pytest.raises(LookupError):
+        client.resource_path("apps/v1", "Missing")
+
+
+def _kubeconfig(kubectl, tmp_path, monkeypatch, cluster: dict | None = None, user: dict | None = None,
+                namespace: str | None = None) -> KubeClient:
+    """A client for the fake API server from a kubeconfig with `cluster` and `user` changed."""
+    config = json.loads((kubectl / "kubeconfig.json").read_text())
+    config["clusters"][0]["cluster"].update(cluster or {})
+    if user is not None:
+        config["users"][0]["user"] = user
+    if namespace is not None:
+        config["contexts"][0]["context"]["namespace"] = namespace
+    state_dir = tmp_path / "state"
+    state_dir.mkdir()
+    (state_dir / "kubeconfig.json").write_text(json.dumps(config))
+    monkeypatch.setenv("BENCH_STATE_DIR", str(state_dir))
+    return KubeClient.from_kubeconfig()
+
+
+def test_kubeconfig_token_and_namespace(client):
+    assert client.token == "bench"
+    assert client.namespace == "default"
+    assert client.ssl_context.verify_mode == ssl.CERT_REQUIRED
+    client.get("/api/v1/namespaces/bench-0")
+
+
+def test_kubeconfig_token_file(kubectl, tmp_path, monkeypatch):
+    token_file = tmp_path / "token"
+    token_file.write_text("from-file\n")
+
+    client = _kubeconfig(kubectl, tmp_path, monkeypatch, user={"tokenFile": str(token_file)}, namespace="bench-2")
+
+    assert client.token == "from-file"
+    assert client.namespace == "bench-2"
+
+
+def test_kubeconfig_token_takes_precedence_over_token_file(kubectl, tmp_path, monkeypatch):
+    client = _kubeconfig(kubectl, tmp_path, monkeypatch, user={"token": "inline", "tokenFile": "/nonexistent"})
+
+    assert client.token == "inline"
+
+
+def test_kubeconfig_insecure_skip_tls_verify(kubectl, tmp_path, monkeypatch):
+    client = _kubeconfig(kubectl, tmp_path, monkeypatch, cluster={"insecure-skip-tls-verify": True,
+                                                                  "certificate-authority-data": None})
+
+    assert client.ssl_context.verify_mode == ssl.CERT_NONE
+    client.get("/api/v1/namespaces/bench-0")
+
+
+def test_kubeconfig_with_another_ca_fails_verification(fake_api, kubectl, tmp_path, monkeypatch):
+    from rhoai_in_kind.pki import generate_ca
+
+    other_ca = base64.b64encode(generate_ca("another CA").cert_pem.encode()).decode()
+    client = _kubeconfig(kubectl, tmp_path, monkeypatch, cluster={"certificate-authority-data": other_ca})
+
+    with pytest.raises(ssl.SSLCertVerificationError):
+        client.get("/api/v1/namespaces/bench-0")
+
+
+@pytest.mark.parametrize("user", [
+    {"exec": {"command": "aws", "apiVersion": "client.authentication.k8s.io/v1"}},
+    {"auth-provider": {"name": "oidc"}},
+])
+def test_kubeconfig_rejects_exec_and_auth_provider(kubectl, tmp_path, monkeypatch, user):
+    with pytest.raises(ValueError):
+        _kubeconfig(kubectl, tmp_path, monkeypatch, user=user)
@@ -0,0 +1,19 @@
+from rhoai_in_kind.pki import CertificateCache
+
+NAMES = ["*.apps.127.0.0.1.sslip.io"]
+
+
+def test_certificate_cache_reuses_what_it_generated(tmp_path):
+    first = CertificateCache(tmp_path)
+    ca = first.ca("Test CA")
+    leaf = first.leaf(ca, NAMES)
+    assert first.generated == {"ca", "tls"}
+
+    again = CertificateCache(tmp_path)
+    assert again.ca("Test CA") == ca
+    assert again.leaf(ca, NAMES) == leaf
+    assert not again.generated
+
+    other_names = CertificateCache(tmp_path)
+    assert other_names.leaf(other_names.ca("Test CA"), ["example.com"]) != leaf
+    assert other_names.generated == {"tls"}
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+import pytest
+
+from rhoai_in_kind.readiness import ReadinessEngine, deployment_available
+
+# the tests that change Deployments each use a namespace of their own
+NAMESPACE = "bench-2"
+
+
+def test_wait_follows_the_watch(fake_api, client):
+    fake_api.cluster.schedule_ready(NAMESPACE, 0.5)
+    with ReadinessEngine(client) as readiness:
+        assert not readiness.is_ready(deployment_available(NAMESPACE), timeout=0.1)
+
+        start = time.monotonic()
+        readiness.wait(deployment_available(NAMESPACE), timeout=10)
+
+    assert time.monotonic() - start < 5
+
+
+def test_async_wait_follows_the_watch(fake_api, client):
+    fake_api.cluster.schedule_ready("bench-1", 0.5)
+
+    async def wait(readiness: ReadinessEngine):
+        await asyncio.gather(*(readiness.async_wait(deployment_available("bench-1", f"deployment-{i}"), timeout=10)
+                               for i in range(3)))
+
+    with ReadinessEngine(client) as readiness:
+        asyncio.run(wait(readiness))
+
+
+def test_wait_times_out_naming_the_waiters_not_ready(client):
+    with ReadinessEngine(client) as readiness:
+        with pytest.raises(TimeoutError, match="deployment missing in bench-0"):
+            readiness.wait(deployment_available("bench-0"), deployment_available("bench-0", "missing"), timeout=1)
+
+
+def test_timed_out_waiters_are_unregistered(client):
+    with ReadinessEngine(client) as readiness:
+        assert not readiness.is_ready(deployment_available("bench-0", "missing"), timeout=0.5)
+        with pytest.raises(TimeoutError):
+            asyncio.run(readiness.async_wait(deployment_available("bench-0", "missing"), timeout=0.5))
+        assert readiness.is_ready(deployment_available("bench-0"))
+
+        assert not any(readiness._waiters.values())
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from rhoai_in_kind.artifacts import CacheMiss
+from rhoai_in_kind.render import RenderCache, remote_git_ref
+
+KUSTOMIZATION = """\
+resources:
+  # pinned by the release tag
+  - https://github.com/example/tool/releases/download/v1.0.0/install.yaml
+  - https://raw.githubusercontent.com/example/api/refs/heads/master/crd.yaml
+  - manifests.yaml
+"""
+
+
+@pytest.mark.parametrize("url, git_ref", [
+    ("https://raw.githubusercontent.com/openshift/api/refs/heads/master/operator/v1/crd.yaml",
+     ("https://github.com/openshift/api", "refs/heads/master")),
+    ("https://raw.githubusercontent.com/argoproj/argo-cd/v3.0.6/manifests/install.yaml",
+     ("https://github.com/argoproj/argo-cd", "v3.0.6")),
+    ("https://github.com/opendatahub-io/kubeflow//components/notebook-controller/config?ref=v1.10.0-5&submodules=false",
+     ("https://github.com/opendatahub-io/kubeflow", "v1.10.0-5")),
+    ("github.com/example/repo/manifests", ("https://github.com/example/repo", "HEAD")),
+    ("https://github.com/kyverno/kyverno/releases/download/v1.14.4/install.yaml", None),
+    ("https://example.com/install.yaml", None),
+])
+def test_remote_git_ref(url, git_ref):
+    assert remote_git_ref(url) == git_ref
+
+
+@pytest.fixture
+def git(kubectl, tmp_path, monkeypatch):
+    """A `git ls-remote` that answers with the commit in $FAKE_GIT_COMMIT for every ref."""
+    script = tmp_path / "bin" / "git"
+    script.write_text('#!/bin/sh\nshift 2\nprintf "%s\\t%s\\n" "$FAKE_GIT_COMMIT" "$1"\n')
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{script.parent}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv("FAKE_GIT_COMMIT", "a" * 40)
+    return monkeypatch
+
+
+def renders_in_kubectl_log(state_dir) -> int:
+    log = state_dir / "kubectl.log"
+    return sum(line.startswith("kustomize") for line in log.read_text().splitlines()) if log.exists() else 0
+
+
+def test_local_render_is_keyed_by_the_commits_of_its_remotes(kubectl, git, tmp_path):
+    directory = tmp_path / "component"
+    directory.mkdir()
+    (directory / "kustomization.yaml").write_text(KUSTOMIZATION)
+    before = renders_in_kubectl_log(kubectl)
+
+    first = RenderCache(tmp_path / "renders", offline=False).local(directory)
+    again = RenderCache(tmp_path / "renders", offline=False).local(directory)
+    git.setenv("FAKE_GIT_COMMIT", "b" * 40)
+    moved = RenderCache(tmp_path / "renders", offline=False).local(directory)
+
+    assert first == again != moved
+    assert renders_in_kubectl_log(kubectl) - before == 2
+    # offline, the branch is taken to be where it last was
+    assert RenderCache(tmp_path / "renders", offline=True).local(directory) == moved
+
+
+def test_local_render_with_an_unresolvable_remote_is_not_reused(kubectl, git, tmp_path):
+    directory = tmp_path / "component"
+    directory.mkdir()
+    (directory / "kustomization.yaml").write_text("resources:\n  - https://example.com/install.yaml\n")
+    before = renders_in_kubectl_log(kubectl)
+
+    renders = RenderCache(tmp_path / "renders", offline=False)
+    renders.local(directory)
+    renders.local(directory)
+    RenderCache(tmp_path / "renders", offline=False).local(directory)
+
+    # once per cache, not once ever
+    assert renders_in_kubectl_log(kubectl) - before == 2
+
+
+def test_offline_render_of_a_never_resolved_branch_is_a_cache_miss(kubectl, tmp_path):
+    directory = tmp_path / "component"
+    directory.mkdir()
+    (directory / "kustomization.yaml").write_text(KUSTOMIZATION)
+
+    with pytest.raises(CacheMiss):
+        RenderCache(tmp_path / "renders", offline=True).local(directory)
@@ -0,0 +1,32 @@
+import contextlib
+import os
+
+from rhoai_in_kind import shell
+
+
+@contextlib.contextmanager
+def stdout_to(path):
+    """Redirects file descriptor 1, as bench.py's quiet mode does."""
+    saved = os.dup(1)
+    with open(path, "w") as f:
+        os.dup2(f.fileno(), 1)
+    try:
+        yield
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def test_worker_output_follows_a_redirected_stdout(tmp_path):
+    shell.prestart(2)
+
+    with stdout_to(tmp_path / "redirected"):
+        shell.run("echo redirected")
+        assert shell.run("echo captured", capture_output=True).stdout == "captured\n"
+    with stdout_to(tmp_path / "again"):
+        shell.run("echo again")
+
+    assert (tmp_path / "redirected").read_text() == "redirected\n"
+    assert (tmp_path / "again").read_text() == "again\n"
+    # the workers of the earlier outputs were replaced rather than kept
+    assert len(shell._pool._all) <= 2